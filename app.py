@@ -1,19 +1,41 @@
-from flask import Flask, render_template, redirect, url_for, flash, request
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, Response, render_template, redirect, url_for, flash, request, jsonify, abort, make_response
+from markupsafe import Markup
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
+import hmac
 import json
+import logging
 import os
 import time
 from datetime import datetime
-from models import db, User, Provider, ProviderSkill, ServicePost, Finder
+from models import db, User, Provider, ProviderSkill, ServicePost, Finder, FinderFavorite
 from forms import RegisterForm, LoginForm, ProviderProfileForm, SkillForm, PostForm, FinderProfileForm
-import os
+from skill_index import skill_index, post_text, score_skills, boost_score
+import match_store
+from llm_cache import create_cache, payload_key
+from rank_worker import RankWorker, PENDING, FAILED
+from candidates import shortlist_providers, fit_lines, prompt_char_budget
+from ranking import parse_ranked_ids, merge_ranked, top_k
+import bm25_index
+from embeddings import embedding_index, available as embedding_index_available
+import geo
+import db_config
+from migrations import migrate
+import provider_attrs
+import search
+import images
+import storage
+from user_cache import user_cache, shared_backend as user_cache_backend
+import http_cache
+from fragment_cache import fragment_cache
+import template_cache
+import telemetry
+from model_client import ModelClient, ModelUnavailable, HttpModel
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'change_this_secret'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///servease.db'
+# Database URI, pool settings and SQLite PRAGMAs come from the environment (see db_config.py)
+db_config.configure(app)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # File upload configuration
@@ -21,20 +43,35 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'static', 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
-# Create upload folders if they don't exist
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'profiles'), exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'covers'), exist_ok=True)
-os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'portfolio'), exist_ok=True)
+# Uploads are stored by content hash: 'local' (under static/) or 's3' (any S3-compatible endpoint, e.g. MinIO).
+# Blobs nothing references are deleted after UPLOAD_GC_GRACE seconds by gc_uploads.py (and at start-up).
+app.config['STORAGE_BACKEND'] = os.getenv('STORAGE_BACKEND', 'local')
+app.config['S3_BUCKET'] = os.getenv('S3_BUCKET')
+app.config['S3_ENDPOINT_URL'] = os.getenv('S3_ENDPOINT_URL')
+app.config['S3_PUBLIC_URL'] = os.getenv('S3_PUBLIC_URL')
+app.config['UPLOAD_GC_GRACE'] = int(os.getenv('UPLOAD_GC_GRACE', str(storage.GC_GRACE_SECONDS)))
+storage.upload_store.configure(storage.create_backend(
+    app.config['STORAGE_BACKEND'], app.static_folder, bucket=app.config['S3_BUCKET'],
+    endpoint_url=app.config['S3_ENDPOINT_URL'], public_url=app.config['S3_PUBLIC_URL']))
+
+# Resized WebP/JPEG variants of uploads, built in the background (needs Pillow; IMAGE_WORKERS=0 builds inline)
+app.config['IMAGE_WORKERS'] = int(os.getenv('IMAGE_WORKERS', '2'))
+app.config['IMAGE_FORMAT'] = os.getenv('IMAGE_FORMAT', 'webp')
+images.image_pipeline.configure(app, app.config['IMAGE_WORKERS'], app.config['IMAGE_FORMAT'])
+if not images.available():
+    print("Image variants and EXIF stripping need Pillow (requirements-optional.txt); serving originals as uploaded")
+app.add_template_global(images.image_url)
+app.add_template_global(images.image_srcset)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def save_image(file, folder):
+def save_image(file):
+    """Store an upload by content hash; returns its path, which the caller assigns to a row."""
     if file and allowed_file(file.filename):
-        filename = secure_filename(f"{current_user.id}_{int(time.time())}_{file.filename}")
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], folder, filename)
-        file.save(filepath)
-        return f'uploads/{folder}/{filename}'
+        path = storage.upload_store.save(file, clean=images.strip_metadata)
+        images.process_after_commit(path)
+        return path
     return None
 
 
@@ -87,60 +124,201 @@ def fromjson(s):
     except Exception:
         return {}
 
+# {% cache %} blocks keep rendered fragments in fragment_cache (see template_cache.py). Templates are compiled
+# at start-up through a bytecode cache on disk; TEMPLATE_BYTECODE_DIR='' keeps them in memory only.
+app.jinja_env.add_extension(template_cache.CacheExtension)
+app.config['TEMPLATE_BYTECODE_DIR'] = os.getenv('TEMPLATE_BYTECODE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+app.config['TEMPLATE_WARMUP'] = os.getenv('TEMPLATE_WARMUP', '1') == '1'
+app.jinja_env.bytecode_cache = template_cache.bytecode_cache(app.config['TEMPLATE_BYTECODE_DIR'])
+
 # Gemini API configuration
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')  # Set this as environment variable
-if GEMINI_API_KEY:
+# GEMINI_BASE_URL talks to a Gemini-compatible REST endpoint instead of the SDK (e.g. fake_model.py).
+# Calls get a deadline, an in-flight limit and a circuit breaker; while the model is failing,
+# matching uses the keyword ranking (see model_client.py).
+app.config['GEMINI_MODEL'] = os.getenv('GEMINI_MODEL', 'gemini-pro')
+app.config['GEMINI_BASE_URL'] = os.getenv('GEMINI_BASE_URL', '')
+app.config['GEMINI_TIMEOUT'] = float(os.getenv('GEMINI_TIMEOUT', '10'))
+app.config['GEMINI_MAX_IN_FLIGHT'] = int(os.getenv('GEMINI_MAX_IN_FLIGHT', '4'))
+app.config['GEMINI_SLOT_WAIT'] = float(os.getenv('GEMINI_SLOT_WAIT', '0.1'))  # then give up: ModelBusy
+app.config['GEMINI_RETRIES'] = int(os.getenv('GEMINI_RETRIES', '1'))
+app.config['GEMINI_BREAKER_FAILURES'] = int(os.getenv('GEMINI_BREAKER_FAILURES', '5'))
+app.config['GEMINI_BREAKER_RESET'] = float(os.getenv('GEMINI_BREAKER_RESET', '30'))
+call_options = {}
+if app.config['GEMINI_BASE_URL']:
+    raw_model = HttpModel(app.config['GEMINI_BASE_URL'], app.config['GEMINI_MODEL'], GEMINI_API_KEY,
+                          app.config['GEMINI_TIMEOUT'])
+elif GEMINI_API_KEY:
     import google.generativeai as genai
     genai.configure(api_key=GEMINI_API_KEY)
-    gemini_model = genai.GenerativeModel('gemini-pro')
+    raw_model = genai.GenerativeModel(app.config['GEMINI_MODEL'])
+    call_options = {'request_options': {'timeout': app.config['GEMINI_TIMEOUT']}}
 else:
-    gemini_model = None
+    raw_model = None
+gemini_model = raw_model and ModelClient(raw_model, timeout=app.config['GEMINI_TIMEOUT'],
+                                         max_in_flight=app.config['GEMINI_MAX_IN_FLIGHT'],
+                                         slot_wait=app.config['GEMINI_SLOT_WAIT'],
+                                         retries=app.config['GEMINI_RETRIES'],
+                                         failure_threshold=app.config['GEMINI_BREAKER_FAILURES'],
+                                         reset_timeout=app.config['GEMINI_BREAKER_RESET'],
+                                         call_options=call_options)
+
+# Cache of Gemini rankings keyed on the prompt payload ('memory' or 'sqlite')
+app.config['LLM_CACHE_BACKEND'] = os.getenv('LLM_CACHE_BACKEND', 'memory')
+app.config['LLM_CACHE_PATH'] = os.getenv('LLM_CACHE_PATH', os.path.join(app.instance_path, 'llm_cache.db'))
+app.config['LLM_CACHE_TTL'] = int(os.getenv('LLM_CACHE_TTL', '3600'))
+app.config['LLM_CACHE_MAX_ENTRIES'] = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '1000'))
+ranking_cache = create_cache(app.config['LLM_CACHE_BACKEND'],
+                             path=app.config['LLM_CACHE_PATH'],
+                             ttl=app.config['LLM_CACHE_TTL'],
+                             max_entries=app.config['LLM_CACHE_MAX_ENTRIES'])
+
+# Cache of the logged-in user's rows for load_user ('memory', 'sqlite' or 'redis' shared tier);
+# USER_CACHE_TTL=0 turns it off. Each worker keeps its copies at most USER_CACHE_LOCAL_TTL seconds,
+# since other workers' commits cannot reach them (raise it only with a single worker process).
+app.config['USER_CACHE_BACKEND'] = os.getenv('USER_CACHE_BACKEND', 'memory')
+app.config['USER_CACHE_URL'] = os.getenv('USER_CACHE_URL', os.path.join(app.instance_path, 'user_cache.db'))
+app.config['USER_CACHE_TTL'] = int(os.getenv('USER_CACHE_TTL', '300'))
+app.config['USER_CACHE_LOCAL_TTL'] = int(os.getenv('USER_CACHE_LOCAL_TTL', '5'))
+app.config['USER_CACHE_MAX_ENTRIES'] = int(os.getenv('USER_CACHE_MAX_ENTRIES', '1000'))
+user_cache.configure(app.config['USER_CACHE_TTL'], app.config['USER_CACHE_MAX_ENTRIES'],
+                     user_cache_backend(app.config['USER_CACHE_BACKEND'], app.config['USER_CACHE_URL'],
+                                        app.config['USER_CACHE_MAX_ENTRIES'] * 10),
+                     app.config['USER_CACHE_LOCAL_TTL'])
+
+# Rendered HTML fragments: public profile bodies and {% cache %} blocks, keyed by row timestamps.
+# FRAGMENT_CACHE_TTL=0 turns it off. Profile pages also send ETag/Last-Modified and content-hashed
+# uploads are cached as immutable (see http_cache.py).
+app.config['FRAGMENT_CACHE_TTL'] = int(os.getenv('FRAGMENT_CACHE_TTL', '600'))
+app.config['FRAGMENT_CACHE_MAX_ENTRIES'] = int(os.getenv('FRAGMENT_CACHE_MAX_ENTRIES', '5000'))
+fragment_cache.configure(app.config['FRAGMENT_CACHE_TTL'], app.config['FRAGMENT_CACHE_MAX_ENTRIES'])
+
+# In-memory provider indexes are per process: check this often (seconds) whether another
+# worker committed provider or skill changes and rebuild if so (0 = single process, never check)
+app.config['INDEX_CHECK_SECONDS'] = float(os.getenv('INDEX_CHECK_SECONDS', '5'))
+skill_index.configure(app.config['INDEX_CHECK_SECONDS'])
+bm25_index.bm25_index.configure(app.config['INDEX_CHECK_SECONDS'])
+
+# Local scorer for stored matches and shortlists: 'keyword' (substring), 'bm25' (needs
+# numpy/scipy) or 'embedding' (hashed n-gram vectors, needs numpy). Gemini, when
+# configured, re-ranks the local shortlist.
+app.config['MATCH_SCORER'] = os.getenv('MATCH_SCORER', 'keyword')
+if app.config['MATCH_SCORER'] == 'bm25' and not bm25_index.available():
+    print("MATCH_SCORER=bm25 needs numpy and scipy; using keyword matching")
+    app.config['MATCH_SCORER'] = 'keyword'
+if app.config['MATCH_SCORER'] == 'embedding' and not embedding_index_available():
+    print("MATCH_SCORER=embedding needs numpy; using keyword matching")
+    app.config['MATCH_SCORER'] = 'keyword'
+app.config['EMBEDDING_DIR'] = os.getenv('EMBEDDING_DIR', os.path.join(app.instance_path, 'embeddings'))
+app.config['EMBEDDING_DIM'] = int(os.getenv('EMBEDDING_DIM', '256'))
+embedding_index.configure(app.config['EMBEDDING_DIR'], app.config['EMBEDDING_DIM'],
+                          enabled=app.config['MATCH_SCORER'] == 'embedding')
+
+# Geo pre-filter: only providers based within this many km of a post, or serving an
+# area that covers it, are matched (0 turns it off; posts and providers with unknown places are unfiltered)
+app.config['GEO_RADIUS_KM'] = float(os.getenv('GEO_RADIUS_KM', '30'))
+app.config['GEO_CELL_DEG'] = float(os.getenv('GEO_CELL_DEG', str(geo.GEO_CELL_DEG)))
+geo.geo_index.configure(app.config['GEO_RADIUS_KM'], app.config['GEO_CELL_DEG'],
+                        app.config['INDEX_CHECK_SECONDS'])
+
+# Two-stage retrieval: shortlist locally, then send at most this much to Gemini
+app.config['GEMINI_SHORTLIST_SIZE'] = int(os.getenv('GEMINI_SHORTLIST_SIZE', '50'))
+app.config['GEMINI_PROMPT_MAX_CHARS'] = int(os.getenv('GEMINI_PROMPT_MAX_CHARS', '12000'))
+app.config['GEMINI_PROMPT_MAX_TOKENS'] = int(os.getenv('GEMINI_PROMPT_MAX_TOKENS', '0'))
+match_log = logging.getLogger('servease.matching')
+
+# Async matching: answer with keyword results, re-rank with Gemini in the background
+app.config['MATCHING_ASYNC'] = os.getenv('MATCHING_ASYNC', '0') == '1'
+app.config['RANK_WORKERS'] = int(os.getenv('RANK_WORKERS', '2'))
+rank_worker = RankWorker(app.config['RANK_WORKERS'])
 
 db.init_app(app)
+db_config.tune_engine(app, db)
+
+# Per-request spans (db, model, scoring, render) as a Server-Timing header and JSON log lines on stderr,
+# plus Prometheus metrics at /metrics (see telemetry.py)
+app.config['REQUEST_LOG'] = os.getenv('REQUEST_LOG', '1') == '1'
+app.config['SERVER_TIMING'] = os.getenv('SERVER_TIMING', '1') == '1'
+app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', '1') == '1'
+# Scrapers send "Authorization: Bearer <METRICS_TOKEN>"; without a token only these addresses may scrape
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN', '')
+app.config['METRICS_ALLOW'] = {a.strip() for a in os.getenv('METRICS_ALLOW', '127.0.0.1,::1').split(',') if a.strip()}
+telemetry.configure(app.config['REQUEST_LOG'], app.config['SERVER_TIMING'])
+telemetry.register_stats('ranking_cache', 'Gemini ranking cache', ranking_cache.stats)
+telemetry.register_stats('user_cache', 'Logged-in user cache', user_cache.stats)
+telemetry.register_stats('fragment_cache', 'Rendered fragment cache', fragment_cache.stats)
+if gemini_model:
+    telemetry.register_stats('gemini_client', 'Gemini client', gemini_model.stats)
+with app.app_context():
+    telemetry.instrument_engine(db.engine)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
 # ----------------- helpers -----------------
+@app.before_request
+def start_timing():
+    telemetry.start_request()
+
+# registered first so it runs after the other after_request hooks
+@app.after_request
+def finish_timing(response):
+    return telemetry.finish_request(response)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.load(db.session, int(user_id))
+
+@app.after_request
+def cache_uploads(response):
+    return http_cache.upload_cache_headers(response, app.static_url_path)
 
 def simple_match_score(post, provider):
     """
     MVP matching: count keyword overlaps between post title/desc and provider skills.
     Returns integer score.
     """
-    text = (post.title + ' ' + (post.description or '')).lower()
-    score = 0
-    for s in provider.skills:
-        if s.skill.lower() in text:
-            score += 2
-        else:
-            # partial match by token
-            for token in s.skill.lower().split():
-                if token in text:
-                    score += 1
+    text = post_text(post)
+    score = score_skills([s.skill for s in provider.skills], text)
     # small boost by rating and verification
-    score += int(provider.rating or 0)
-    if provider.verified:
-        score += 2
+    score += boost_score(provider)
     return score
 
-def gemini_match_providers(post, providers):
+def gemini_rank(model, prompt, payload, tags):
+    """
+    Ranked IDs from Gemini for `prompt`. Served from ranking_cache when the
+    same normalized payload was ranked before; `tags` name the post/providers
+    involved so editing any of them invalidates the entry.
+    """
+    key = payload_key(payload)
+    ranked_ids = ranking_cache.get(key)
+    if ranked_ids is None:
+        with telemetry.external_call('gemini.generate_content'):
+            if isinstance(model, ModelClient):
+                # concurrent requests for the same payload share one call
+                response = model.generate_content(prompt, key=key)
+            else:
+                response = model.generate_content(prompt)
+        ranked_ids = parse_ranked_ids(response.text)
+        ranking_cache.set(key, ranked_ids, tags)
+    return ranked_ids
+
+def candidate_char_budget():
+    """Characters available for candidate lines in a Gemini prompt."""
+    return prompt_char_budget(app.config['GEMINI_PROMPT_MAX_CHARS'], app.config['GEMINI_PROMPT_MAX_TOKENS']) or 12000
+
+def gemini_match_providers(post, providers, model=None, fallback=True, k=None):
     """
     Use Gemini AI to intelligently match service posts with providers.
-    Returns list of tuples (score, provider) sorted by relevance.
+    Returns list of tuples (score, provider) sorted by relevance, only the
+    best `k` when given.
+    `model` defaults to the configured Gemini model (tests pass a stub);
+    with fallback=False model errors are raised instead of falling back.
     """
-    if not gemini_model:
+    model = model or gemini_model
+    if not model:
         # Fallback to simple matching if Gemini is not configured
-        scored = []
-        for p in providers:
-            if p.user:
-                score = simple_match_score(post, p)
-                scored.append((score, p))
-        scored.sort(key=lambda x: x[0], reverse=True)
-        return scored
+        return top_k([(simple_match_score(post, p), p) for p in providers if p.user], k)
     
     try:
         # Prepare provider data for Gemini
@@ -163,7 +341,12 @@ def gemini_match_providers(post, providers):
         
         if not provider_data:
             return []
-        
+
+        # Keep the prompt within budget; providers come best-first so the tail is dropped
+        lines = [f"ID {p['id']}: {p['name']} - {p['title']}, Skills: {p['skills']}, Location: {p['location']}, Verified: {p['verified']}, Rating: {p['rating']}" for p in provider_data]
+        lines = fit_lines(lines, candidate_char_budget())
+        provider_data = provider_data[:len(lines)]
+
         # Create prompt for Gemini
         prompt = f"""You are a service matching AI. Analyze the following service post and rank the providers by relevance.
 
@@ -174,59 +357,53 @@ Location: {post.location or 'Not specified'}
 Budget: {post.budget_min or 0} - {post.budget_max or 0} BDT
 
 Providers:
-{chr(10).join([f"ID {p['id']}: {p['name']} - {p['title']}, Skills: {p['skills']}, Location: {p['location']}, Verified: {p['verified']}, Rating: {p['rating']}" for p in provider_data])}
+{chr(10).join(lines)}
 
 Rank the providers by relevance (1-100 scale) and return ONLY a comma-separated list of provider IDs in order of best match first.
 Format: ID1,ID2,ID3,etc"""
 
-        response = gemini_model.generate_content(prompt)
-        ranked_ids = [int(x.strip()) for x in response.text.split(',') if x.strip().isdigit()]
+        payload = {
+            'task': 'rank_providers',
+            'post': {'title': post.title, 'description': post.description, 'location': post.location,
+                     'budget': [post.budget_min, post.budget_max]},
+            'providers': provider_data,
+        }
+        tags = [f'post:{post.id}'] + [f"provider:{p['id']}" for p in provider_data]
+        started = time.perf_counter()
+        ranked_ids = gemini_rank(model, prompt, payload, tags)
+        match_log.info('match stage=model post=%s sent=%d dropped=%d prompt_chars=%d ms=%.1f',
+                       post.id, len(provider_data), len(providers) - len(provider_data), len(prompt),
+                       (time.perf_counter() - started) * 1000)
         
-        # Create scored list with high scores for AI-ranked providers
-        scored = []
+        # AI-ranked providers score high (earlier is better), unranked ones get the keyword score
         base_score = len(provider_data)
-        for idx, prov_id in enumerate(ranked_ids):
-            provider = next((p for p in providers if p.id == prov_id), None)
-            if provider:
-                # Give higher scores to earlier ranked providers
-                score = base_score - idx + 10  # Add 10 base score
-                if provider.verified:
-                    score += 5
-                scored.append((score, provider))
-        
-        # Add unranked providers with lower scores
-        for p in providers:
-            if p.user and p.id not in ranked_ids:
-                score = simple_match_score(post, p)
-                scored.append((score, p))
-        
-        scored.sort(key=lambda x: x[0], reverse=True)
-        return scored
+        def ai_score(idx, provider):
+            score = base_score - idx + 10  # Add 10 base score
+            if provider.verified:
+                score += 5
+            return score
+        with telemetry.span('scoring'):
+            return merge_ranked(ranked_ids, [p for p in providers if p.user], ai_score,
+                                lambda p: simple_match_score(post, p), k)
         
     except Exception as e:
-        print(f"Gemini matching error: {e}")
+        if not fallback:
+            raise
+        telemetry.error('gemini_unavailable' if isinstance(e, ModelUnavailable) else 'gemini_match', e,
+                        post=post.id)
         # Fallback to simple matching
-        scored = []
-        for p in providers:
-            if p.user:
-                score = simple_match_score(post, p)
-                scored.append((score, p))
-        scored.sort(key=lambda x: x[0], reverse=True)
-        return scored
+        return top_k([(simple_match_score(post, p), p) for p in providers if p.user], k)
 
-def gemini_match_posts(provider, posts):
+def gemini_match_posts(provider, posts, model=None, fallback=True, k=None):
     """
     Use Gemini AI to intelligently match providers with service posts.
     Returns list of tuples (score, post) sorted by relevance.
+    `model`, `fallback` and `k` work as in gemini_match_providers.
     """
-    if not gemini_model:
+    model = model or gemini_model
+    if not model:
         # Fallback to simple matching if Gemini is not configured
-        scored = []
-        for post in posts:
-            score = simple_match_score(post, provider)
-            scored.append((score, post))
-        scored.sort(key=lambda x: x[0], reverse=True)
-        return scored
+        return top_k([(simple_match_score(post, provider), post) for post in posts], k)
     
     try:
         # Prepare post data for Gemini
@@ -245,7 +422,11 @@ def gemini_match_posts(provider, posts):
         
         if not post_data:
             return []
-        
+
+        lines = [f"ID {p['id']}: {p['title']}, Description: {p['description']}, Location: {p['location']}, Budget: {p['budget']}" for p in post_data]
+        lines = fit_lines(lines, candidate_char_budget())
+        post_data = post_data[:len(lines)]
+
         # Create prompt for Gemini
         skills = ', '.join([s.skill for s in provider.skills])
         prompt = f"""You are a service matching AI. Analyze the following service provider and rank the job posts by relevance.
@@ -260,43 +441,78 @@ Verified: {provider.verified}
 Rating: {provider.rating or 0}
 
 Job Posts:
-{chr(10).join([f"ID {p['id']}: {p['title']}, Description: {p['description']}, Location: {p['location']}, Budget: {p['budget']}" for p in post_data])}
+{chr(10).join(lines)}
 
 Rank the job posts by relevance (1-100 scale) and return ONLY a comma-separated list of post IDs in order of best match first.
 Format: ID1,ID2,ID3,etc"""
 
-        response = gemini_model.generate_content(prompt)
-        ranked_ids = [int(x.strip()) for x in response.text.split(',') if x.strip().isdigit()]
+        payload = {
+            'task': 'rank_posts',
+            'provider': {'name': provider.user.name, 'title': provider.title, 'description': provider.description,
+                         'skills': skills, 'location': provider.location, 'verified': provider.verified,
+                         'rating': provider.rating},
+            'posts': post_data,
+        }
+        tags = [f'provider:{provider.id}'] + [f"post:{p['id']}" for p in post_data]
+        ranked_ids = gemini_rank(model, prompt, payload, tags)
         
-        # Create scored list with high scores for AI-ranked posts
-        scored = []
+        # AI-ranked posts score high (earlier is better), unranked ones get the keyword score
         base_score = len(post_data)
-        for idx, post_id in enumerate(ranked_ids):
-            post = next((p for p in posts if p.id == post_id), None)
-            if post:
-                # Give higher scores to earlier ranked posts
-                score = base_score - idx + 10  # Add 10 base score
-                scored.append((score, post))
-        
-        # Add unranked posts with lower scores
-        for post in posts:
-            if post.status == 'open' and post.id not in ranked_ids:
-                score = simple_match_score(post, provider)
-                scored.append((score, post))
-        
-        scored.sort(key=lambda x: x[0], reverse=True)
-        return scored
+        with telemetry.span('scoring'):
+            return merge_ranked(ranked_ids, [p for p in posts if p.status == 'open'],
+                                lambda idx, post: base_score - idx + 10,  # Add 10 base score
+                                lambda post: simple_match_score(post, provider), k)
         
     except Exception as e:
-        print(f"Gemini matching error: {e}")
+        if not fallback:
+            raise
+        telemetry.error('gemini_unavailable' if isinstance(e, ModelUnavailable) else 'gemini_match', e,
+                        provider=provider.id)
         # Fallback to simple matching
-        scored = []
-        for post in posts:
-            if post.status == 'open':
-                score = simple_match_score(post, provider)
-                scored.append((score, post))
-        scored.sort(key=lambda x: x[0], reverse=True)
-        return scored
+        return top_k([(simple_match_score(post, provider), post) for post in posts if post.status == 'open'], k)
+
+def store_post_matches(post):
+    """
+    Rank providers for a post and persist the ranking in post_matches.
+    In async mode only the keyword ranking is stored here; call
+    queue_ai_rerank() after committing to upgrade it in the background.
+    """
+    if gemini_model and not app.config['MATCHING_ASYNC']:
+        shortlist = shortlist_providers(post, app.config['GEMINI_SHORTLIST_SIZE'], app.config['MATCH_SCORER'])
+        scored = gemini_match_providers(post, shortlist, k=match_store.MAX_STORED)
+        match_store.save_post_matches(post.id, scored, 'gemini')
+    else:
+        method = app.config['MATCH_SCORER']
+        match_store.save_post_matches(post.id, match_store.local_matches(post, method), method)
+
+def rerank_post_with_ai(post_id, model):
+    """Background job: replace a post's stored ranking with the Gemini one."""
+    with app.app_context():
+        post = db.session.get(ServicePost, post_id)
+        if post is None:
+            return
+        shortlist = shortlist_providers(post, app.config['GEMINI_SHORTLIST_SIZE'], app.config['MATCH_SCORER'])
+        scored = gemini_match_providers(post, shortlist, model=model, fallback=False, k=match_store.MAX_STORED)
+        match_store.save_post_matches(post.id, scored, 'gemini')
+        db.session.commit()
+
+def queue_ai_rerank(post):
+    """Queue a background Gemini re-rank of a committed post (async mode only)."""
+    if gemini_model and app.config['MATCHING_ASYNC']:
+        rank_worker.submit(post.id, rerank_post_with_ai, post.id, gemini_model)
+
+BEST_MATCHES_PAGE = 10
+BEST_MATCHES_MAX_PAGE = 50
+
+def best_matches_page(provider_id, after=None, limit=BEST_MATCHES_PAGE):
+    """One keyset page of a provider's stored post matches and the cursor of the next page (or None)."""
+    rows = match_store.top_posts_for_provider(provider_id, k=limit + 1, after=after)
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        score, post = page[-1]
+        next_cursor = match_store.page_cursor(score, post.id)
+    return page, next_cursor
 
 # ----------------- routes -----------------
 @app.route('/')
@@ -364,24 +580,15 @@ def user_profile():
     if form.validate_on_submit():
         # Handle profile image upload
         if form.profile_image.data:
-            profile_path = save_image(form.profile_image.data, 'profiles')
+            profile_path = save_image(form.profile_image.data)
             if profile_path:
-                # Delete old profile image if it exists
-                if current_user.profile_image:
-                    old_path = os.path.join(app.root_path, 'static', current_user.profile_image)
-                    if os.path.exists(old_path):
-                        os.remove(old_path)
+                # the old image is released and garbage-collected later (see storage.py)
                 current_user.profile_image = profile_path
 
         # Handle cover image upload
         if form.cover_image.data:
-            cover_path = save_image(form.cover_image.data, 'covers')
+            cover_path = save_image(form.cover_image.data)
             if cover_path:
-                # Delete old cover image if it exists
-                if current_user.cover_image:
-                    old_path = os.path.join(app.root_path, 'static', current_user.cover_image)
-                    if os.path.exists(old_path):
-                        os.remove(old_path)
                 current_user.cover_image = cover_path
 
         # Update common user fields
@@ -407,26 +614,21 @@ def user_profile():
             provider.experience_years = form.experience_years.data
             provider.hourly_rate = form.hourly_rate.data
             provider.location = form.location.data
+            provider_attrs.set_languages(provider, provider_attrs.split_list(form.languages.data))
+            provider_attrs.set_service_areas(provider, provider_attrs.split_list(form.service_areas.data))
 
             # Handle portfolio images
             if form.portfolio_images.data:
                 portfolio_images = []
-                existing_images = json.loads(provider.portfolio_images) if provider.portfolio_images else []
-                
-                # Delete old portfolio images
-                for old_image in existing_images:
-                    old_path = os.path.join(app.root_path, 'static', old_image)
-                    if os.path.exists(old_path):
-                        os.remove(old_path)
-                
-                # Save new portfolio images
+
+                # Save new portfolio images; the replaced ones are released with their rows
                 for image in form.portfolio_images.data:
                     if image:
-                        portfolio_path = save_image(image, 'portfolio')
+                        portfolio_path = save_image(image)
                         if portfolio_path:
                             portfolio_images.append(portfolio_path)
                 
-                provider.portfolio_images = json.dumps(portfolio_images)
+                provider_attrs.set_portfolio_images(provider, portfolio_images)
 
         else:
             finder = current_user.finder
@@ -435,7 +637,10 @@ def user_profile():
             finder.company_size = form.company_size.data
             finder.industry = form.industry.data
             finder.location = form.location.data
-        
+
+        if current_user.role == 'provider':
+            match_store.refresh_provider(current_user.provider, app.config['MATCH_SCORER'])
+            ranking_cache.invalidate_provider(current_user.provider.id)
         db.session.commit()
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('user_profile'))
@@ -462,11 +667,11 @@ def user_profile():
         form.business_name.data = provider.business_name
         form.experience_years.data = provider.experience_years
         form.hourly_rate.data = provider.hourly_rate
+        form.languages.data = ', '.join(provider_attrs.language_names(provider))
+        form.service_areas.data = ', '.join(provider_attrs.area_names(provider))
         skills = provider.skills
-        try:
-            portfolio_images = json.loads(provider.portfolio_images) if provider and provider.portfolio_images else []
-        except Exception:
-            portfolio_images = []
+        portfolio_images = provider_attrs.image_paths(provider)
+        images.image_pipeline.preload([current_user.profile_image, current_user.cover_image] + portfolio_images)
     else:
         finder = current_user.finder
         form.bio.data = finder.bio
@@ -511,6 +716,8 @@ def settings():
         # Update provider-specific settings
         if current_user.role == 'provider':
             current_user.provider.profile_visible = form.profile_visible.data
+            match_store.refresh_provider(current_user.provider, app.config['MATCH_SCORER'])
+            ranking_cache.invalidate_provider(current_user.provider.id)
 
         db.session.commit()
         flash('Settings updated successfully!', 'success')
@@ -529,29 +736,41 @@ def settings():
 @app.route('/delete-account', methods=['POST'])
 @login_required
 def delete_account():
+    provider_id = None
+    post_ids = []
     try:
         # Delete associated models first
         if current_user.role == 'provider':
+            provider_id = current_user.provider.id
+            match_store.delete_for_provider(provider_id)
+            ranking_cache.invalidate_provider(provider_id)
             ProviderSkill.query.filter_by(provider_id=current_user.provider.id).delete()
+            FinderFavorite.query.filter_by(provider_id=provider_id).delete()
             db.session.delete(current_user.provider)
         else:
+            match_store.delete_for_finder(current_user.id)
+            post_ids = [post.id for post in current_user.posts]
+            for post_id in post_ids:
+                ranking_cache.invalidate_post(post_id)
             ServicePost.query.filter_by(finder_id=current_user.id).delete()
             db.session.delete(current_user.finder)
 
-        # Delete profile image if exists
-        if current_user.profile_image:
-            try:
-                filepath = os.path.join(app.root_path, 'static', current_user.profile_image)
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-            except Exception as e:
-                print(f"Error removing profile image: {e}")
+        # the bulk user delete below bypasses the ORM, release the user's images by hand
+        storage.release(current_user.profile_image)
+        storage.release(current_user.cover_image)
 
         # Delete user
         user_id = current_user.id
         logout_user()
         User.query.filter_by(id=user_id).delete()
         db.session.commit()
+        if provider_id:
+            # bulk delete above bypasses the ORM, drop the skills from the index by hand
+            skill_index.remove_provider(provider_id)
+        else:
+            # same for the posts' vectors
+            embedding_index.refresh(post_ids=post_ids)
+        user_cache.invalidate(user_id)
         flash('Your account has been deleted.', 'info')
     except Exception as e:
         db.session.rollback()
@@ -597,6 +816,8 @@ def provider_profile():
         prov.title = form.title.data
         prov.description = form.description.data
         prov.location = form.location.data
+        match_store.refresh_provider(prov, app.config['MATCH_SCORER'])
+        ranking_cache.invalidate_provider(prov.id)
         db.session.commit()
         flash('Profile updated.', 'success')
         return redirect(url_for('provider_dashboard'))
@@ -618,6 +839,10 @@ def add_skill():
         sk = ProviderSkill(provider_id=prov.id, skill=form.skill.data.strip())
         db.session.add(sk)
         db.session.commit()
+        # only this provider's rows on posts mentioning the new skill change
+        match_store.update_provider_skill(prov, sk.skill, app.config['MATCH_SCORER'])
+        ranking_cache.invalidate_provider(prov.id)
+        db.session.commit()
         flash('Skill added.', 'success')
         return redirect(url_for('provider_dashboard'))
     return render_template('add_skill.html', form=form)
@@ -651,6 +876,9 @@ def create_post():
         )
         db.session.add(post)
         db.session.commit()
+        store_post_matches(post)
+        db.session.commit()
+        queue_ai_rerank(post)
         flash('Post created! Matching providers...', 'success')
         return redirect(url_for('view_matches', post_id=post.id))
     return render_template('create_post.html', form=form)
@@ -664,36 +892,107 @@ def view_matches(post_id):
     if current_user.role != 'finder' or post.finder_id != current_user.id:
         flash('Access denied.', 'danger')
         return redirect(url_for('dashboard'))
-    # find providers in DB and compute AI-based score
-    providers = Provider.query.all()
-    scored = gemini_match_providers(post, providers)
+    language = request.args.get('language', '').strip()
+    area = request.args.get('area', '').strip()
+    # read the precomputed ranking; posts from before post_matches get ranked once here
+    scored = match_store.top_providers_for_post(post.id, k=10, language=language, area=area)
+    if not scored and match_store.post_match_method(post.id) is None:
+        store_post_matches(post)
+        db.session.commit()
+        queue_ai_rerank(post)
+        scored = match_store.top_providers_for_post(post.id, k=10, language=language, area=area)
     top = [item[1] for item in scored[:10]]  # top 10
-    return render_template('view_matches.html', post=post, matches=top, scored=scored[:10])
+    ai_pending = rank_worker.status(post.id) == PENDING
+    return render_template('view_matches.html', post=post, matches=top, scored=scored[:10], ai_pending=ai_pending,
+                           language=language, area=area)
+
+# Matches as JSON, polled by the match page while the AI re-rank runs
+@app.route('/post/<int:post_id>/matches.json')
+@login_required
+def view_matches_json(post_id):
+    post = ServicePost.query.get_or_404(post_id)
+    if current_user.role != 'finder' or post.finder_id != current_user.id:
+        return jsonify({'error': 'Access denied.'}), 403
+    method = match_store.post_match_method(post.id)
+    job = rank_worker.status(post.id)
+    if method == 'gemini':
+        status = 'ready'
+    elif job == PENDING:
+        status = 'pending'
+    elif job == FAILED:
+        status = 'failed'
+    else:
+        status = 'keyword'
+    if status in ('ready', 'failed'):
+        # the outcome is stored (or reported now); the worker need not remember it
+        rank_worker.forget(post.id)
+    scored = match_store.top_providers_for_post(post.id, k=10,
+                                                language=request.args.get('language', '').strip(),
+                                                area=request.args.get('area', '').strip())
+    return jsonify({
+        'post_id': post.id,
+        'status': status,
+        'method': method,
+        'matches': [{
+            'provider_id': prov.id,
+            'user_id': prov.user_id,
+            'name': prov.user.name,
+            'title': prov.title,
+            'skills': [s.skill for s in prov.skills],
+            'location': prov.location,
+            'languages': provider_attrs.language_names(prov),
+            'verified': bool(prov.verified),
+            'rating': prov.rating,
+            'score': score,
+        } for score, prov in scored],
+    })
 
 # View Profile
 @app.route('/user/<int:user_id>')
 def view_profile(user_id):
-    user = User.query.get_or_404(user_id)
-    # Prepare social links dict for template
-    try:
-        social = json.loads(user.social_links) if user.social_links else {}
-    except Exception:
-        social = {}
-
-    if user.role == 'provider':
-        skills = user.provider.skills if user.provider else []
+    stamps = http_cache.profile_stamps(db.session, user_id)
+    if stamps is None:
+        abort(404)
+    viewer = current_user if current_user.is_authenticated else None
+    owner = viewer is not None and viewer.id == user_id
+    validators = None
+    if not owner:
+        # owners see their latest posts, which the row timestamps do not cover
+        validators = http_cache.profile_validators(user_id, stamps, viewer)
+        unchanged = http_cache.not_modified(*validators, private=viewer is not None)
+        if unchanged is not None:
+            return unchanged
+
+    def render_body():
+        user = db.session.get(User, user_id)
+        # Prepare social links dict for template
         try:
-            portfolio_images = json.loads(user.provider.portfolio_images) if user.provider and user.provider.portfolio_images else []
+            social = json.loads(user.social_links) if user.social_links else {}
         except Exception:
-            portfolio_images = []
-        return render_template('view_profile.html', user=user, skills=skills, social=social, portfolio_images=portfolio_images)
-    else:
+            social = {}
+
+        if user.role == 'provider':
+            skills = user.provider.skills if user.provider else []
+            portfolio_images = provider_attrs.image_paths(user.provider)
+            images.image_pipeline.preload([user.profile_image, user.cover_image] + portfolio_images)
+            return render_template('_profile_body.html', user=user, skills=skills, social=social,
+                                   portfolio_images=portfolio_images)
         posts = []
-        if current_user.is_authenticated and current_user.id == user.id:
+        if owner:
             posts = ServicePost.query.filter_by(finder_id=user.id)\
                                   .order_by(ServicePost.created_at.desc())\
                                   .limit(5).all()
-    return render_template('view_profile.html', user=user, posts=posts, social=social, portfolio_images=[])
+        return render_template('_profile_body.html', user=user, posts=posts, social=social, portfolio_images=[])
+
+    if owner:
+        body = render_body()
+    else:
+        body = fragment_cache.get_or_render(http_cache.profile_fragment_key(user_id, stamps), render_body,
+                                            tags=[f'user:{user_id}'])
+    response = make_response(render_template('view_profile.html', profile_body=Markup(body)))
+    if validators is not None:
+        http_cache.set_validators(response, *validators, private=viewer is not None)
+    return response
 
 # Finder profile
 @app.route('/finder/profile', methods=['GET', 'POST'])
@@ -727,110 +1026,146 @@ def provider_best_matches():
         flash('Access denied.', 'danger')
         return redirect(url_for('dashboard'))
     prov = current_user.provider
-    # Get all open posts
-    posts = ServicePost.query.filter_by(status='open').order_by(ServicePost.created_at.desc()).all()
-    # Use Gemini AI to match posts
-    scored = gemini_match_posts(prov, posts)
-    top = [item[1] for item in scored[:10]]  # top 10
-    return render_template('provider_best_matches.html', provider=prov, matches=top, scored=scored[:10])
+    if not match_store.provider_has_matches(prov.id):
+        # nothing stored for this provider yet: score the latest open posts once
+        match_store.score_recent_posts(prov, app.config['MATCH_SCORER'])
+        db.session.commit()
+    # Precomputed matches over open posts, first page
+    scored, next_cursor = best_matches_page(prov.id)
+    top = [item[1] for item in scored]
+    return render_template('provider_best_matches.html', provider=prov, matches=top, scored=scored,
+                           next_cursor=next_cursor)
+
+@app.route('/provider/best-matches.json')
+@login_required
+def provider_best_matches_json():
+    if current_user.role != 'provider':
+        return jsonify({'error': 'Access denied.'}), 403
+    after = None
+    if request.args.get('after'):
+        after = match_store.parse_cursor(request.args['after'])
+        if after is None:
+            return jsonify({'error': 'Invalid cursor.'}), 400
+    limit = min(max(request.args.get('limit', BEST_MATCHES_PAGE, type=int), 1), BEST_MATCHES_MAX_PAGE)
+    scored, next_cursor = best_matches_page(current_user.provider.id, after, limit)
+    return jsonify({
+        'matches': [{
+            'post_id': post.id,
+            'title': post.title,
+            'description': post.description,
+            'location': post.location,
+            'budget_min': post.budget_min,
+            'budget_max': post.budget_max,
+            'finder': post.finder.name,
+            'created_at': post.created_at.strftime('%b %d, %Y') if post.created_at else None,
+            'score': score,
+        } for score, post in scored],
+        'next': next_cursor,
+    })
+
+# Search providers and posts
+def run_search():
+    """(q, kind, page, results, has_more) for the search page and its JSON API."""
+    q = request.args.get('q', '').strip()
+    default_kind = 'posts' if current_user.role == 'provider' else 'providers'
+    kind = request.args.get('type', default_kind)
+    if kind not in ('providers', 'posts'):
+        kind = default_kind
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', search.PER_PAGE, type=int)
+    find = search.search_posts if kind == 'posts' else search.search_providers
+    results, has_more = find(q, page, per_page)
+    return q, kind, max(page, 1), results, has_more
+
+@app.route('/search')
+@login_required
+def search_page():
+    q, kind, page, results, has_more = run_search()
+    return render_template('search.html', q=q, kind=kind, page=page, results=results, has_more=has_more)
+
+@app.route('/search.json')
+@login_required
+def search_json():
+    q, kind, page, results, has_more = run_search()
+    if kind == 'posts':
+        items = [{
+            'post_id': post.id,
+            'title': post.title,
+            'location': post.location,
+            'budget_min': post.budget_min,
+            'budget_max': post.budget_max,
+            'finder': post.finder.name,
+            'rank': rank,
+            'snippet': str(snippet),
+        } for post, rank, snippet in results]
+    else:
+        items = [{
+            'provider_id': prov.id,
+            'user_id': prov.user_id,
+            'name': prov.user.name,
+            'title': prov.title,
+            'business_name': prov.business_name,
+            'skills': [s.skill for s in prov.skills],
+            'location': prov.location,
+            'rating': prov.rating,
+            'verified': bool(prov.verified),
+            'rank': rank,
+            'snippet': str(snippet),
+        } for prov, rank, snippet in results]
+    return jsonify({'q': q, 'type': kind, 'page': page, 'has_more': has_more, 'results': items})
+
+# Prometheus text format; per process, so scrape each worker
+@app.route('/metrics')
+def metrics():
+    if not app.config['METRICS_ENABLED']:
+        abort(404)
+    token = app.config['METRICS_TOKEN']
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            abort(401)
+    elif request.remote_addr not in app.config['METRICS_ALLOW']:
+        abort(403)
+    return Response(telemetry.metrics_text(), mimetype='text/plain; version=0.0.4')
+
+# Compile every template now (all filters are registered) rather than on the first request for it
+if app.config['TEMPLATE_WARMUP']:
+    template_cache.warm_templates(app.jinja_env)
 
 # Run
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     with app.app_context():
-        # Create tables if they don't exist
-        db.create_all()
-        
-        # Auto-migration: Add new columns
-        try:
-            import sqlite3
-            conn = sqlite3.connect('instance/servease.db')
-            cursor = conn.cursor()
-
-            # Check users table columns
-            cursor.execute("PRAGMA table_info(users)")
-            user_columns = [column[1] for column in cursor.fetchall()]
-            
-            # Add new columns to users table
-            new_user_columns = {
-                'profile_image': 'VARCHAR(200)',
-                'cover_image': 'VARCHAR(200)',
-                'tagline': 'VARCHAR(200)',
-                'email_notifications': 'BOOLEAN DEFAULT 1',
-                'phone': 'VARCHAR(20)',
-                'website': 'VARCHAR(200)',
-                'social_links': 'TEXT',
-                'location': 'VARCHAR(200)'
-            }
-            
-            for col_name, col_type in new_user_columns.items():
-                if col_name not in user_columns:
-                    cursor.execute(f'ALTER TABLE users ADD COLUMN {col_name} {col_type}')
-                    print(f"✓ Added {col_name} column to users table")
-
-            # Check providers table columns
-            cursor.execute("PRAGMA table_info(providers)")
-            provider_columns = [column[1] for column in cursor.fetchall()]
-            
-            # Add new columns to providers table
-            new_provider_columns = {
-                'location': 'VARCHAR(200)',
-                'profile_visible': 'BOOLEAN DEFAULT 1',
-                'business_name': 'VARCHAR(200)',
-                'business_hours': 'TEXT',
-                'experience_years': 'INTEGER',
-                'certificates': 'TEXT',
-                'service_areas': 'TEXT',
-                'languages': 'TEXT',
-                'hourly_rate': 'FLOAT',
-                'portfolio_images': 'TEXT'
-            }
-            
-            for col_name, col_type in new_provider_columns.items():
-                if col_name not in provider_columns:
-                    cursor.execute(f'ALTER TABLE providers ADD COLUMN {col_name} {col_type}')
-                    print(f"✓ Added {col_name} column to providers table")
-
-            # Add new columns to finders table
-            cursor.execute("PRAGMA table_info(finders)")
-            finder_columns = [column[1] for column in cursor.fetchall()]
-            
-            new_finder_columns = {
-                'preferences': 'TEXT',
-                'favorite_providers': 'TEXT',
-                'company_name': 'VARCHAR(200)',
-                'company_size': 'VARCHAR(50)',
-                'industry': 'VARCHAR(100)'
-            }
-            
-            for col_name, col_type in new_finder_columns.items():
-                if col_name not in finder_columns:
-                    cursor.execute(f'ALTER TABLE finders ADD COLUMN {col_name} {col_type}')
-                    print(f"✓ Added {col_name} column to finders table")
-
-            # Check if finders table exists
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='finders'")
-            if not cursor.fetchone():
-                cursor.execute("""
-                    CREATE TABLE finders (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER NOT NULL,
-                        bio TEXT,
-                        location VARCHAR(200),
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users (id)
-                    )
-                """)
-                print("✓ Created finders table")
-
-            # Create profile_images directory if it doesn't exist
-            profile_images_dir = os.path.join(app.root_path, 'static', 'profile_images')
-            if not os.path.exists(profile_images_dir):
-                os.makedirs(profile_images_dir)
-                print("✓ Created profile_images directory")
-
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            print(f"Migration note: {e}")
+        # Create or upgrade the schema (see migrations.py)
+        migrate(db)
+
+        # Create profile_images directory if it doesn't exist
+        profile_images_dir = os.path.join(app.root_path, 'static', 'profile_images')
+        if not os.path.exists(profile_images_dir):
+            os.makedirs(profile_images_dir)
+            print("✓ Created profile_images directory")
+
+        # Geocode posts and providers saved before coordinates were stored
+        geo.backfill()
+        db.session.commit()
+
+        # Delete uploads nothing has referenced for UPLOAD_GC_GRACE seconds
+        storage.collect_garbage(app.config['UPLOAD_GC_GRACE'])
+
+        # Build variants of images uploaded before the image pipeline existed
+        if images.available():
+            for source in images.sources_without_variants():
+                images.image_pipeline.submit(source)
+
+        # Map the embedding vectors (embedding everything on first run)
+        if embedding_index.enabled:
+            embedding_index.ensure_built()
+
+        # Rank posts created before match results were persisted
+        backfilled = match_store.posts_without_matches()
+        for post in backfilled:
+            store_post_matches(post)
+        db.session.commit()
+        for post in backfilled:
+            queue_ai_rerank(post)
     
     app.run(debug=True)
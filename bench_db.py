@@ -0,0 +1,132 @@
+"""Load test: SQLite read/write throughput with default vs tuned settings.
+
+Several worker processes (like gunicorn workers) share one database file.
+Each loops for a few seconds, mostly reading (a user by id, a finder's
+newest posts) and sometimes writing (a new post, one commit each). The
+same run is repeated with SQLITE_TUNING=0 (rollback journal, full sync)
+and with the db_config defaults (WAL, synchronous=NORMAL, busy_timeout,
+mmap, a larger page cache), each on a fresh file.
+
+    python bench_db.py [--workers 4] [--seconds 5] [--write-ratio 0.2] [--json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.exc import OperationalError
+
+import db_config
+from models import db, ServicePost, User
+
+USERS = 500
+POSTS = 5000
+
+users = User.__table__
+posts = ServicePost.__table__
+
+
+def make_engine(path, env):
+    uri = f'sqlite:///{path}'
+    engine = create_engine(uri, **db_config.engine_options(uri, env))
+    db_config.install_pragmas(engine, db_config.sqlite_settings(env))
+    return engine
+
+
+def seed(path, env):
+    engine = make_engine(path, env)
+    db.metadata.create_all(engine)
+    rnd = random.Random(7)
+    with engine.begin() as conn:
+        conn.execute(insert(users), [
+            {'id': i, 'name': f'User {i}', 'email': f'u{i}@example.com', 'password': 'x',
+             'role': 'finder' if i % 2 else 'provider'} for i in range(1, USERS + 1)])
+        conn.execute(insert(posts), [
+            {'finder_id': rnd.randrange(1, USERS + 1, 2), 'title': f'Need help {i}',
+             'description': 'Leaking kitchen tap in Dhanmondi', 'status': 'open'} for i in range(POSTS)])
+    engine.dispose()
+
+
+def worker(path, env, seconds, write_ratio, seed_value, results):
+    engine = make_engine(path, env)
+    rnd = random.Random(seed_value)
+    reads = writes = errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        finder_id = rnd.randrange(1, USERS + 1, 2)
+        try:
+            if rnd.random() < write_ratio:
+                with engine.begin() as conn:
+                    conn.execute(insert(posts).values(finder_id=finder_id, title='Need a plumber',
+                                                      description='Bench write', status='open'))
+                writes += 1
+            else:
+                with engine.connect() as conn:
+                    conn.execute(select(users).where(users.c.id == finder_id)).first()
+                    conn.execute(select(posts).where(posts.c.finder_id == finder_id)
+                                 .order_by(posts.c.created_at.desc()).limit(10)).all()
+                reads += 1
+        except OperationalError:
+            # "database is locked" once the driver's lock wait runs out
+            errors += 1
+    engine.dispose()
+    results.put((reads, writes, errors))
+
+
+def run(label, env, workers, seconds, write_ratio):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        seed(path, env)
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=worker, args=(path, env, seconds, write_ratio, i, results))
+                 for i in range(workers)]
+        for p in procs:
+            p.start()
+        totals = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+        engine = make_engine(path, env)
+        with engine.connect() as conn:
+            mode = conn.exec_driver_sql('PRAGMA journal_mode').scalar()
+        engine.dispose()
+    reads, writes, errors = (sum(t[i] for t in totals) for i in range(3))
+    return {'config': label, 'journal_mode': mode, 'workers': workers,
+            'reads_per_s': round(reads / seconds, 1), 'writes_per_s': round(writes / seconds, 1),
+            'errors': errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    base = {k: v for k, v in os.environ.items() if not k.startswith('SQLITE_')}
+    results = [
+        run('default', {**base, 'SQLITE_TUNING': '0'}, args.workers, args.seconds, args.write_ratio),
+        run('tuned', base, args.workers, args.seconds, args.write_ratio),
+    ]
+    if results[0]['reads_per_s']:
+        results[1]['read_speedup'] = round(results[1]['reads_per_s'] / results[0]['reads_per_s'], 1)
+    if results[0]['writes_per_s']:
+        results[1]['write_speedup'] = round(results[1]['writes_per_s'] / results[0]['writes_per_s'], 1)
+
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"{'config':>8} {'journal':>8} {'reads/s':>10} {'writes/s':>10} {'errors':>7}")
+    for row in results:
+        print(f"{row['config']:>8} {row['journal_mode']:>8} {row['reads_per_s']:>10} "
+              f"{row['writes_per_s']:>10} {row['errors']:>7}")
+    if 'read_speedup' in results[1]:
+        print(f"tuned: {results[1]['read_speedup']}x reads, {results[1].get('write_speedup', '-')}x writes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""Benchmark: matching functions and routes on a synthetic marketplace.
+
+Builds a throwaway SQLite database with synthetic.generate() (same seed,
+same data), swaps Gemini for fake_model.FakeModel and measures:
+
+* simple_match_score for one post against every provider;
+* gemini_match_providers (shortlist + model ranking) and
+  gemini_match_posts (recent open posts) with the fake model;
+* the matching routes end to end through the test client: a finder's
+  match page and JSON, a provider's best matches page and JSON, creating a
+  post (which ranks it).
+
+Each case runs on `--iterations` different posts/providers and reports
+p50/p95/mean latency, SQL statements per call and the peak memory traced
+over a few extra calls. --json prints one object (config, data sizes,
+results) for tracking runs over time.
+
+    python bench_matching.py [--providers 1000] [--posts 2000] [--iterations 30]
+                             [--seed 42] [--model-latency-ms 0] [--json]
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+MEMORY_CALLS = 3
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of `values`."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def measure(name, fn, targets, engine):
+    """Time `fn(target)` for each target; memory is traced over MEMORY_CALLS more calls."""
+    from query_count import count_queries
+
+    latencies = []
+    queries = []
+    for target in targets:
+        with count_queries(engine) as counter:
+            started = time.perf_counter()
+            fn(target)
+            latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(counter.count)
+    tracemalloc.start()
+    for target in targets[:MEMORY_CALLS]:
+        fn(target)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'case': name, 'calls': len(latencies), 'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3), 'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'queries_per_call': round(sum(queries) / len(queries), 1), 'max_queries': max(queries),
+            'peak_traced_kib': round(peak / 1024, 1)}
+
+
+def run(args):
+    # the app reads its database and caches from the environment at import time
+    tmp = tempfile.mkdtemp(prefix='servease-bench-')
+    os.environ.update({'DATABASE_URL': f"sqlite:///{os.path.join(tmp, 'bench.db')}", 'MATCHING_ASYNC': '0',
+                       'LLM_CACHE_BACKEND': 'memory', 'TEMPLATE_BYTECODE_DIR': '', 'REQUEST_LOG': '0'})
+    import app as servease
+    import fake_model
+    import geo
+    import synthetic
+    from migrations import migrate
+    from models import db, Provider, ServicePost
+
+    flask_app = servease.app
+    flask_app.config.update(WTF_CSRF_ENABLED=False, TESTING=True)
+    stub = fake_model.FakeModel(args.model_latency_ms)
+    # routes go through the resilient client like in production
+    servease.gemini_model = servease.ModelClient(stub, timeout=flask_app.config['GEMINI_TIMEOUT'])
+
+    started = time.perf_counter()
+    data = synthetic.generate(args.providers, args.posts, seed=args.seed)
+    generate_ms = (time.perf_counter() - started) * 1000
+    with flask_app.app_context():
+        migrate(db)
+        engine = db.engine
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            counts = synthetic.populate(conn, data)
+        geo.backfill()
+        db.session.commit()
+        load_ms = (time.perf_counter() - started) * 1000
+
+    rnd = random.Random(args.seed)
+    open_posts = [p for p in data['service_posts'] if p['status'] == 'open']
+    post_rows = rnd.sample(open_posts, min(args.iterations, len(open_posts)))
+    provider_rows = rnd.sample(data['providers'], min(args.iterations, len(data['providers'])))
+    clients = {}
+
+    def client(user_id):
+        if user_id not in clients:
+            c = flask_app.test_client()
+            with c.session_transaction() as s:
+                s['_user_id'] = str(user_id)
+                s['_fresh'] = True
+            clients[user_id] = c
+        return clients[user_id]
+
+    def check(response):
+        if response.status_code >= 400:
+            raise RuntimeError(f'{response.request.path} returned {response.status_code}')
+        return response
+
+    results = []
+    with flask_app.app_context():
+        providers = Provider.query.options(db.selectinload(Provider.skills)).all()
+
+        def score_all(row):
+            post = db.session.get(ServicePost, row['id'])
+            for provider in providers:
+                servease.simple_match_score(post, provider)
+
+        def match_providers(row):
+            post = db.session.get(ServicePost, row['id'])
+            shortlist = servease.shortlist_providers(post, flask_app.config['GEMINI_SHORTLIST_SIZE'],
+                                                     flask_app.config['MATCH_SCORER'])
+            servease.gemini_match_providers(post, shortlist, model=stub, fallback=False, k=10)
+
+        recent = (ServicePost.query.filter(ServicePost.status == 'open')
+                  .order_by(ServicePost.id.desc()).limit(servease.match_store.RECENT_WINDOW).all())
+
+        def match_posts(row):
+            provider = db.session.get(Provider, row['id'])
+            servease.gemini_match_posts(provider, recent, model=stub, fallback=False, k=10)
+
+        for name, fn, targets in [('simple_match_score (all providers)', score_all, post_rows),
+                                  ('gemini_match_providers', match_providers, post_rows),
+                                  ('gemini_match_posts', match_posts, provider_rows)]:
+            servease.ranking_cache.clear()
+            results.append(measure(name, fn, targets, engine))
+        db.session.remove()
+
+    routes = [
+        ('GET /post/<id>/matches', post_rows,
+         lambda row: check(client(row['finder_id']).get(f"/post/{row['id']}/matches"))),
+        ('GET /post/<id>/matches.json', post_rows,
+         lambda row: check(client(row['finder_id']).get(f"/post/{row['id']}/matches.json"))),
+        ('GET /provider/best-matches', provider_rows,
+         lambda row: check(client(row['user_id']).get('/provider/best-matches'))),
+        ('GET /provider/best-matches.json', provider_rows,
+         lambda row: check(client(row['user_id']).get('/provider/best-matches.json'))),
+        ('POST /post/create', post_rows,
+         lambda row: check(client(row['finder_id']).post('/post/create', data={
+             'title': row['title'], 'description': row['description'], 'location': row['location'],
+             'budget_min': row['budget_min'], 'budget_max': row['budget_max']}))),
+    ]
+    for name, targets, fn in routes:
+        servease.ranking_cache.clear()
+        results.append(measure(name, fn, targets, engine))
+
+    shutil.rmtree(tmp, ignore_errors=True)
+    return {
+        'config': {'providers': args.providers, 'posts': args.posts, 'seed': args.seed,
+                   'iterations': args.iterations, 'model_latency_ms': args.model_latency_ms,
+                   'match_scorer': flask_app.config['MATCH_SCORER'], 'python': platform.python_version()},
+        'data': {**counts, 'generate_ms': round(generate_ms, 1), 'load_ms': round(load_ms, 1)},
+        'model_calls': stub.calls,
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == 'darwin' else 1),
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--providers', type=int, default=1000)
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--model-latency-ms', type=float, default=0)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+    # keep stdout for the JSON report (migrations and the app print progress)
+    with contextlib.redirect_stdout(sys.stderr) if args.json else contextlib.nullcontext():
+        report = run(args)
+
+    if args.json:
+        print(json.dumps(report))
+        return
+    data = report['data']
+    print(f"{data['users']} users, {data['providers']} providers, {data['service_posts']} posts "
+          f"(generated in {data['generate_ms']} ms, loaded in {data['load_ms']} ms); "
+          f"{report['model_calls']} model calls, max RSS {report['max_rss_kib']} KiB")
+    print(f"{'case':<36} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9} {'queries':>8} {'peak KiB':>9}")
+    for r in report['results']:
+        print(f"{r['case']:<36} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['mean_ms']:>9} "
+              f"{r['queries_per_call']:>8} {r['peak_traced_kib']:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Micro-benchmark: merging a model ranking back onto candidates.
+
+Compares the old list-scan merge (next(...) per ranked ID, `in` against a
+list, full sort) with ranking.merge_ranked + heap top-10 at 1k/10k/100k
+candidates. The old merge is quadratic and is skipped above 10k.
+
+    python bench_ranking.py [--json]
+"""
+import json
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+from ranking import merge_ranked
+
+SIZES = (1000, 10000, 100000)
+LEGACY_LIMIT = 10000
+TOP = 10
+
+
+def legacy_merge(ranked_ids, candidates, ai_score, fallback_score):
+    scored = []
+    for idx, obj_id in enumerate(ranked_ids):
+        obj = next((c for c in candidates if c.id == obj_id), None)
+        if obj:
+            scored.append((ai_score(idx, obj), obj))
+    for c in candidates:
+        if c.id not in ranked_ids:
+            scored.append((fallback_score(c), c))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return scored[:TOP]
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main():
+    rnd = random.Random(42)
+    results = []
+    for n in SIZES:
+        candidates = [SimpleNamespace(id=i, score=rnd.randint(0, 20)) for i in range(1, n + 1)]
+        # the model ranks a quarter of the candidates and repeats a few IDs
+        ranked_ids = rnd.sample(range(1, n + 1), n // 4)
+        ranked_ids += ranked_ids[:10]
+        base = len(candidates)
+        ai_score = lambda idx, c: base - idx + 10  # noqa: E731
+        fallback_score = lambda c: c.score  # noqa: E731
+
+        repeat = 5 if n <= LEGACY_LIMIT else 3
+        row = {'candidates': n,
+               'merge_ms': round(timed(lambda: merge_ranked(ranked_ids, candidates, ai_score, fallback_score, TOP), repeat), 3)}
+        if n <= LEGACY_LIMIT:
+            row['legacy_ms'] = round(timed(lambda: legacy_merge(ranked_ids, candidates, ai_score, fallback_score), 1), 3)
+            row['speedup'] = round(row['legacy_ms'] / row['merge_ms'], 1) if row['merge_ms'] else None
+        results.append(row)
+
+    if '--json' in sys.argv:
+        print(json.dumps(results))
+        return
+    print(f"{'candidates':>10} {'merge ms':>10} {'legacy ms':>12} {'speedup':>8}")
+    for row in results:
+        print(f"{row['candidates']:>10} {row['merge_ms']:>10} {row.get('legacy_ms', 'skipped'):>12} {row.get('speedup', '-'):>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Benchmark: keyword substring scoring vs the vectorized BM25 index.
+
+Scores one post against N synthetic providers with simple_match_score's
+logic (Python loop, substring tests) and with bm25_index (one sparse
+matrix-vector product), plus the BM25 build time.
+
+    python bench_scoring.py [--json]
+"""
+import json
+import random
+import sys
+import time
+
+import bm25_index
+from skill_index import score_skills
+
+SIZES = (1000, 10000, 50000)
+POSTS = 20
+SKILLS = ['plumbing', 'pipe repair', 'electrical wiring', 'house painting', 'art teacher', 'web design',
+          'ac repair', 'carpentry', 'math tutoring', 'deep cleaning', 'smart home setup', 'car wash',
+          'house shifting', 'cooking', 'gardening', 'graphic design', 'photography', 'tailoring']
+WORDS = ('need urgent help with kitchen sink leak bathroom pipe wiring fan light install paint two rooms '
+         'tutor for class eight math english logo design wedding photos cleaning flat dhaka mirpur uttara').split()
+
+
+def make_rows(n, rnd):
+    return [{'id': i, 'title': rnd.choice(SKILLS).title(), 'description': ' '.join(rnd.sample(WORDS, 8)),
+             'skills': rnd.sample(SKILLS, rnd.randint(1, 4)), 'rating': rnd.choice([0, 3.5, 4.8, None]),
+             'verified': rnd.random() < 0.3} for i in range(1, n + 1)]
+
+
+class Post:
+    def __init__(self, title, description):
+        self.title = title
+        self.description = description
+
+
+def keyword_scores(post, rows):
+    text = (post.title + ' ' + post.description).lower()
+    return [score_skills(r['skills'], text) + int(r['rating'] or 0) + (2 if r['verified'] else 0) for r in rows]
+
+
+def main():
+    if not bm25_index.available():
+        sys.exit('bench_scoring.py needs numpy and scipy')
+    rnd = random.Random(7)
+    posts = [Post(' '.join(rnd.sample(WORDS, 4)), ' '.join(rnd.sample(WORDS, 12))) for _ in range(POSTS)]
+    results = []
+    for n in SIZES:
+        rows = make_rows(n, rnd)
+        index = bm25_index.Bm25Index()
+        started = time.perf_counter()
+        index.build_from_rows(rows)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        for post in posts:
+            keyword_scores(post, rows)
+        keyword_ms = (time.perf_counter() - started) * 1000 / POSTS
+
+        started = time.perf_counter()
+        for post in posts:
+            index.top_provider_ids(post, 10)
+        bm25_ms = (time.perf_counter() - started) * 1000 / POSTS
+
+        results.append({'providers': n, 'keyword_ms_per_post': round(keyword_ms, 3),
+                        'bm25_ms_per_post': round(bm25_ms, 3), 'bm25_build_ms': round(build_ms, 1),
+                        'speedup': round(keyword_ms / bm25_ms, 1) if bm25_ms else None})
+
+    if '--json' in sys.argv:
+        print(json.dumps(results))
+        return
+    print(f"{'providers':>10} {'keyword ms':>11} {'bm25 ms':>9} {'build ms':>9} {'speedup':>8}")
+    for r in results:
+        print(f"{r['providers']:>10} {r['keyword_ms_per_post']:>11} {r['bm25_ms_per_post']:>9} "
+              f"{r['bm25_build_ms']:>9} {r['speedup']:>8}")
+
+
+if __name__ == '__main__':
+    main()
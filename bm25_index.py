@@ -0,0 +1,213 @@
+"""Vectorized BM25 scoring of posts against providers.
+
+Providers are tokenized once (skills weighted above title, title above
+description) into a sparse provider x term matrix of BM25 weights. A post
+is scored against every provider with a single sparse matrix-vector
+product, and one provider against all open posts with the transpose. Words
+are matched whole, so "art" no longer matches "smart". The rating and
+verification boosts of the keyword matcher are added on top.
+
+The matrix lives in each process. A commit marks it dirty in the
+committing process; other workers rebuild when they notice the change
+(see match_loader.ProviderVersion and INDEX_CHECK_SECONDS).
+
+Needs NumPy and SciPy (requirements-optional.txt); enable with MATCH_SCORER=bm25.
+"""
+import re
+import threading
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # optional dependency
+    np = None
+    sparse = None
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, Provider, ProviderSkill
+from match_loader import ProviderVersion
+
+# Split on whitespace and punctuation only, so Bangla vowel signs stay inside words
+TOKEN_RE = re.compile(r"[^\s.,;:!?()\[\]{}\"'/\\|+&*#@<>=~`-]+")
+
+# How many times each field counts towards a provider's term frequencies
+FIELD_WEIGHTS = {'skills': 3, 'title': 2, 'description': 1}
+
+K1 = 1.2
+B = 0.75
+
+
+def available():
+    return np is not None and sparse is not None
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+class Bm25Index:
+    """Provider BM25 matrix, rebuilt lazily after committed profile/skill changes."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._dirty = True
+        self.vocab = {}
+        self.matrix = None      # providers x terms, BM25 weights (CSR)
+        self.provider_ids = None
+        self.boosts = None
+        self._row_of = {}
+        self._version = ProviderVersion()
+
+    def configure(self, check_seconds=0):
+        """Look for changes committed by other processes at most every `check_seconds` (0: never)."""
+        self._version = ProviderVersion(check_seconds)
+
+    def mark_dirty(self):
+        self._dirty = True
+
+    # ---- build ----
+    def build(self):
+        """Load provider text and skills from the database and rebuild the matrix."""
+        self._version.mark()
+        skills = {}
+        for provider_id, skill in db.session.query(ProviderSkill.provider_id, ProviderSkill.skill):
+            skills.setdefault(provider_id, []).append(skill)
+        rows = [
+            {'id': pid, 'title': title, 'description': description, 'skills': skills.get(pid, []),
+             'rating': rating, 'verified': verified}
+            for pid, title, description, rating, verified in db.session.query(
+                Provider.id, Provider.title, Provider.description, Provider.rating, Provider.verified
+            ).order_by(Provider.id)
+        ]
+        self.build_from_rows(rows)
+
+    def build_from_rows(self, rows):
+        """Build from dicts with id, title, description, skills, rating and verified."""
+        vocab = {}
+        indptr = [0]
+        indices = []
+        counts = []
+        for row in rows:
+            tf = {}
+            fields = {'skills': ' '.join(row['skills']), 'title': row['title'], 'description': row['description']}
+            for field, text in fields.items():
+                for token in tokenize(text):
+                    col = vocab.setdefault(token, len(vocab))
+                    tf[col] = tf.get(col, 0) + FIELD_WEIGHTS[field]
+            indices.extend(tf.keys())
+            counts.extend(tf.values())
+            indptr.append(len(indices))
+
+        n_docs = len(rows)
+        tf = sparse.csr_matrix((np.asarray(counts, dtype=np.float32), np.asarray(indices, dtype=np.int32),
+                                np.asarray(indptr, dtype=np.int64)), shape=(n_docs, len(vocab)))
+        doc_len = np.asarray(tf.sum(axis=1)).ravel()
+        avg_len = doc_len.mean() if n_docs else 0.0
+        df = np.bincount(tf.indices, minlength=len(vocab))
+        idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        # BM25 term weight per (provider, term), computed on the sparse data in place
+        norm = K1 * (1 - B + B * doc_len / avg_len) if avg_len else np.full(n_docs, K1)
+        row_norm = np.repeat(norm, np.diff(tf.indptr)).astype(np.float32)
+        weights = tf.copy()
+        weights.data = idf[tf.indices] * tf.data * (K1 + 1) / (tf.data + row_norm)
+
+        with self._lock:
+            self.vocab = vocab
+            self.matrix = weights.tocsr()
+            self.provider_ids = np.asarray([r['id'] for r in rows], dtype=np.int64)
+            self.boosts = np.asarray([int(r['rating'] or 0) + (2 if r['verified'] else 0) for r in rows],
+                                     dtype=np.float32)
+            self._row_of = {pid: i for i, pid in enumerate(self.provider_ids.tolist())}
+            self._dirty = False
+
+    def ensure_built(self):
+        if self._dirty or self._version.changed():
+            self.build()
+
+    # ---- scoring ----
+    def query_vector(self, text):
+        """Binary term vector of `text` over the provider vocabulary."""
+        cols = sorted({self.vocab[t] for t in tokenize(text) if t in self.vocab})
+        vec = np.zeros(len(self.vocab), dtype=np.float32)
+        vec[cols] = 1.0
+        return vec
+
+    def query_matrix(self, texts):
+        """Binary texts x terms CSR matrix, built from each text's term ids (no dense rows)."""
+        rows, cols = [], []
+        for i, text in enumerate(texts):
+            ids = {self.vocab[t] for t in tokenize(text) if t in self.vocab}
+            rows.extend([i] * len(ids))
+            cols.extend(ids)
+        data = np.ones(len(cols), dtype=np.float32)
+        return sparse.csr_matrix((data, (rows, cols)), shape=(len(texts), len(self.vocab)))
+
+    def post_text(self, post):
+        return f'{post.title or ""} {post.description or ""}'
+
+    def score_post(self, post):
+        """(provider_ids, scores) of every provider for `post`, as one matrix-vector product."""
+        self.ensure_built()
+        with self._lock:
+            if not len(self.provider_ids):
+                return self.provider_ids, np.zeros(0, dtype=np.float32)
+            scores = self.matrix @ self.query_vector(self.post_text(post)) + self.boosts
+            return self.provider_ids, scores
+
+    def top_provider_ids(self, post, k, allowed=None):
+        """Best `k` (score, provider_id) for a post, among `allowed` ids if given; ties by provider id."""
+        ids, scores = self.score_post(post)
+        if allowed is not None:
+            keep = np.isin(ids, np.fromiter(allowed, dtype=np.int64, count=len(allowed)))
+            ids, scores = ids[keep], scores[keep]
+        return _top(ids, scores, k)
+
+    def score_posts(self, provider_id, posts):
+        """Scores of one provider against many posts (posts x terms matrix times the provider row)."""
+        self.ensure_built()
+        with self._lock:
+            row = self._row_of.get(provider_id)
+            if row is None or not posts:
+                return np.zeros(len(posts), dtype=np.float32)
+            queries = self.query_matrix([self.post_text(p) for p in posts])
+            provider_row = self.matrix.getrow(row).T
+            return (queries @ provider_row).toarray().ravel() + self.boosts[row]
+
+
+def _top(ids, scores, k):
+    if not len(ids):
+        return []
+    if k < len(ids):
+        # everything tied with the k-th best is kept so ties resolve by id
+        kth = -np.partition(-scores, k - 1)[k - 1]
+        picked = np.nonzero(scores >= kth)[0]
+    else:
+        picked = np.arange(len(ids))
+    order = sorted(picked.tolist(), key=lambda i: (-scores[i], ids[i]))[:k]
+    return [(float(scores[i]), int(ids[i])) for i in order]
+
+
+bm25_index = Bm25Index()
+
+
+# Rebuild after any committed change to provider text or skills
+@event.listens_for(Session, 'after_flush')
+def _note_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (Provider, ProviderSkill)):
+            session.info['bm25_dirty'] = True
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    if session.info.pop('bm25_dirty', False):
+        bm25_index.mark_dirty()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_changes(session, previous_transaction):
+    session.info.pop('bm25_dirty', None)
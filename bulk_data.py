@@ -0,0 +1,385 @@
+"""Streaming CSV/JSONL import and export of users, providers, skills, languages, service areas and posts.
+
+Rows flow through generators: the file is read a line at a time, cut into
+batches of `--batch-size` rows and each batch is inserted with one
+executemany; a transaction is committed every `--commit-every` batches.
+Memory use therefore depends on the batch size, not on the file size.
+Exports stream the table in id order the same way.
+
+Columns (a header row for CSV, keys for JSONL; ids are kept so files can
+refer to each other):
+
+    users          id, name, email, password | password_hash, role, location, phone, website, tagline, created_at
+    providers      id, user_id, title, description, location, business_name, verified, rating,
+                   experience_years, hourly_rate, profile_visible, created_at
+    skills         provider_id, skill
+    languages      provider_id, name, position
+    service_areas  provider_id, name, position
+    posts          id, finder_id, title, description, location, budget_min, budget_max, status, created_at
+
+Plain-text passwords are hashed in a process pool, one batch ahead of the
+inserts; exports write the stored hash as password_hash. Finder users get
+their finders row, posts, provider locations and service areas are
+geocoded on the way in. The inserts bypass the ORM events that keep the
+match indexes current, so each committed transaction writes the
+embedding vectors of its providers and posts (MATCH_SCORER=embedding) and
+running workers reload their skill, BM25 and geo indexes within
+INDEX_CHECK_SECONDS. Import users before providers and posts, providers
+before skills, languages and service areas, then run
+rank_matches.py --full. A batch that breaks a constraint (e.g. a
+duplicate email) stops the import with its row numbers; the transactions
+committed before it are kept.
+
+    python bulk_data.py export users users.jsonl.gz
+    python bulk_data.py import users users.csv [--batch-size 1000] [--commit-every 10]
+                                               [--hash-workers N] [--hash-method scrypt]
+"""
+import argparse
+import contextlib
+import csv
+import gzip
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+
+from app import app, db
+from migrations import migrate
+from models import (Finder, Provider, ProviderLanguage, ProviderLocation, ProviderServiceArea, ProviderSkill,
+                    ServicePost, User)
+import geo
+from embeddings import embedding_index
+
+# entity -> (model, file columns); password_hash is stored in users.password
+ENTITIES = {
+    'users': (User, ['id', 'name', 'email', 'password_hash', 'role', 'location', 'phone', 'website', 'tagline',
+                     'created_at']),
+    'providers': (Provider, ['id', 'user_id', 'title', 'description', 'location', 'business_name', 'verified',
+                             'rating', 'experience_years', 'hourly_rate', 'profile_visible', 'created_at']),
+    'skills': (ProviderSkill, ['provider_id', 'skill']),
+    'languages': (ProviderLanguage, ['provider_id', 'name', 'position']),
+    'service_areas': (ProviderServiceArea, ['provider_id', 'name', 'position']),
+    'posts': (ServicePost, ['id', 'finder_id', 'title', 'description', 'location', 'budget_min', 'budget_max',
+                            'status', 'created_at']),
+}
+RENAMED = {'password_hash': 'password'}
+HASH_CHUNK = 64  # passwords per pool task
+TRUE = {'1', 'true', 't', 'yes', 'y'}
+
+
+# ---- files ----
+def file_format(path, fmt=None):
+    """'csv' or 'jsonl', from `fmt` or the file extension (.csv[.gz], anything else is JSONL)."""
+    if fmt:
+        return fmt
+    return 'csv' if path.removesuffix('.gz').endswith('.csv') else 'jsonl'
+
+
+@contextlib.contextmanager
+def open_text(path, mode, stdio):
+    """Text file at `path` (gzip for .gz), or `stdio` for '-'."""
+    if path == '-':
+        yield stdio
+        return
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, mode + 't', encoding='utf-8', newline='') as f:
+        yield f
+
+
+def read_rows(f, fmt):
+    """Dicts from a CSV or JSONL stream, one at a time."""
+    if fmt == 'csv':
+        yield from csv.DictReader(f)
+        return
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def write_rows(f, fmt, fields, rows):
+    """Write dicts to a CSV or JSONL stream; returns the row count."""
+    count = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(f, fields)
+        writer.writeheader()
+    for row in rows:
+        row = {k: v.isoformat() if isinstance(v, datetime) else v for k, v in row.items()}
+        if fmt == 'csv':
+            writer.writerow(row)
+        else:
+            f.write(json.dumps(row, ensure_ascii=False) + '\n')
+        count += 1
+    return count
+
+
+# ---- export ----
+def export_rows(entity, chunk_size=1000):
+    """Rows of `entity` in id order, fetched from the database `chunk_size` at a time."""
+    model, fields = ENTITIES[entity]
+    table = model.__table__
+    query = select(*[table.c[RENAMED.get(f, f)].label(f) for f in fields]).order_by(*table.primary_key.columns)
+    with db.engine.connect() as conn:
+        for row in conn.execution_options(yield_per=chunk_size).execute(query):
+            yield dict(row._mapping)
+
+
+# ---- import ----
+def _coerce(column, value):
+    """A CSV string or JSON value as the column's Python type; '' is None."""
+    if value is None or value == '':
+        return None
+    try:
+        kind = column.type.python_type
+    except NotImplementedError:
+        return value
+    if kind is bool:
+        return value if isinstance(value, bool) else str(value).strip().lower() in TRUE
+    if kind is datetime:
+        return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    if kind in (int, float):
+        return kind(value)
+    return str(value)
+
+
+def _default(column):
+    default = column.default
+    if default is None or not (default.is_scalar or default.is_callable):
+        return None
+    return default.arg(None) if default.is_callable else default.arg
+
+
+def _file_columns(entity, row):
+    """The known columns of a file, from its first row."""
+    _, fields = ENTITIES[entity]
+    accepted = set(fields) | ({'password'} if entity == 'users' else set())
+    unknown = sorted(set(row) - accepted)
+    if unknown:
+        raise ValueError(f"unknown {entity} columns: {', '.join(unknown)} (expected {', '.join(fields)})")
+    return [f for f in fields if f in row]
+
+
+def prepare_rows(entity, rows):
+    """Rows as insert parameters: typed values, column defaults for missing ones, all with the same keys."""
+    model, _ = ENTITIES[entity]
+    table = model.__table__
+    columns = None
+    for raw in rows:
+        if columns is None:
+            columns = _file_columns(entity, raw)
+        row = {}
+        for field in columns:
+            column = table.c[RENAMED.get(field, field)]
+            value = _coerce(column, raw.get(field))
+            if value is None and not column.primary_key:
+                value = _default(column)
+            row[column.name] = value
+        if entity == 'users':
+            row.setdefault('password', None)
+            # hashed later in the pool, unless the file has the hash
+            row['_plain'] = None if row['password'] else raw.get('password') or None
+        elif entity == 'posts':
+            place = geo.geocode(row.get('location'))
+            row['latitude'], row['longitude'] = (place.latitude, place.longitude) if place else (None, None)
+        elif entity in ('languages', 'service_areas'):
+            # the lowercased name the language/area filters match on
+            row['key'] = (row.get('name') or '').strip().lower()
+        yield row
+
+
+def batches(rows, size):
+    """Lists of up to `size` rows."""
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def _hash_all(passwords, method):
+    return [generate_password_hash(pw, method) if method else generate_password_hash(pw) for pw in passwords]
+
+
+def hash_passwords(user_batches, pool, method=None):
+    """Fill in users' password hashes from the pool, submitting the next batch before yielding this one."""
+
+    def submit(batch):
+        plain = [row.pop('_plain') for row in batch]
+        todo = [i for i, pw in enumerate(plain) if pw]
+        parts = [todo[start:start + HASH_CHUNK] for start in range(0, len(todo), HASH_CHUNK)]
+        return batch, [(part, pool.submit(_hash_all, [plain[i] for i in part], method)) for part in parts]
+
+    def finish(batch, jobs):
+        for part, future in jobs:
+            for i, hashed in zip(part, future.result()):
+                batch[i]['password'] = hashed
+        return batch
+
+    pending = None
+    for batch in user_batches:
+        current = submit(batch)
+        if pending is not None:
+            yield finish(*pending)
+        pending = current
+    if pending is not None:
+        yield finish(*pending)
+
+
+def _add_finders(conn, batch):
+    # the finders row register() creates for finder accounts
+    users, finders = User.__table__, Finder.__table__
+    emails = [row['email'] for row in batch if row.get('role') == 'finder']
+    if emails:
+        conn.execute(insert(finders).from_select(
+            ['user_id', 'location', 'created_at', 'updated_at'],
+            select(users.c.id, users.c.location, users.c.created_at, users.c.created_at)
+            .where(users.c.email.in_(emails), users.c.role == 'finder')))
+
+
+def _add_locations(conn, batch):
+    # base locations for the geo filter; service areas are not part of the file
+    providers = Provider.__table__
+    places = {row['user_id']: geo.geocode(row.get('location')) for row in batch}
+    ids = conn.execute(select(providers.c.id, providers.c.user_id)
+                       .where(providers.c.user_id.in_([uid for uid, place in places.items() if place])))
+    rows = [{'provider_id': pid, 'kind': 'base', 'place': places[uid].name, 'latitude': places[uid].latitude,
+             'longitude': places[uid].longitude, 'reach_km': 0.0} for pid, uid in ids]
+    if rows:
+        conn.execute(insert(ProviderLocation.__table__), rows)
+
+
+def _add_area_locations(conn, batch):
+    # geo points of the new service areas, one per provider and place
+    locations = ProviderLocation.__table__
+    provider_ids = {row['provider_id'] for row in batch}
+    seen = set(conn.execute(select(locations.c.provider_id, locations.c.place)
+                            .where(locations.c.provider_id.in_(provider_ids), locations.c.kind == 'area')))
+    rows = []
+    for row in batch:
+        place = geo.geocode(row.get('name'))
+        if place and (row['provider_id'], place.name) not in seen:
+            seen.add((row['provider_id'], place.name))
+            rows.append({'provider_id': row['provider_id'], 'kind': 'area', 'place': place.name,
+                         'latitude': place.latitude, 'longitude': place.longitude,
+                         'reach_km': geo.REACH_KM.get(place.kind, 0.0)})
+    if rows:
+        conn.execute(insert(locations), rows)
+
+
+AFTER_INSERT = {'users': _add_finders, 'providers': _add_locations, 'service_areas': _add_area_locations}
+
+
+def _insert(conn, table, batch):
+    """Insert a batch; returns the new ids when the database reports them (else those given in the file)."""
+    if conn.dialect.insert_executemany_returning:
+        return conn.execute(insert(table).returning(table.c.id), batch).scalars().all()
+    conn.execute(insert(table), batch)
+    return [row['id'] for row in batch if row.get('id') is not None]
+
+
+def _index_changes(entity, batch, ids):
+    """(provider ids, post ids) whose vectors or geo points a batch changed."""
+    if entity == 'providers':
+        return set(ids), set()
+    if entity in ('skills', 'service_areas'):
+        return {row['provider_id'] for row in batch}, set()
+    if entity == 'posts':
+        return set(), set(ids)
+    return set(), set()
+
+
+def _refresh_indexes(provider_ids, post_ids):
+    # what the after_commit events would have done for ORM writes
+    embedding_index.refresh(provider_ids, post_ids)
+    geo.geo_index.refresh(provider_ids)
+
+
+def _batch_error(entity, n, batch, start, error, committed):
+    """The message for a batch the database refused, without its values (they include password hashes)."""
+    where = f'{entity} batch {n} (rows {start}-{start + len(batch) - 1}'
+    ids = [row.get('id') for row in batch]
+    if None not in ids:
+        where += f', ids {min(ids)}-{max(ids)}'
+    reason = str(getattr(error, 'orig', error)).splitlines()[0]
+    return f'{where}) was not imported: {reason}. {committed} rows committed before it are kept.'
+
+
+def import_rows(entity, rows, batch_size=1000, commit_every=10, hash_workers=None, hash_method=None):
+    """Insert `rows` (dicts with the file columns) in batches; returns the number inserted."""
+    model, _ = ENTITIES[entity]
+    table = model.__table__
+    pending = batches(prepare_rows(entity, rows), batch_size)
+    pool = None
+    if entity == 'users':
+        pool = ProcessPoolExecutor(hash_workers or os.cpu_count())
+        pending = hash_passwords(pending, pool, hash_method)
+    after_insert = AFTER_INSERT.get(entity)
+    if embedding_index.enabled:
+        embedding_index.ensure_built()
+    total = committed = 0
+    changed_providers, changed_posts = set(), set()
+    try:
+        with db.engine.connect() as conn:
+            transaction = conn.begin()
+            for n, batch in enumerate(pending, 1):
+                try:
+                    ids = _insert(conn, table, batch)
+                    if after_insert:
+                        after_insert(conn, batch)
+                except IntegrityError as e:
+                    transaction.rollback()
+                    raise ValueError(_batch_error(entity, n, batch, total + 1, e, committed)) from None
+                providers, posts = _index_changes(entity, batch, ids)
+                changed_providers |= providers
+                changed_posts |= posts
+                total += len(batch)
+                if n % commit_every == 0:
+                    transaction.commit()
+                    committed = total
+                    _refresh_indexes(changed_providers, changed_posts)
+                    changed_providers, changed_posts = set(), set()
+                    transaction = conn.begin()
+            transaction.commit()
+            _refresh_indexes(changed_providers, changed_posts)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['import', 'export'])
+    parser.add_argument('entity', choices=sorted(ENTITIES))
+    parser.add_argument('path', help="file to read or write, '-' for stdin/stdout, .gz is compressed")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='default: from the file extension')
+    parser.add_argument('--batch-size', type=int, default=1000, help='rows per insert or fetch')
+    parser.add_argument('--commit-every', type=int, default=10, help='batches per transaction')
+    parser.add_argument('--hash-workers', type=int, default=None, help='password hashing processes')
+    parser.add_argument('--hash-method', default=None, help="werkzeug hash method (default: werkzeug's)")
+    args = parser.parse_args()
+    fmt = file_format(args.path, args.format)
+    stdout = sys.stdout
+    started = datetime.utcnow()
+    # progress goes to stderr so '-' can stream data on stdout
+    with contextlib.redirect_stdout(sys.stderr), app.app_context():
+        migrate(db)
+        if args.command == 'export':
+            with open_text(args.path, 'w', stdout) as f:
+                count = write_rows(f, fmt, ENTITIES[args.entity][1], export_rows(args.entity, args.batch_size))
+        else:
+            with open_text(args.path, 'r', sys.stdin) as f:
+                try:
+                    count = import_rows(args.entity, read_rows(f, fmt), args.batch_size, args.commit_every,
+                                        args.hash_workers, args.hash_method)
+                except ValueError as e:
+                    parser.error(str(e))
+        took = (datetime.utcnow() - started).total_seconds()
+        print(f"{args.command.capitalize()}ed {count} {args.entity} in {took:.1f}s.")
+
+
+if __name__ == '__main__':
+    main()
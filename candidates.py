@@ -0,0 +1,87 @@
+"""Two-stage retrieval for AI matching.
+
+Stage one shortlists candidates with a cheap local scorer (skill overlap,
+location and budget fit) so stage two only sends the best N to Gemini, and
+only as many of them as fit in the prompt budget.
+"""
+import logging
+import re
+import time
+
+import match_store
+from ranking import top_k
+from telemetry import span
+
+log = logging.getLogger('servease.matching')
+
+# Location words that match nearly everyone and say nothing about distance
+GENERIC_PLACES = {'bangladesh', 'bd', 'city', 'district', 'division', 'area'}
+
+# Rough chars-per-token ratio used to turn a token budget into characters
+CHARS_PER_TOKEN = 4
+
+
+def place_tokens(text):
+    """Lowercased place words of a free-text location, without generic ones."""
+    return {t for t in re.split(r'[\s,/;|-]+', (text or '').lower()) if t and t not in GENERIC_PLACES}
+
+
+def provider_places(provider):
+    """Place words of a provider's location and service areas."""
+    places = place_tokens(provider.location)
+    for area in provider.service_areas:
+        places |= place_tokens(area.name)
+    return places
+
+
+def location_score(post, provider):
+    """2 when the post's location overlaps the provider's location or service areas."""
+    wanted = place_tokens(post.location)
+    if wanted and wanted & provider_places(provider):
+        return 2
+    return 0
+
+
+def budget_score(post, provider):
+    """1 when the provider's hourly rate fits under the post's maximum budget."""
+    if post.budget_max and provider.hourly_rate and provider.hourly_rate <= post.budget_max:
+        return 1
+    return 0
+
+
+def shortlist_providers(post, n, method='keyword'):
+    """
+    Stage one: the `n` best providers for `post` by local score (keyword or
+    BM25) plus location and budget fit, best first. Only candidates from the
+    local scorer's index are considered.
+    """
+    started = time.perf_counter()
+    with span('scoring'):
+        pool = match_store.local_matches(post, method)
+        scored = [(score + location_score(post, p) + budget_score(post, p), p) for score, p in pool]
+        shortlist = top_k(scored, n, tiebreak=lambda p: p.id)
+    log.info('match stage=shortlist post=%s candidates=%d shortlisted=%d ms=%.1f',
+             post.id, len(pool), len(shortlist), (time.perf_counter() - started) * 1000)
+    return [p for score, p in shortlist]
+
+
+def fit_lines(lines, max_chars):
+    """
+    Leading `lines` whose joined length stays within `max_chars`
+    (at least one line is always kept so the model has something to rank).
+    """
+    kept = []
+    used = 0
+    for line in lines:
+        cost = len(line) + 1
+        if kept and used + cost > max_chars:
+            break
+        kept.append(line)
+        used += cost
+    return kept
+
+
+def prompt_char_budget(max_chars=None, max_tokens=None):
+    """Character budget for candidate lines from a char and/or token limit (smallest wins)."""
+    limits = [x for x in (max_chars, (max_tokens or 0) * CHARS_PER_TOKEN) if x]
+    return min(limits) if limits else None
@@ -0,0 +1,94 @@
+"""Database URI, pool and SQLite tuning from the environment.
+
+    DATABASE_URL            SQLAlchemy URI (default sqlite:///servease.db, in the instance folder)
+    DB_POOL_SIZE            PostgreSQL/MySQL QueuePool size (default 5)
+    DB_MAX_OVERFLOW         extra connections above the pool size (default 10)
+    DB_POOL_TIMEOUT         seconds to wait for a pooled connection (default 30)
+    DB_POOL_RECYCLE         seconds before a connection is replaced (default 1800)
+    SQLITE_TUNING           '0' keeps SQLite's defaults (default '1')
+    SQLITE_JOURNAL_MODE     default WAL: readers no longer block the writer
+    SQLITE_SYNCHRONOUS      default NORMAL: fsync at checkpoints only, safe with WAL
+    SQLITE_BUSY_TIMEOUT_MS  wait this long for a lock instead of failing (default 5000)
+    SQLITE_MMAP_SIZE        bytes of the file to memory-map (default 256 MiB)
+    SQLITE_CACHE_SIZE       page cache, negative = KiB (default -65536, i.e. 64 MiB)
+
+SQLite settings are applied with PRAGMAs on every new connection.
+"""
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+DEFAULT_URI = 'sqlite:///servease.db'
+
+
+def _int(env, name, default):
+    return int(env.get(name, default))
+
+
+def database_uri(env=os.environ):
+    uri = env.get('DATABASE_URL', DEFAULT_URI)
+    # Heroku-style URLs still say postgres://, which SQLAlchemy no longer accepts
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def sqlite_settings(env=os.environ):
+    """PRAGMA name -> value to run on each SQLite connection ({} when tuning is off)."""
+    if env.get('SQLITE_TUNING', '1') == '0':
+        return {}
+    return {
+        'journal_mode': env.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': env.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': _int(env, 'SQLITE_BUSY_TIMEOUT_MS', 5000),
+        'mmap_size': _int(env, 'SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+        'cache_size': _int(env, 'SQLITE_CACHE_SIZE', -65536),
+        'temp_store': 'MEMORY',
+    }
+
+
+def engine_options(uri, env=os.environ):
+    """create_engine() keyword arguments for `uri` (SQLALCHEMY_ENGINE_OPTIONS)."""
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite':
+        # the driver's own lock wait, in seconds (sqlite3 default is 5)
+        return {'connect_args': {'timeout': _int(env, 'SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000}}
+    return {
+        'pool_size': _int(env, 'DB_POOL_SIZE', 5),
+        'max_overflow': _int(env, 'DB_MAX_OVERFLOW', 10),
+        'pool_timeout': _int(env, 'DB_POOL_TIMEOUT', 30),
+        'pool_recycle': _int(env, 'DB_POOL_RECYCLE', 1800),
+        # drop connections the server closed while they sat in the pool
+        'pool_pre_ping': True,
+    }
+
+
+def install_pragmas(engine, settings):
+    """Run the SQLite `settings` PRAGMAs on every connection `engine` opens."""
+    if engine.dialect.name != 'sqlite' or not settings:
+        return
+    in_memory = engine.url.database in (None, '', ':memory:')
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_conn, connection_record):
+        cursor = dbapi_conn.cursor()
+        for name, value in settings.items():
+            if in_memory and name in ('journal_mode', 'mmap_size'):
+                continue
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+
+
+def configure(app, env=os.environ):
+    """Set the URI and engine options on `app` before db.init_app(app)."""
+    uri = database_uri(env)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(uri, env)
+    app.config['SQLITE_PRAGMAS'] = sqlite_settings(env)
+
+
+def tune_engine(app, db):
+    """Attach the connect-time PRAGMAs to the app's engine, after db.init_app(app)."""
+    with app.app_context():
+        install_pragmas(db.engine, app.config.get('SQLITE_PRAGMAS', {}))
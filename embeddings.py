@@ -0,0 +1,329 @@
+"""Local semantic matching with hashed n-gram embeddings.
+
+Providers (skills, title, description) and posts (title, description) are
+embedded on the CPU with signed feature hashing of words and character
+trigrams, so no model download or network call is needed and matching
+works offline. Vectors are L2-normalized float32 rows in flat files that
+are memory-mapped on first use; a match is a brute-force dot product over
+the mapped rows. Vectors are written after each committed change to a
+provider, skill or post.
+
+The files are shared by all workers: each process writes the rows of its
+own commits, appends are serialized with a file lock, and readers re-map
+when the files grow and skip rows another process has tombstoned, so
+every worker sees the others' changes.
+
+Needs NumPy (requirements-optional.txt); enable with MATCH_SCORER=embedding.
+"""
+import os
+import re
+import threading
+import zlib
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: no lock, run a single worker
+    fcntl = None
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from models import db, Provider, ProviderSkill, ServicePost
+
+TOKEN_RE = re.compile(r"[^\s.,;:!?()\[\]{}\"'/\\|+&*#@<>=~`-]+")
+DEFAULT_DIM = 256
+# Cosine similarity is scaled to sit alongside the rating/verification boost
+SCORE_SCALE = 10
+
+
+def available():
+    return np is not None
+
+
+def _features(text):
+    for word in TOKEN_RE.findall((text or '').lower()):
+        yield 'w:' + word, 1.0
+        padded = f'<{word}>'
+        for i in range(len(padded) - 2):
+            yield 't:' + padded[i:i + 3], 0.5
+
+
+def embed(text, dim=DEFAULT_DIM):
+    """Signed hashed bag of words + character trigrams, L2-normalized float32."""
+    vec = np.zeros(dim, dtype=np.float32)
+    for feature, weight in _features(text):
+        h = zlib.crc32(feature.encode('utf-8'))
+        vec[h % dim] += weight if (h >> 31) & 1 else -weight
+    norm = np.linalg.norm(vec)
+    if norm:
+        vec /= norm
+    return vec
+
+
+def provider_text(title, description, skills):
+    # skills are repeated so they outweigh free text
+    return ' '.join([' '.join(skills)] * 2 + [title or '', description or ''])
+
+
+def post_text(title, description):
+    return f'{title or ""} {description or ""}'
+
+
+class VectorStore:
+    """
+    Append-only float32 matrix file (`<name>.f32`) with a parallel int64 id
+    file (`<name>.ids`). Updating an id rewrites its row in place; deleting
+    it tombstones the id as -1. Files are memory-mapped and re-mapped when
+    another process has grown them.
+    """
+
+    def __init__(self, directory, name, dim=DEFAULT_DIM):
+        self.dim = dim
+        self.vec_path = os.path.join(directory, f'{name}.f32')
+        self.id_path = os.path.join(directory, f'{name}.ids')
+        self._lock = threading.RLock()
+        self._size = -1
+        self._vectors = None
+        self._ids = None
+        self._row_of = {}
+
+    def exists(self):
+        return os.path.exists(self.vec_path) and os.path.exists(self.id_path)
+
+    def _map(self):
+        size = os.path.getsize(self.id_path) if os.path.exists(self.id_path) else 0
+        if size == self._size:
+            return
+        rows = size // 8
+        if rows:
+            self._ids = np.memmap(self.id_path, dtype=np.int64, mode='r+', shape=(rows,))
+            self._vectors = np.memmap(self.vec_path, dtype=np.float32, mode='r+', shape=(rows, self.dim))
+        else:
+            self._ids = np.zeros(0, dtype=np.int64)
+            self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self._row_of = {int(obj_id): i for i, obj_id in enumerate(self._ids.tolist()) if obj_id >= 0}
+        self._size = size
+
+    def reset(self, items):
+        """Rewrite both files from (id, vector) pairs."""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.vec_path), exist_ok=True)
+            items = list(items)
+            ids = np.asarray([i for i, _ in items], dtype=np.int64)
+            vectors = np.vstack([v for _, v in items]).astype(np.float32) if items else np.zeros((0, self.dim), np.float32)
+            vectors.tofile(self.vec_path)
+            ids.tofile(self.id_path)
+            self._size = -1
+            self._map()
+
+    def put(self, obj_id, vector):
+        with self._lock:
+            self._map()
+            if self._overwrite(obj_id, vector):
+                return
+            # the file lock keeps other processes' appends from interleaving between the two
+            # files, and from appending the same id: check again once it is held
+            with open(self.vec_path, 'ab') as vec_file, open(self.id_path, 'ab') as id_file:
+                if fcntl is not None:
+                    fcntl.flock(id_file, fcntl.LOCK_EX)
+                self._map()
+                if not self._overwrite(obj_id, vector):
+                    # vectors first, so a reader never sees an id without its row
+                    vec_file.write(np.asarray(vector, dtype=np.float32).tobytes())
+                    vec_file.flush()
+                    id_file.write(np.asarray([obj_id], dtype=np.int64).tobytes())
+            self._map()
+
+    def _overwrite(self, obj_id, vector):
+        row = self._row(obj_id)
+        if row is None:
+            return False
+        self._vectors[row] = vector
+        self._vectors.flush()
+        return True
+
+    def delete(self, obj_id):
+        with self._lock:
+            self._map()
+            row = self._row_of.pop(obj_id, None)
+            if row is not None:
+                self._ids[row] = -1
+                self._ids.flush()
+
+    def _row(self, obj_id):
+        # another process may have tombstoned the row since it was mapped
+        row = self._row_of.get(obj_id)
+        return row if row is not None and self._ids[row] == obj_id else None
+
+    def get(self, obj_id):
+        with self._lock:
+            self._map()
+            row = self._row(obj_id)
+            return None if row is None else np.array(self._vectors[row])
+
+    def search(self, query, k, allowed=None):
+        """Best `k` (similarity, id) by dot product with `query`, among `allowed` ids if given; ties by id."""
+        with self._lock:
+            self._map()
+            if not len(self._ids):
+                return []
+            scores = np.asarray(self._vectors @ query)
+            scores[self._ids < 0] = -np.inf
+            if allowed is not None:
+                scores[~np.isin(self._ids, np.fromiter(allowed, dtype=np.int64, count=len(allowed)))] = -np.inf
+            return _top(self._ids, scores, k)
+
+    def similarities(self, query, obj_ids):
+        """Dot products of `query` with the vectors of `obj_ids` (0 when missing)."""
+        with self._lock:
+            self._map()
+            rows = [self._row(i) for i in obj_ids]
+            return [0.0 if row is None else float(self._vectors[row] @ query) for row in rows]
+
+
+def _top(ids, scores, k):
+    live = np.isfinite(scores)
+    n = int(live.sum())
+    if not n:
+        return []
+    k = min(k, n)
+    if k < len(ids):
+        kth = -np.partition(-scores, k - 1)[k - 1]
+        picked = np.nonzero(scores >= kth)[0]
+    else:
+        picked = np.nonzero(live)[0]
+    order = sorted(picked.tolist(), key=lambda i: (-scores[i], ids[i]))[:k]
+    return [(float(scores[i]), int(ids[i])) for i in order]
+
+
+class EmbeddingIndex:
+    """Provider and post vector stores kept current from committed changes."""
+
+    def __init__(self):
+        self.enabled = False
+        self.dim = DEFAULT_DIM
+        self.providers = None
+        self.posts = None
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def configure(self, directory, dim=DEFAULT_DIM, enabled=True):
+        self.dim = dim
+        self.providers = VectorStore(directory, 'providers', dim)
+        self.posts = VectorStore(directory, 'posts', dim)
+        self.enabled = enabled and available()
+        self._ready = False
+
+    def embed(self, text):
+        return embed(text, self.dim)
+
+    def ensure_built(self):
+        """Embed every provider and post once if the vector files do not exist yet."""
+        if self._ready:
+            return
+        with self._lock:
+            if self._ready:
+                return
+            if not (self.providers.exists() and self.posts.exists()):
+                with db.engine.connect() as conn:
+                    self.providers.reset(self._provider_vectors(conn))
+                    self.posts.reset(self._post_vectors(conn))
+            self._ready = True
+
+    def _provider_vectors(self, conn, ids=None):
+        skills = {}
+        q = select(ProviderSkill.provider_id, ProviderSkill.skill)
+        if ids is not None:
+            q = q.where(ProviderSkill.provider_id.in_(ids))
+        for provider_id, skill in conn.execute(q):
+            skills.setdefault(provider_id, []).append(skill)
+        q = select(Provider.id, Provider.title, Provider.description)
+        if ids is not None:
+            q = q.where(Provider.id.in_(ids))
+        for pid, title, description in conn.execute(q):
+            yield pid, self.embed(provider_text(title, description, skills.get(pid, [])))
+
+    def _post_vectors(self, conn, ids=None):
+        # only open posts are matched; refresh() drops the vectors of posts closed since
+        q = select(ServicePost.id, ServicePost.title, ServicePost.description).where(ServicePost.status == 'open')
+        if ids is not None:
+            q = q.where(ServicePost.id.in_(ids))
+        for pid, title, description in conn.execute(q):
+            yield pid, self.embed(post_text(title, description))
+
+    def refresh(self, provider_ids=(), post_ids=()):
+        """Re-embed (or drop, if gone) the given providers and posts."""
+        if not self.enabled or not self._ready:
+            return
+        with db.engine.connect() as conn:
+            if provider_ids:
+                seen = set()
+                for pid, vec in self._provider_vectors(conn, list(provider_ids)):
+                    self.providers.put(pid, vec)
+                    seen.add(pid)
+                for pid in set(provider_ids) - seen:
+                    self.providers.delete(pid)
+            if post_ids:
+                seen = set()
+                for pid, vec in self._post_vectors(conn, list(post_ids)):
+                    self.posts.put(pid, vec)
+                    seen.add(pid)
+                for pid in set(post_ids) - seen:
+                    self.posts.delete(pid)
+
+    # ---- queries ----
+    def top_provider_ids(self, text, k, allowed=None):
+        """Best `k` (similarity, provider_id) for a post's text, among `allowed` ids if given."""
+        self.ensure_built()
+        return self.providers.search(self.embed(text), k, allowed)
+
+    def top_post_ids(self, provider_id, k):
+        """Best `k` (similarity, post_id) for a provider's stored vector."""
+        self.ensure_built()
+        vec = self.providers.get(provider_id)
+        return [] if vec is None else self.posts.search(vec, k)
+
+    def provider_post_similarities(self, provider_id, post_ids):
+        self.ensure_built()
+        vec = self.providers.get(provider_id)
+        if vec is None:
+            return [0.0] * len(post_ids)
+        return self.posts.similarities(vec, post_ids)
+
+
+embedding_index = EmbeddingIndex()
+
+
+# Collect changed providers/posts per flush, re-embed them once committed
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    if not embedding_index.enabled:
+        return
+    providers = session.info.setdefault('embed_providers', set())
+    posts = session.info.setdefault('embed_posts', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Provider):
+            providers.add(obj.id)
+        elif isinstance(obj, ProviderSkill):
+            providers.add(obj.provider_id)
+        elif isinstance(obj, ServicePost):
+            posts.add(obj.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    providers = session.info.pop('embed_providers', None)
+    posts = session.info.pop('embed_posts', None)
+    if providers or posts:
+        embedding_index.refresh(providers or (), posts or ())
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_changes(session, previous_transaction):
+    session.info.pop('embed_providers', None)
+    session.info.pop('embed_posts', None)
@@ -0,0 +1,128 @@
+"""A fake Gemini for tests, benchmarks and local development.
+
+FakeModel answers ranking prompts in-process: it orders the candidate IDs
+("ID <n>: ...") by the words they share with the text above them. It can
+add latency and fail a share of calls, both deterministic for a seed.
+
+FakeModelServer serves the same model over HTTP as the Gemini REST
+endpoint (POST /v1beta/models/<name>:generateContent); point the app at it
+with GEMINI_BASE_URL. Failed calls answer 503.
+
+    python fake_model.py [--port 8089] [--latency-ms 0] [--fail-rate 0]
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+LINE_RE = re.compile(r'^ID (\d+): (.*)$', re.MULTILINE)
+WORD_RE = re.compile(r'\w+')
+
+
+def rank_prompt(prompt):
+    """Comma-separated candidate IDs of a ranking prompt, most shared words first."""
+    candidates = LINE_RE.findall(prompt)
+    head = prompt[:prompt.find('ID ')] if candidates else prompt
+    words = set(WORD_RE.findall(head.lower()))
+    ranked = sorted(candidates, key=lambda c: (-len(words & set(WORD_RE.findall(c[1].lower()))), int(c[0])))
+    return ','.join(cid for cid, _ in ranked)
+
+
+class FakeModel:
+    """generate_content like the Gemini SDK, after `latency_ms`, failing `fail_rate` of the calls."""
+
+    def __init__(self, latency_ms=0, fail_rate=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.fail_rate = fail_rate
+        self.calls = 0
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, **options):
+        with self._lock:
+            self.calls += 1
+            fail = self._rnd.random() < self.fail_rate
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        if fail:
+            raise RuntimeError('fake model failure')
+        return SimpleNamespace(text=rank_prompt(prompt))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if not self.path.split('?')[0].endswith(':generateContent'):
+            return self._send(404, {'error': {'code': 404, 'message': 'not found'}})
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        prompt = ''.join(p.get('text', '') for c in body.get('contents', []) for p in c.get('parts', []))
+        try:
+            text = self.server.model.generate_content(prompt).text
+        except Exception as e:
+            return self._send(503, {'error': {'code': 503, 'message': str(e)}})
+        self._send(200, {'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}}]})
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeModelServer:
+    """FakeModel behind a local HTTP server; port 0 picks a free one. Usable as a context manager."""
+
+    def __init__(self, model=None, host='127.0.0.1', port=0):
+        self.model = model or FakeModel()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.model = self.model
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name='fake-model')
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--fail-rate', type=float, default=0)
+    args = parser.parse_args()
+    server = FakeModelServer(FakeModel(args.latency_ms, args.fail_rate), port=args.port)
+    print(f'Fake Gemini at {server.base_url} (GEMINI_BASE_URL={server.base_url})')
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == '__main__':
+    main()
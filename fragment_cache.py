@@ -0,0 +1,78 @@
+"""Cache of rendered HTML fragments.
+
+Keys carry the version of the data they were rendered from (row
+timestamps), so an edit changes the key and stale HTML is never served;
+entries are also tagged (e.g. 'user:7') so commits can drop them right
+away instead of leaving them to the LRU. Uses llm_cache's in-process
+TTL + LRU backend.
+"""
+import threading
+import time
+
+from llm_cache import MemoryBackend
+
+
+class FragmentCache:
+    """TTL + LRU store of rendered fragments with hit/miss counters."""
+
+    def __init__(self, ttl=600, max_entries=1000):
+        self._lock = threading.Lock()
+        self.configure(ttl, max_entries)
+
+    def configure(self, ttl=600, max_entries=1000):
+        """A TTL of 0 turns the cache off."""
+        with self._lock:
+            self.ttl = ttl
+            self.backend = MemoryBackend(max_entries)
+            self.hits = 0
+            self.misses = 0
+            self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def get(self, key):
+        with self._lock:
+            html = self.backend.get(key, time.time())
+            if html is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return html
+
+    def set(self, key, html, tags=(), ttl=None):
+        with self._lock:
+            self.backend.set(key, html, time.time() + (ttl or self.ttl), list(tags))
+
+    def get_or_render(self, key, render, tags=(), ttl=None):
+        """Cached HTML for `key`, calling `render()` and storing the result on a miss."""
+        if not self.enabled:
+            return render()
+        html = self.get(key)
+        if html is None:
+            html = render()
+            self.set(key, html, tags, ttl)
+        return html
+
+    def invalidate(self, tag):
+        with self._lock:
+            self.invalidations += self.backend.invalidate(tag)
+
+    def clear(self):
+        with self._lock:
+            self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / total) if total else 0.0,
+                'invalidations': self.invalidations,
+                'entries': len(self.backend),
+            }
+
+
+fragment_cache = FragmentCache()
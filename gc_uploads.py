@@ -0,0 +1,7 @@
+from app import app
+from storage import collect_garbage
+
+with app.app_context():
+    # Delete uploads that nothing has referenced for UPLOAD_GC_GRACE seconds
+    deleted = collect_garbage(app.config['UPLOAD_GC_GRACE'])
+    print(f"Deleted {deleted} unreferenced uploads.")
@@ -0,0 +1,308 @@
+"""Geocoding and radius search for matching.
+
+Free-text locations (provider, user and post locations, provider service
+areas) are resolved against a bundled gazetteer of Bangladesh districts
+and city thanas (data/bd_gazetteer.csv, English and Bangla names). Posts
+keep their coordinates in latitude/longitude columns; providers get one
+provider_locations row for their base location and one per service area.
+
+Provider points sit in a grid of GEO_CELL_DEG cells, so finding the
+providers within a radius of a post, or serving an area that covers it,
+only visits the cells around the post. The grid is kept current from
+committed changes like the other match indexes, and reloaded when another
+process (a worker, bulk_data.py) has changed providers or their locations
+(see match_loader.ProviderVersion and INDEX_CHECK_SECONDS).
+"""
+import csv
+import math
+import os
+import re
+import threading
+from collections import namedtuple
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from models import db, Provider, ProviderLocation, ProviderServiceArea, ServicePost, User
+from match_loader import ProviderVersion
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'bd_gazetteer.csv')
+
+# How far from its centre a service area counts as covered
+REACH_KM = {'district': 25.0, 'thana': 5.0}
+# More specific places win when a location names several ("Mirpur, Dhaka")
+KIND_RANK = {'thana': 0, 'district': 1}
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG = 111.2
+GEO_CELL_DEG = 0.25
+
+Place = namedtuple('Place', 'name kind district latitude longitude')
+
+
+def normalize(text):
+    text = (text or '').lower().replace("'", '').replace('’', '')
+    return ' '.join(re.split(r"[\s.,;:!?()\[\]{}\"/\\|+&*#@<>=~`-]+", text)).strip()
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+class Gazetteer:
+    """Place names and aliases from the bundled CSV, matched as whole words."""
+
+    def __init__(self, path=GAZETTEER_PATH):
+        self.path = path
+        self._aliases = None
+
+    def _load(self):
+        aliases = []
+        with open(self.path, encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                place = Place(row['name'], row['kind'], row['district'],
+                              float(row['latitude']), float(row['longitude']))
+                for alias in [row['name']] + row['aliases'].split('|'):
+                    alias = normalize(alias)
+                    if alias:
+                        aliases.append((f' {alias} ', place))
+        # thanas before districts, longer names before shorter ones
+        aliases.sort(key=lambda a: (KIND_RANK.get(a[1].kind, 9), -len(a[0])))
+        self._aliases = aliases
+
+    def lookup(self, text):
+        """The most specific Place named in `text`, or None."""
+        if self._aliases is None:
+            self._load()
+        padded = f' {normalize(text)} '
+        if not padded.strip():
+            return None
+        for alias, place in self._aliases:
+            if alias in padded:
+                return place
+        return None
+
+
+gazetteer = Gazetteer()
+
+
+def geocode(text):
+    return gazetteer.lookup(text)
+
+
+def provider_points(provider):
+    """ProviderLocation rows for a provider's base location (or its user's) and service areas."""
+    rows = []
+    base = geocode(provider.location) or (geocode(provider.user.location) if provider.user else None)
+    if base:
+        rows.append(ProviderLocation(kind='base', place=base.name, latitude=base.latitude,
+                                     longitude=base.longitude, reach_km=0.0))
+    seen = set()
+    for area in provider.service_areas:
+        place = geocode(area.name)
+        if place and place.name not in seen:
+            seen.add(place.name)
+            rows.append(ProviderLocation(kind='area', place=place.name, latitude=place.latitude,
+                                         longitude=place.longitude, reach_km=REACH_KM.get(place.kind, 0.0)))
+    return rows
+
+
+def geocode_post(post):
+    place = geocode(post.location)
+    post.latitude, post.longitude = (place.latitude, place.longitude) if place else (None, None)
+
+
+class GridIndex:
+    """Provider points bucketed by (lat, lon) cell."""
+
+    def __init__(self, cell_deg=GEO_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.cells = {}    # (row, col) -> {provider_id: [(lat, lon, reach_km)]}
+        self.points = {}   # provider_id -> [(lat, lon, reach_km)]
+        self.max_reach = 0.0
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def add(self, provider_id, lat, lon, reach_km=0.0):
+        point = (lat, lon, reach_km or 0.0)
+        self.points.setdefault(provider_id, []).append(point)
+        self.cells.setdefault(self._cell(lat, lon), {}).setdefault(provider_id, []).append(point)
+        self.max_reach = max(self.max_reach, point[2])
+
+    def remove(self, provider_id):
+        for lat, lon, _ in self.points.pop(provider_id, ()):
+            cell = self.cells.get(self._cell(lat, lon))
+            if cell is not None:
+                cell.pop(provider_id, None)
+                if not cell:
+                    del self.cells[self._cell(lat, lon)]
+
+    @staticmethod
+    def _hit(point, lat, lon, radius_km):
+        # base points count within the radius, service areas when they reach the spot
+        p_lat, p_lon, reach = point
+        return haversine_km(lat, lon, p_lat, p_lon) <= (reach if reach else radius_km)
+
+    def near(self, lat, lon, radius_km):
+        """Provider ids with a base point within `radius_km` or a service area covering (lat, lon)."""
+        span = max(radius_km, self.max_reach)
+        d_lat = span / KM_PER_DEG
+        d_lon = span / (KM_PER_DEG * max(math.cos(math.radians(lat)), 0.01))
+        row0, col0 = self._cell(lat - d_lat, lon - d_lon)
+        row1, col1 = self._cell(lat + d_lat, lon + d_lon)
+        found = set()
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                for provider_id, points in self.cells.get((row, col), {}).items():
+                    if provider_id not in found and any(self._hit(p, lat, lon, radius_km) for p in points):
+                        found.add(provider_id)
+        return found
+
+    def covers(self, provider_id, lat, lon, radius_km):
+        return any(self._hit(p, lat, lon, radius_km) for p in self.points.get(provider_id, ()))
+
+
+class GeoIndex:
+    """
+    Grid of provider_locations, loaded lazily and refreshed per committed
+    provider. Providers without any geocoded point are kept apart in
+    `unlocated`: the filter cannot place them, so it never drops them.
+    """
+
+    def __init__(self):
+        self.radius_km = 0.0
+        self.grid = GridIndex()
+        self.unlocated = set()
+        self._lock = threading.RLock()
+        self._ready = False
+        self._version = ProviderVersion()
+
+    def configure(self, radius_km, cell_deg=GEO_CELL_DEG, check_seconds=0):
+        """`check_seconds`: look for changes committed by other processes that often (0: never)."""
+        self.radius_km = radius_km
+        with self._lock:
+            self.grid = GridIndex(cell_deg)
+            self.unlocated = set()
+            self._ready = False
+            self._version = ProviderVersion(check_seconds)
+
+    @property
+    def enabled(self):
+        return self.radius_km > 0
+
+    def ensure_built(self):
+        if self._ready and not self._version.changed():
+            return
+        with self._lock:
+            self._version.mark()
+            self.grid = GridIndex(self.grid.cell_deg)
+            self.unlocated = set()
+            with db.engine.connect() as conn:
+                self._load(conn)
+            self._ready = True
+
+    def _load(self, conn, ids=None):
+        q = select(ProviderLocation.provider_id, ProviderLocation.latitude,
+                   ProviderLocation.longitude, ProviderLocation.reach_km)
+        if ids is not None:
+            q = q.where(ProviderLocation.provider_id.in_(ids))
+        for provider_id, lat, lon, reach in conn.execute(q):
+            self.grid.add(provider_id, lat, lon, reach)
+        providers = select(Provider.id)
+        if ids is not None:
+            providers = providers.where(Provider.id.in_(ids))
+        self.unlocated.update(pid for (pid,) in conn.execute(providers) if pid not in self.grid.points)
+
+    def refresh(self, provider_ids):
+        """Reload the points of the given providers (dropping deleted ones)."""
+        if not self._ready or not provider_ids:
+            return
+        with self._lock:
+            for provider_id in provider_ids:
+                self.grid.remove(provider_id)
+                self.unlocated.discard(provider_id)
+            with db.engine.connect() as conn:
+                self._load(conn, list(provider_ids))
+
+    # ---- queries ----
+    def providers_for_post(self, post):
+        """
+        Ids of providers near `post` plus those without a location, or None
+        when geo filtering is off or the post has no coordinates.
+        """
+        if not self.enabled or post.latitude is None or post.longitude is None:
+            return None
+        self.ensure_built()
+        with self._lock:
+            return self.grid.near(post.latitude, post.longitude, self.radius_km) | self.unlocated
+
+    def allows(self, provider_id, post):
+        """False only when geo filtering applies to `post` and the provider is located out of range."""
+        if not self.enabled or post.latitude is None or post.longitude is None:
+            return True
+        self.ensure_built()
+        with self._lock:
+            if provider_id not in self.grid.points:
+                return True
+            return self.grid.covers(provider_id, post.latitude, post.longitude, self.radius_km)
+
+
+geo_index = GeoIndex()
+
+
+def backfill():
+    """Geocode posts and providers stored before coordinates existed. Caller commits."""
+    for post in ServicePost.query.filter(ServicePost.latitude.is_(None), ServicePost.location.isnot(None)):
+        geocode_post(post)
+    for provider in Provider.query.filter(~Provider.locations.any()):
+        provider.locations = provider_points(provider)
+
+
+# Geocode changed locations inside the flush that writes them
+@event.listens_for(Session, 'before_flush')
+def _geocode_changes(session, flush_context, instances):
+    providers = set()
+    for obj in list(session.new) + list(session.dirty):
+        state = inspect(obj)
+        if isinstance(obj, ServicePost):
+            if obj in session.new or state.attrs.location.history.has_changes():
+                geocode_post(obj)
+        elif isinstance(obj, Provider):
+            if (obj in session.new or state.attrs.location.history.has_changes()
+                    or state.attrs.service_areas.history.has_changes()):
+                providers.add(obj)
+        elif isinstance(obj, User) and obj not in session.new and obj.provider is not None:
+            if state.attrs.location.history.has_changes():
+                providers.add(obj.provider)
+        elif isinstance(obj, ProviderServiceArea) and obj in session.new:
+            provider = obj.provider or session.get(Provider, obj.provider_id)
+            if provider is not None:
+                providers.add(provider)
+    for provider in providers:
+        provider.locations = provider_points(provider)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    changed = session.info.setdefault('geo_providers', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, ProviderLocation):
+            changed.add(obj.provider_id)
+        elif isinstance(obj, Provider):
+            changed.add(obj.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    changed = session.info.pop('geo_providers', None)
+    if changed:
+        geo_index.refresh(changed)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_changes(session, previous_transaction):
+    session.info.pop('geo_providers', None)
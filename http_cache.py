@@ -0,0 +1,146 @@
+"""HTTP caching for public profile pages and uploads.
+
+/user/<id> is validated with a weak ETag and Last-Modified built from the
+updated_at of the profile's user/provider/finder rows, the viewer (the
+navbar shows their name and avatar) and RELEASE_ID (new templates on
+deploy). A conditional GET that still matches is answered 304 after one
+small query, without loading the profile or rendering anything. The
+profile body is also kept in fragment_cache under a key versioned by the
+same timestamps; commits touching a profile drop its entries.
+
+Providers' updated_at is bumped here when their skills or list
+attributes (other tables) change, and images.py bumps the rows showing
+an image once its variants are built, so the validators cover everything
+the page shows.
+
+Content-hashed uploads (storage.BLOB_PREFIX) never change under their
+URL and are served with a one-year immutable Cache-Control.
+"""
+import hashlib
+import os
+from datetime import datetime, timezone
+
+from flask import Response, request, session as flask_session
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from fragment_cache import fragment_cache
+from models import (Finder, Provider, ProviderBusinessHours, ProviderCertificate, ProviderLanguage,
+                    ProviderPortfolioImage, ProviderServiceArea, ProviderSkill, User)
+from storage import BLOB_PREFIX
+
+RELEASE_ID = os.getenv('RELEASE_ID', '')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+PROVIDER_CHILDREN = (ProviderSkill, ProviderServiceArea, ProviderLanguage, ProviderCertificate,
+                     ProviderPortfolioImage, ProviderBusinessHours)
+
+
+# ---- profile pages ----
+def profile_stamps(db_session, user_id):
+    """(user, provider, finder) updated_at for `user_id` in one query; None if there is no such user."""
+    row = db_session.execute(
+        select(User.updated_at, Provider.updated_at, Finder.updated_at)
+        .outerjoin(Provider, Provider.user_id == User.id)
+        .outerjoin(Finder, Finder.user_id == User.id)
+        .where(User.id == user_id)).first()
+    return tuple(row) if row is not None else None
+
+
+def profile_version(user_id, stamps):
+    """Viewer-independent version of a profile, used in fragment keys."""
+    data = '|'.join(str(s) for s in (RELEASE_ID, user_id) + tuple(stamps))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()[:16]
+
+
+def profile_validators(user_id, stamps, viewer=None):
+    """(etag, last_modified) of the profile page as `viewer` (None when logged out) sees it."""
+    viewer_part = f'{viewer.id}:{viewer.updated_at}' if viewer is not None else 'anonymous'
+    etag = hashlib.sha1(f'{profile_version(user_id, stamps)}|{viewer_part}'.encode('utf-8')).hexdigest()[:20]
+    times = [s for s in stamps if s is not None]
+    if viewer is not None and viewer.updated_at is not None:
+        times.append(viewer.updated_at)
+    last_modified = max(times).replace(microsecond=0, tzinfo=timezone.utc) if times else None
+    return etag, last_modified
+
+
+def not_modified(etag, last_modified, private=False):
+    """A 304 response when the request's validators still match, else None."""
+    if '_flashes' in flask_session:
+        return None  # the page has messages to show
+    if request.if_none_match:
+        matched = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified is not None:
+        matched = last_modified <= request.if_modified_since
+    else:
+        matched = False
+    if not matched:
+        return None
+    response = Response(status=304)
+    set_validators(response, etag, last_modified, private)
+    return response
+
+
+def set_validators(response, etag, last_modified, private=False):
+    """ETag/Last-Modified plus a Cache-Control that makes clients revalidate every time."""
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    if private:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    response.vary.add('Cookie')
+    return response
+
+
+def profile_fragment_key(user_id, stamps):
+    return f'profile:{user_id}:{profile_version(user_id, stamps)}'
+
+
+# ---- uploads ----
+def upload_cache_headers(response, static_url_path):
+    """after_request: long-lived immutable caching for content-hashed uploads."""
+    if (request.endpoint == 'static' and response.status_code in (200, 304)
+            and request.path.startswith(f'{static_url_path}/{BLOB_PREFIX}/')):
+        response.cache_control.no_cache = None  # send_file's default when SEND_FILE_MAX_AGE_DEFAULT is unset
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
+# ---- timestamps and invalidation ----
+@event.listens_for(Session, 'before_flush')
+def _touch_profiles(session, flush_context, instances):
+    now = datetime.utcnow()
+    provider_ids = set()
+    users = session.info.setdefault('http_cache_users', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, PROVIDER_CHILDREN):
+            provider_id = obj.provider_id if obj.provider_id is not None else getattr(obj.provider, 'id', None)
+            if provider_id is not None:
+                provider_ids.add(provider_id)
+        elif isinstance(obj, Provider) and obj not in session.new and session.is_modified(obj):
+            # collection changes (set_languages etc.) do not issue an UPDATE, so onupdate would not fire
+            obj.updated_at = now
+            users.add(obj.user_id)
+        elif isinstance(obj, (User, Finder)) and obj not in session.new:
+            users.add(obj.id if isinstance(obj, User) else obj.user_id)
+    for provider_id in provider_ids:
+        provider = session.get(Provider, provider_id)
+        if provider is not None and provider not in session.deleted:
+            provider.updated_at = now
+            users.add(provider.user_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _drop_fragments(session):
+    for user_id in session.info.pop('http_cache_users', ()):
+        fragment_cache.invalidate(f'user:{user_id}')
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_fragments(session, previous_transaction):
+    session.info.pop('http_cache_users', None)
@@ -0,0 +1,290 @@
+"""Resized variants of uploaded images.
+
+save_image strips EXIF/GPS data from the upload (strip_metadata) before
+it is hashed and stored, so a stored key's bytes never change. The
+pipeline then builds, on a thread pool, a 160px square `thumb` (avatars),
+a 480px wide `card` (grids) and a `full` size capped at 1600px. Variants
+are WebP (JPEG when Pillow lacks WebP support) with orientation applied.
+Variants are written next to the original through storage.upload_store;
+their paths and sizes are recorded in the image_variants table.
+
+Templates call image_url(path, 'card') and image_srcset(path). Until the
+variants exist (or without Pillow) they fall back to the original, so
+pages never wait for the pipeline. Variants of a path never change once
+built, so lookups are memoized per process; a path without variants is
+looked up again after MISSING_TTL seconds.
+"""
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import event, or_
+from sqlalchemy.orm import Session
+
+from models import db, ImageVariant, Provider, ProviderPortfolioImage, User
+from storage import upload_store
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # optional: without Pillow the originals are served
+    Image = None
+
+log = logging.getLogger('servease.images')
+
+# name -> (max width, max height or None, crop to exactly that size)
+VARIANTS = {
+    'thumb': (160, 160, True),
+    'card': (480, None, False),
+    'full': (1600, 1600, False),
+}
+# variants with the original's aspect ratio, usable together in a srcset
+SRCSET_VARIANTS = ('card', 'full')
+QUALITY = {'webp': 80, 'jpeg': 82}
+MISSING_TTL = 30
+
+
+def available():
+    return Image is not None
+
+
+def output_format(preferred='webp'):
+    if preferred == 'webp' and not features.check('webp'):
+        return 'jpeg'
+    return preferred
+
+
+def variant_path(source, name, fmt):
+    stem, _ = os.path.splitext(source)
+    return f"{stem}.{name}.{'jpg' if fmt == 'jpeg' else fmt}"
+
+
+def _resize(image, spec):
+    width, height, crop = spec
+    if crop:
+        return ImageOps.fit(image, (width, height), Image.LANCZOS)
+    resized = image.copy()
+    # thumbnail() only ever shrinks
+    resized.thumbnail((width, height or image.height), Image.LANCZOS)
+    return resized
+
+
+def _for_format(image, fmt):
+    if image.mode in ('P', 'LA'):
+        image = image.convert('RGBA')
+    if fmt == 'jpeg' and image.mode == 'RGBA':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    if image.mode not in ('RGB', 'RGBA'):
+        return image.convert('RGB')
+    return image
+
+
+def _encode(image, fmt, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt.upper(), **options)
+    buffer.seek(0)
+    return buffer
+
+
+def strip_metadata(path):
+    """
+    Re-encode the image file at `path` upright and without EXIF (GPS
+    included), before it is hashed and stored. True if the file changed.
+    """
+    if not available():
+        return False
+    try:
+        with Image.open(path) as original:
+            if not original.info.get('exif') or original.format not in ('JPEG', 'PNG', 'WEBP'):
+                return False
+            original_format = original.format
+            image = ImageOps.exif_transpose(original).copy()
+    except Exception:
+        return False  # not an image Pillow can read; stored as-is
+    with open(path, 'wb') as out:
+        out.write(_encode(image, original_format, quality=95).getvalue())
+    return True
+
+
+def make_variants(store, source, fmt='webp'):
+    """
+    Write the variants of `source` to `store`; the original is left untouched.
+    Returns [{'name', 'path', 'width', 'height'}] with storage keys as paths.
+    """
+    fmt = output_format(fmt)
+    with store.open(source) as raw, Image.open(io.BytesIO(raw.read())) as original:
+        original.seek(0)  # first frame of animated GIFs
+        image = ImageOps.exif_transpose(original).copy()
+
+    made = []
+    for name, spec in VARIANTS.items():
+        variant = _for_format(_resize(image, spec), fmt)
+        path = variant_path(source, name, fmt)
+        store.put(path, _encode(variant, fmt, quality=QUALITY[fmt], optimize=True), f'image/{fmt}')
+        made.append({'name': name, 'path': path, 'width': variant.width, 'height': variant.height})
+    return made
+
+
+class ImagePipeline:
+    """
+    Builds variants on a thread pool. With `max_workers=0` they are built
+    inline on submit, which keeps tests deterministic.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.fmt = 'webp'
+        self.max_workers = 0
+        self._executor = None
+        self._lock = threading.Lock()
+        self._known = {}
+        self._pending = set()
+
+    def configure(self, app, max_workers=2, fmt='webp'):
+        self.app = app
+        self.fmt = fmt
+        self.max_workers = max_workers
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='image-worker') if max_workers else None
+
+    def submit(self, source):
+        """Queue variant building for static/`source`; False if skipped or already queued."""
+        if not source or not available() or self.app is None:
+            return False
+        with self._lock:
+            if source in self._pending:
+                return False
+            self._pending.add(source)
+        if self._executor is None:
+            self._run(source)
+        else:
+            self._executor.submit(self._run, source)
+        return True
+
+    def _run(self, source):
+        try:
+            with self.app.app_context():
+                if ImageVariant.query.filter_by(source=source).first() is not None:
+                    return  # a duplicate upload of a blob that already has variants
+            made = make_variants(upload_store, source, self.fmt)
+            with self._lock:
+                self._known[source] = (self._as_map(made), None)
+            with self.app.app_context():
+                ImageVariant.query.filter_by(source=source).delete()
+                db.session.add_all(ImageVariant(source=source, **v) for v in made)
+                # pages showing the image now link the variants: bump their rows for ETags/fragments
+                now = datetime.utcnow()
+                for user in User.query.filter(or_(User.profile_image == source, User.cover_image == source)):
+                    user.updated_at = now
+                for provider in Provider.query.join(Provider.portfolio_images).filter(
+                        ProviderPortfolioImage.path == source):
+                    provider.updated_at = now
+                db.session.commit()
+        except Exception:
+            log.exception('image processing failed for %s', source)
+        finally:
+            with self._lock:
+                self._pending.discard(source)
+
+    @staticmethod
+    def _as_map(rows):
+        return {r['name']: (r['path'], r['width'], r['height']) for r in rows}
+
+    # ---- lookups ----
+    def preload(self, sources):
+        """Load the variants of several paths in one query (e.g. a portfolio grid)."""
+        now = time.time()
+        with self._lock:
+            wanted = {s for s in sources if s and not self._fresh(s, now)}
+        if not wanted:
+            return
+        found = {s: [] for s in wanted}
+        for v in ImageVariant.query.filter(ImageVariant.source.in_(wanted)):
+            found[v.source].append({'name': v.name, 'path': v.path, 'width': v.width, 'height': v.height})
+        with self._lock:
+            for source, rows in found.items():
+                # a complete set never changes; an empty one is checked again later
+                self._known[source] = (self._as_map(rows), None if rows else now + MISSING_TTL)
+
+    def _fresh(self, source, now):
+        entry = self._known.get(source)
+        return entry is not None and (entry[1] is None or entry[1] > now)
+
+    def variants(self, source):
+        """{name: (path, width, height)} for `source`, empty until the variants exist."""
+        if not source:
+            return {}
+        self.preload([source])
+        with self._lock:
+            return self._known.get(source, ({}, None))[0]
+
+    def forget(self, source):
+        with self._lock:
+            self._known.pop(source, None)
+
+
+image_pipeline = ImagePipeline()
+
+
+def process_after_commit(source, session=None):
+    """Build the variants of `source` once the request's transaction commits."""
+    if source and available():
+        (session or db.session()).info.setdefault('image_sources', []).append(source)
+
+
+def image_url(source, name='full'):
+    """URL of the `name` variant of `source`, or of the original until it exists."""
+    variant = image_pipeline.variants(source).get(name)
+    return upload_store.url(variant[0] if variant else source)
+
+
+def image_srcset(source):
+    """srcset of the same-aspect variants ('' until they exist)."""
+    found = image_pipeline.variants(source)
+    entries = {}
+    for name in SRCSET_VARIANTS:
+        if name in found:
+            # small originals give variants of equal width; a srcset may list each width once
+            entries.setdefault(found[name][1], found[name][0])
+    return ', '.join(f'{upload_store.url(path)} {width}w' for width, path in entries.items())
+
+
+def delete_image(source):
+    """Delete a stored image, its variants and their rows (the caller commits)."""
+    if not source:
+        return
+    for key in [source] + [v.path for v in ImageVariant.query.filter_by(source=source)]:
+        try:
+            upload_store.delete(key)
+        except Exception as e:
+            log.warning('could not remove image %s: %s', key, e)
+    ImageVariant.query.filter_by(source=source).delete()
+    image_pipeline.forget(source)
+
+
+def sources_without_variants():
+    """Uploaded images referenced by users/portfolios that have no variants yet."""
+    done = {s for (s,) in db.session.query(ImageVariant.source).distinct()}
+    sources = set()
+    for profile, cover in db.session.query(User.profile_image, User.cover_image):
+        sources.update(p for p in (profile, cover) if p)
+    sources.update(p for (p,) in db.session.query(ProviderPortfolioImage.path))
+    return sorted(sources - done)
+
+
+# Variants are built after commit, so workers (or inline builds) never wait on the request's write lock
+@event.listens_for(Session, 'after_commit')
+def _process_uploads(session):
+    for source in session.info.pop('image_sources', ()):
+        image_pipeline.submit(source)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_uploads(session, previous_transaction):
+    session.info.pop('image_sources', None)
@@ -1,10 +1,11 @@
 from app import app, db
+from migrations import migrate
 from models import User, Provider, Finder
 from werkzeug.security import generate_password_hash
 
 with app.app_context():
-    # Create all tables if they don't exist
-    db.create_all()
+    # Create the tables, or upgrade an existing database
+    migrate(db)
     
     # create demo users (if not exists)
     if not User.query.filter_by(email='prov@example.com').first():
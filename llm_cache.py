@@ -0,0 +1,222 @@
+"""Content-addressed cache for Gemini rankings.
+
+A ranking is keyed on a hash of the normalized post/provider payload that
+went into the prompt, so an unchanged page load reuses the previous answer
+instead of calling the model again. Entries expire after a TTL, the least
+recently used ones are evicted past `max_entries`, and every entry is tagged
+with the posts/providers in its candidate set so editing any of them drops
+the rankings it took part in.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return ' '.join(value.split()).lower()
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def payload_key(payload):
+    """sha256 of the normalized payload; whitespace and case do not matter."""
+    data = json.dumps(_normalize(payload), sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class MemoryBackend:
+    """In-process LRU store of key -> (value, expires_at, tags)."""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._tags = {}
+
+    def get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at, tags = entry
+        if expires_at <= now:
+            self.delete(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, expires_at, tags):
+        self.delete(key)
+        self._entries[key] = (value, expires_at, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        evicted = 0
+        while len(self._entries) > self.max_entries:
+            self.delete(next(iter(self._entries)))
+            evicted += 1
+        return evicted
+
+    def delete(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, tag):
+        keys = list(self._tags.get(tag, ()))
+        for key in keys:
+            self.delete(key)
+        return len(keys)
+
+    def clear(self):
+        self._entries.clear()
+        self._tags.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """Same interface as MemoryBackend, persisted to a SQLite file shared across processes."""
+
+    def __init__(self, path, max_entries=10000):
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_llm_cache_last_used ON llm_cache (last_used);
+            CREATE TABLE IF NOT EXISTS llm_cache_tags (
+                tag TEXT NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (tag, key)
+            );
+            CREATE INDEX IF NOT EXISTS ix_llm_cache_tags_key ON llm_cache_tags (key);
+        """)
+
+    def get(self, key, now):
+        row = self._conn.execute('SELECT value, expires_at FROM llm_cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] <= now:
+            self.delete(key)
+            return None
+        with self._conn:
+            self._conn.execute('UPDATE llm_cache SET last_used = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value, expires_at, tags):
+        now = time.time()
+        with self._conn:
+            self._conn.execute('DELETE FROM llm_cache_tags WHERE key = ?', (key,))
+            self._conn.execute('INSERT OR REPLACE INTO llm_cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)',
+                               (key, json.dumps(value), expires_at, now))
+            self._conn.executemany('INSERT OR IGNORE INTO llm_cache_tags (tag, key) VALUES (?, ?)',
+                                   [(tag, key) for tag in tags])
+            excess = self._conn.execute('SELECT COUNT(*) FROM llm_cache').fetchone()[0] - self.max_entries
+            if excess > 0:
+                victims = [r[0] for r in self._conn.execute(
+                    'SELECT key FROM llm_cache ORDER BY last_used LIMIT ?', (excess,))]
+                self._delete_many(victims)
+                return len(victims)
+        return 0
+
+    def _delete_many(self, keys):
+        self._conn.executemany('DELETE FROM llm_cache WHERE key = ?', [(k,) for k in keys])
+        self._conn.executemany('DELETE FROM llm_cache_tags WHERE key = ?', [(k,) for k in keys])
+
+    def delete(self, key):
+        with self._conn:
+            self._delete_many([key])
+
+    def invalidate(self, tag):
+        with self._conn:
+            keys = [r[0] for r in self._conn.execute('SELECT key FROM llm_cache_tags WHERE tag = ?', (tag,))]
+            self._delete_many(keys)
+        return len(keys)
+
+    def clear(self):
+        with self._conn:
+            self._conn.execute('DELETE FROM llm_cache')
+            self._conn.execute('DELETE FROM llm_cache_tags')
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM llm_cache').fetchone()[0]
+
+
+class RankingCache:
+    """TTL + LRU cache of model rankings with hit/miss counters."""
+
+    def __init__(self, backend=None, ttl=3600):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self.backend.get(key, time.time())
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key, value, tags=()):
+        with self._lock:
+            self.evictions += self.backend.set(key, value, time.time() + self.ttl, list(tags))
+
+    def invalidate(self, kind, obj_id):
+        """Drop every ranking whose candidate set included this post/provider."""
+        with self._lock:
+            self.invalidations += self.backend.invalidate(f'{kind}:{obj_id}')
+
+    def invalidate_provider(self, provider_id):
+        self.invalidate('provider', provider_id)
+
+    def invalidate_post(self, post_id):
+        self.invalidate('post', post_id)
+
+    def clear(self):
+        with self._lock:
+            self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / total) if total else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self.backend),
+            }
+
+
+def create_cache(backend='memory', path=None, ttl=3600, max_entries=1000):
+    """Build a RankingCache from config values ('memory' or 'sqlite')."""
+    if backend == 'sqlite':
+        return RankingCache(SQLiteBackend(path or 'instance/llm_cache.db', max_entries), ttl)
+    return RankingCache(MemoryBackend(max_entries), ttl)
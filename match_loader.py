@@ -0,0 +1,72 @@
+"""Data loading for the matching pipeline.
+
+Matching touches `provider.user` and `provider.skills` for every
+candidate. These helpers load those relationships up front so a match
+page costs a fixed number of queries instead of one or two per row
+(tests/test_query_counts.py locks the counts in).
+
+The in-memory indexes built from providers (skill_index, bm25_index,
+geo_index) are
+kept current by session events, which only fire in the process that
+commits. With several workers, ProviderVersion tells the others that
+something changed so they rebuild.
+"""
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import contains_eager, selectinload
+
+from models import db, Provider, ProviderLocation, ProviderSkill, User
+
+
+def provider_query():
+    """Provider query with user, skills and service areas eager-loaded."""
+    # inner join on users drops orphaned providers, same as the `if p.user` checks
+    return (Provider.query
+            .join(User, Provider.user_id == User.id)
+            .options(contains_eager(Provider.user), selectinload(Provider.skills),
+                     selectinload(Provider.service_areas)))
+
+
+def load_providers_by_ids(ids):
+    """Providers with the given ids, with user, skills and service areas (3 queries)."""
+    ids = list(ids)
+    if not ids:
+        return []
+    return provider_query().filter(Provider.id.in_(ids)).all()
+
+
+def provider_version():
+    """A tuple that changes whenever providers, skills or locations are added, edited or deleted (one query)."""
+    return tuple(db.session.execute(select(
+        select(func.count(Provider.id)).scalar_subquery(),
+        select(func.max(Provider.updated_at)).scalar_subquery(),
+        select(func.count(ProviderSkill.id)).scalar_subquery(),
+        select(func.max(ProviderSkill.id)).scalar_subquery(),
+        select(func.count(ProviderLocation.id)).scalar_subquery(),
+        select(func.max(ProviderLocation.id)).scalar_subquery(),
+    )).one())
+
+
+class ProviderVersion:
+    """
+    Notices provider changes committed by other processes. mark() before
+    loading an index; changed() re-reads provider_version() at most every
+    `interval` seconds (0 never checks, for a single process).
+    """
+
+    def __init__(self, interval=0):
+        self.interval = interval
+        self._seen = None
+        self._checked = 0.0
+
+    def mark(self):
+        if self.interval:
+            self._seen = provider_version()
+            self._checked = time.monotonic()
+
+    def changed(self):
+        if not self.interval or time.monotonic() - self._checked < self.interval:
+            return False
+        self._checked = time.monotonic()
+        return provider_version() != self._seen
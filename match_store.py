@@ -0,0 +1,339 @@
+"""Persisted match results.
+
+Ranked providers for each post live in the post_matches table, so match
+pages read a precomputed top list with one indexed query instead of
+re-ranking (and possibly calling Gemini) on every view. Rows are written
+when a post is created and recomputed incrementally when a provider's
+skills or profile change. Callers own the transaction and commit.
+"""
+import math
+from datetime import datetime
+
+from sqlalchemy import and_, func, or_, select, tuple_
+from sqlalchemy.orm import contains_eager, selectinload
+
+from models import db, PostMatch, Provider, ServicePost, User
+from skill_index import skill_index, post_text, score_skills, boost_score
+from match_loader import load_providers_by_ids
+from ranking import top_k
+from bm25_index import bm25_index
+from embeddings import embedding_index, SCORE_SCALE
+from geo import geo_index
+import provider_attrs
+from telemetry import span
+
+# Providers kept per post when a full ranking (e.g. Gemini) is stored
+MAX_STORED = 50
+# Boost-only providers kept per post so posts without skill hits still list someone
+FILL = 10
+# Most recent open posts scored for a provider who has no stored rows yet
+RECENT_WINDOW = 200
+
+
+# ---- writes ----
+def keyword_matches(post, allowed=None, k=MAX_STORED):
+    """Best `k` (score, provider) with a skill hit on `post`, plus the best boost-only ones."""
+    scores = skill_index.skill_scores(post_text(post))
+    if allowed is not None:
+        scores = {pid: s for pid, s in scores.items() if pid in allowed}
+    # rank on (id, rating, verified) rows; only the kept providers are loaded
+    boosts = (db.session.query(Provider.id, Provider.rating, Provider.verified)
+              .join(User, Provider.user_id == User.id)
+              .filter(Provider.id.in_(list(scores)))) if scores else []
+    top = top_k([(scores[row.id] + boost_score(row), row.id) for row in boosts], k, tiebreak=lambda pid: pid)
+    providers = {p.id: p for p in load_providers_by_ids([pid for _, pid in top])}
+    scored = [(score, providers[pid]) for score, pid in top if pid in providers]
+    scored.extend(skill_index.top_boost_only(FILL, exclude=scores, only=allowed))
+    return scored
+
+
+def bm25_matches(post, k=MAX_STORED, allowed=None):
+    """Best `k` (score, provider) for `post` from the BM25 index."""
+    top = bm25_index.top_provider_ids(post, k, allowed)
+    providers = {p.id: p for p in load_providers_by_ids([pid for _, pid in top])}
+    return [(score, providers[pid]) for score, pid in top if pid in providers]
+
+
+def embedding_matches(post, k=MAX_STORED, allowed=None):
+    """Best `k` (score, provider) for `post` by embedding similarity plus the usual boost."""
+    top = embedding_index.top_provider_ids(post_text(post), k, allowed)
+    providers = {p.id: p for p in load_providers_by_ids([pid for _, pid in top])}
+    scored = [(round(sim * SCORE_SCALE + boost_score(providers[pid]), 3), providers[pid])
+              for sim, pid in top if pid in providers]
+    return top_k(scored, tiebreak=lambda p: p.id)
+
+
+def _scorer_matches(post, method, allowed):
+    with span('scoring'):
+        if method == 'bm25':
+            return bm25_matches(post, allowed=allowed)
+        if method == 'embedding':
+            return embedding_matches(post, allowed=allowed)
+        return keyword_matches(post, allowed)
+
+
+def local_matches(post, method='keyword'):
+    """
+    Candidate (score, provider) pairs for `post` from the configured local
+    scorer. With geo filtering on, only providers near the post (or serving
+    an area that covers it) are scored; if none are, everyone is.
+    """
+    allowed = geo_index.providers_for_post(post)
+    return _scorer_matches(post, method, allowed or None)
+
+
+def save_post_matches(post_id, scored, method):
+    """Replace the stored matches of a post with (score, provider) pairs."""
+    now = datetime.utcnow()
+    PostMatch.query.filter_by(post_id=post_id).delete(synchronize_session=False)
+    rows = {}
+    for score, provider in scored:
+        if provider.id not in rows:
+            rows[provider.id] = {'post_id': post_id, 'provider_id': provider.id,
+                                 'score': score, 'method': method, 'computed_at': now}
+    if rows:
+        db.session.bulk_insert_mappings(PostMatch, list(rows.values()))
+
+
+def _pair_scores(provider, posts, method):
+    """[(text score, total score)] of `provider` on each post with the given local scorer."""
+    with span('scoring'):
+        if method == 'bm25':
+            boost = boost_score(provider)
+            return [(float(score) - boost, float(score)) for score in bm25_index.score_posts(provider.id, posts)]
+        if method == 'embedding':
+            boost = boost_score(provider)
+            sims = embedding_index.provider_post_similarities(provider.id, [p.id for p in posts])
+            return [(sim, round(sim * SCORE_SCALE + boost, 3)) for sim in sims]
+        skills = [s.skill for s in provider.skills]
+        boost = boost_score(provider)
+        return [(s, s + boost) for s in (score_skills(skills, post_text(post)) for post in posts)]
+
+
+def _rescore(provider, posts, method='keyword', create=False):
+    """
+    Recompute `provider`'s score on `posts`, only touching that provider's rows.
+    Posts ranked by Gemini are skipped: their scores are on another scale.
+    """
+    post_ids = [p.id for p in posts]
+    if not post_ids:
+        return
+    gemini = {pid for (pid,) in db.session.query(PostMatch.post_id).filter(
+        PostMatch.post_id.in_(post_ids), PostMatch.method == 'gemini').distinct()}
+    posts = [p for p in posts if p.id not in gemini]
+    if not posts:
+        return
+    existing = {m.post_id: m for m in PostMatch.query.filter(
+        PostMatch.provider_id == provider.id,
+        PostMatch.post_id.in_([p.id for p in posts]))}
+    now = datetime.utcnow()
+    for post, (text_score, score) in zip(posts, _pair_scores(provider, posts, method)):
+        row = existing.get(post.id)
+        if row is None:
+            if create and text_score > 0 and geo_index.allows(provider.id, post):
+                db.session.add(PostMatch(post_id=post.id, provider_id=provider.id, score=score,
+                                         method=method, computed_at=now))
+            continue
+        row.score = score
+        row.method = method
+        row.computed_at = now
+
+
+def update_provider_skill(provider, skill, method='keyword'):
+    """
+    Refresh `provider`'s rows for the open posts whose text contains a token
+    of `skill` (just added or removed). Other providers' rows are untouched.
+    """
+    if method == 'embedding':
+        # nearest open posts to the provider's updated vector
+        post_ids = [pid for _, pid in embedding_index.top_post_ids(provider.id, MAX_STORED)]
+        posts = ServicePost.query.filter(ServicePost.id.in_(post_ids), ServicePost.status == 'open').all()
+        _rescore(provider, posts, method, create=True)
+        return
+    tokens = skill.lower().split()
+    if not tokens:
+        return
+    text = func.lower(func.coalesce(ServicePost.title, '') + ' ' + func.coalesce(ServicePost.description, ''))
+    posts = (ServicePost.query
+             .filter(ServicePost.status == 'open')
+             .filter(or_(*[text.contains(t, autoescape=True) for t in tokens]))
+             .all())
+    _rescore(provider, posts, method, create=True)
+
+
+def refresh_provider(provider, method='keyword'):
+    """Recompute the existing rows of one provider after a profile change."""
+    posts = (ServicePost.query
+             .join(PostMatch, PostMatch.post_id == ServicePost.id)
+             .filter(PostMatch.provider_id == provider.id)
+             .all())
+    _rescore(provider, posts, method)
+
+
+def score_recent_posts(provider, method='keyword', window=RECENT_WINDOW):
+    """Create `provider`'s rows for the latest `window` open posts, e.g. for a provider who has none yet."""
+    posts = (ServicePost.query
+             .filter(ServicePost.status == 'open')
+             .order_by(ServicePost.id.desc())
+             .limit(window)
+             .all())
+    _rescore(provider, posts, method, create=True)
+
+
+def delete_for_provider(provider_id):
+    PostMatch.query.filter_by(provider_id=provider_id).delete(synchronize_session=False)
+
+
+def delete_for_finder(finder_id):
+    post_ids = db.session.query(ServicePost.id).filter(ServicePost.finder_id == finder_id)
+    PostMatch.query.filter(PostMatch.post_id.in_(post_ids)).delete(synchronize_session=False)
+
+
+def posts_without_matches():
+    """Posts that have never been ranked, e.g. created before post_matches existed."""
+    ranked = db.session.query(PostMatch.post_id).filter(PostMatch.post_id == ServicePost.id)
+    return ServicePost.query.filter(~ranked.exists()).all()
+
+
+# ---- batch (see rank_matches.py) ----
+def pair_scores(provider, posts, method='keyword'):
+    """(score, post_id) for the `posts` that `provider` matches: a text hit, within geo range."""
+    return [(score, post.id) for post, (text_score, score) in zip(posts, _pair_scores(provider, posts, method))
+            if text_score > 0 and geo_index.allows(provider.id, post)]
+
+
+def gemini_ranked_post_ids():
+    """Posts with Gemini-ranked rows; batch runs leave them alone."""
+    return {pid for (pid,) in db.session.query(PostMatch.post_id).filter(PostMatch.method == 'gemini').distinct()}
+
+
+def _chunks(ids, size):
+    ids = list(ids)
+    return [ids[start:start + size] for start in range(0, len(ids), size)]
+
+
+def delete_pairs(post_ids, provider_ids=None, chunk_size=500):
+    """Delete the stored rows of `post_ids`, only those of `provider_ids` when given."""
+    provider_chunks = None if provider_ids is None else _chunks(provider_ids, chunk_size)
+    for posts in _chunks(post_ids, chunk_size):
+        q = PostMatch.query.filter(PostMatch.post_id.in_(posts))
+        if provider_chunks is None:
+            q.delete(synchronize_session=False)
+            continue
+        for providers in provider_chunks:
+            q.filter(PostMatch.provider_id.in_(providers)).delete(synchronize_session=False)
+
+
+def bulk_save_pairs(scores, method, chunk_size=1000):
+    """Insert {(post_id, provider_id): score} rows in chunks (after delete_pairs). Returns the row count."""
+    now = datetime.utcnow()
+    rows = [{'post_id': post_id, 'provider_id': provider_id, 'score': score, 'method': method, 'computed_at': now}
+            for (post_id, provider_id), score in scores.items()]
+    for start in range(0, len(rows), chunk_size):
+        db.session.bulk_insert_mappings(PostMatch, rows[start:start + chunk_size])
+    return len(rows)
+
+
+def trim_pairs(post_ids, k, chunk_size=500):
+    """
+    Delete the rows of `post_ids` that are neither among the post's best `k`
+    nor among their provider's best `k` open posts, which is what a full
+    batch run keeps (ties go to lower provider ids and newer posts).
+    Gemini-ranked posts are left alone. Returns the number of rows deleted.
+    """
+    deleted = 0
+    for posts in _chunks(post_ids, chunk_size):
+        providers = select(PostMatch.provider_id).where(PostMatch.post_id.in_(posts))
+        ranked = (select(PostMatch.post_id, PostMatch.provider_id,
+                         func.row_number().over(partition_by=PostMatch.post_id,
+                                                order_by=(PostMatch.score.desc(), PostMatch.provider_id))
+                         .label('post_rank'),
+                         func.row_number().over(partition_by=PostMatch.provider_id,
+                                                order_by=(PostMatch.score.desc(), PostMatch.post_id.desc()))
+                         .label('provider_rank'))
+                  .join(ServicePost, PostMatch.post_id == ServicePost.id)
+                  .where(ServicePost.status == 'open', PostMatch.method != 'gemini',
+                         PostMatch.provider_id.in_(providers))
+                  .subquery())
+        doomed = db.session.execute(select(ranked.c.post_id, ranked.c.provider_id).where(
+            ranked.c.post_id.in_(posts), ranked.c.post_rank > k, ranked.c.provider_rank > k)).all()
+        for pairs in _chunks([tuple(pair) for pair in doomed], chunk_size):
+            PostMatch.query.filter(tuple_(PostMatch.post_id, PostMatch.provider_id).in_(pairs)).delete(
+                synchronize_session=False)
+        deleted += len(doomed)
+    return deleted
+
+
+# ---- reads ----
+def page_cursor(score, post_id):
+    """Opaque keyset cursor for the row after (score, post_id)."""
+    return f'{score!r}:{post_id}'
+
+
+def parse_cursor(cursor):
+    """(score, post_id) from page_cursor(), or None if it is missing or malformed."""
+    try:
+        score, post_id = (cursor or '').rsplit(':', 1)
+        score, post_id = float(score), int(post_id)
+    except ValueError:
+        return None
+    return (score, post_id) if math.isfinite(score) else None
+
+
+def provider_has_matches(provider_id):
+    return db.session.query(PostMatch.query.filter_by(provider_id=provider_id).exists()).scalar()
+
+
+def post_match_method(post_id):
+    """
+    Method ('keyword', 'bm25', 'embedding' or 'gemini') of a post's stored ranking, or None if not
+    ranked. The oldest row tells, since later per-provider rescores are local.
+    """
+    return (db.session.query(PostMatch.method)
+            .filter(PostMatch.post_id == post_id)
+            .order_by(PostMatch.computed_at)
+            .limit(1)
+            .scalar())
+
+
+def top_providers_for_post(post_id, k=10, language=None, area=None):
+    """
+    Stored top `k` (score, provider) for a post, best first, optionally only
+    providers speaking `language` and/or listing service `area`.
+    """
+    q = (db.session.query(PostMatch.score, Provider)
+         .join(Provider, PostMatch.provider_id == Provider.id)
+         .join(User, Provider.user_id == User.id)
+         .options(contains_eager(Provider.user), selectinload(Provider.skills),
+                  selectinload(Provider.languages))
+         .filter(PostMatch.post_id == post_id))
+    if language:
+        q = q.filter(provider_attrs.speaks(language))
+    if area:
+        q = q.filter(provider_attrs.serves_area(area))
+    rows = (q.order_by(PostMatch.score.desc(), PostMatch.provider_id)
+            .limit(k)
+            .all())
+    return [(score, provider) for score, provider in rows]
+
+
+def top_posts_for_provider(provider_id, k=10, after=None):
+    """
+    Stored top `k` (score, post) among open posts for a provider, best
+    first, newest first on equal scores. `after` is the (score, post_id) of
+    the last row already shown; the next page is read by walking the
+    (provider_id, score, post_id) index from there, not by OFFSET.
+    """
+    q = (db.session.query(PostMatch.score, ServicePost)
+         .join(ServicePost, PostMatch.post_id == ServicePost.id)
+         .join(User, ServicePost.finder_id == User.id)
+         .options(contains_eager(ServicePost.finder))
+         .filter(PostMatch.provider_id == provider_id, ServicePost.status == 'open'))
+    if after is not None:
+        score, post_id = after
+        q = q.filter(or_(PostMatch.score < score,
+                         and_(PostMatch.score == score, PostMatch.post_id < post_id)))
+    rows = (q.order_by(PostMatch.score.desc(), PostMatch.post_id.desc())
+            .limit(k)
+            .all())
+    return [(score, post) for score, post in rows]
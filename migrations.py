@@ -0,0 +1,263 @@
+"""Versioned schema migrations.
+
+Applied versions are recorded in the schema_version table. On start-up
+migrate() reads the current version and returns straight away when it is
+the latest, so the schema is not introspected on every run. Otherwise the
+missing tables are created and each pending migration runs in its own
+transaction. A new database is created from the models and stamped with
+the latest version.
+
+To change the schema, update models.py and append a migration to
+MIGRATIONS. Each migration is a (version, description, function(conn,
+metadata)) tuple with the next version number. Migrations for objects
+outside the models also go in CREATE_ALSO.
+"""
+import json
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text
+
+version_metadata = MetaData()
+schema_version = Table(
+    'schema_version', version_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200)),
+    Column('applied_at', DateTime),
+)
+
+
+# ---- helpers for migrations ----
+def add_columns(conn, table, columns):
+    """ALTER TABLE ADD COLUMN for each {name: ddl} not already on `table`."""
+    existing = {c['name'] for c in inspect(conn).get_columns(table)}
+    for name, ddl in columns.items():
+        if name not in existing:
+            conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}'))
+            print(f"✓ Added {name} column to {table} table")
+
+
+def create_indexes(conn, metadata, names):
+    """Create the model indexes called `names` if they do not exist yet."""
+    wanted = set(names)
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in wanted:
+                index.create(conn, checkfirst=True)
+                wanted.discard(index.name)
+    if wanted:
+        raise ValueError(f'No such indexes in models: {sorted(wanted)}')
+
+
+# ---- migrations ----
+def _legacy_columns(conn, metadata):
+    # columns the old start-up ALTER block added to databases from earlier versions
+    add_columns(conn, 'users', {
+        'profile_image': 'VARCHAR(200)',
+        'cover_image': 'VARCHAR(200)',
+        'tagline': 'VARCHAR(200)',
+        'email_notifications': 'BOOLEAN DEFAULT 1',
+        'phone': 'VARCHAR(20)',
+        'website': 'VARCHAR(200)',
+        'social_links': 'TEXT',
+        'location': 'VARCHAR(200)',
+    })
+    add_columns(conn, 'providers', {
+        'location': 'VARCHAR(200)',
+        'profile_visible': 'BOOLEAN DEFAULT 1',
+        'business_name': 'VARCHAR(200)',
+        'business_hours': 'TEXT',
+        'experience_years': 'INTEGER',
+        'certificates': 'TEXT',
+        'service_areas': 'TEXT',
+        'languages': 'TEXT',
+        'hourly_rate': 'FLOAT',
+        'portfolio_images': 'TEXT',
+    })
+    add_columns(conn, 'finders', {
+        'preferences': 'TEXT',
+        'favorite_providers': 'TEXT',
+        'company_name': 'VARCHAR(200)',
+        'company_size': 'VARCHAR(50)',
+        'industry': 'VARCHAR(100)',
+    })
+
+
+def _post_coordinates(conn, metadata):
+    add_columns(conn, 'service_posts', {'latitude': 'FLOAT', 'longitude': 'FLOAT'})
+
+
+def _foreign_key_indexes(conn, metadata):
+    create_indexes(conn, metadata, [
+        'ix_providers_user_id',
+        'ix_finders_user_id',
+        'ix_provider_skills_provider_id',
+        'ix_service_posts_status',
+    ])
+
+
+def _post_list_indexes(conn, metadata):
+    # finder_dashboard, user_profile and view_profile list a finder's posts newest first
+    create_indexes(conn, metadata, [
+        'ix_service_posts_finder_created',
+        'ix_service_posts_created_at',
+    ])
+
+
+def _json_attributes_to_tables(conn, metadata):
+    # copy the JSON text columns into their child tables; the old columns are left unused
+    from provider_attrs import json_list
+
+    def text_item(item):
+        if isinstance(item, dict):
+            return str(item.get('name') or item.get('title') or next(iter(item.values()), '')).strip()
+        return str(item).strip()
+
+    def copy(table, column, target, rows_for):
+        if column not in {c['name'] for c in inspect(conn).get_columns(table)}:
+            return
+        rows = []
+        for owner_id, raw in conn.execute(text(f'SELECT id, {column} FROM {table} WHERE {column} IS NOT NULL')):
+            rows.extend(rows_for(owner_id, raw))
+        if rows:
+            conn.execute(metadata.tables[target].insert(), rows)
+            print(f"✓ Moved {len(rows)} {table}.{column} entries to {target}")
+
+    def named(owner_id, raw, with_key=False):
+        seen = set()
+        rows = []
+        for item in json_list(raw):
+            name = text_item(item)
+            if name and name.lower() not in seen:
+                seen.add(name.lower())
+                row = {'provider_id': owner_id, 'name': name, 'position': len(rows)}
+                if with_key:
+                    row['key'] = name.lower()
+                rows.append(row)
+        return rows
+
+    def hours(owner_id, raw):
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return []
+        pairs = value.items() if isinstance(value, dict) else []
+        return [{'provider_id': owner_id, 'day': str(day), 'hours': str(h), 'position': i}
+                for i, (day, h) in enumerate(pairs)]
+
+    def favorites(owner_id, raw):
+        ids = {int(i) for i in json_list(raw) if str(i).strip().isdigit()}
+        known = {pid for (pid,) in conn.execute(text('SELECT id FROM providers'))} if ids else set()
+        return [{'finder_id': owner_id, 'provider_id': pid, 'created_at': datetime.utcnow()}
+                for pid in sorted(ids & known)]
+
+    copy('providers', 'service_areas', 'provider_service_areas', lambda i, raw: named(i, raw, True))
+    copy('providers', 'languages', 'provider_languages', lambda i, raw: named(i, raw, True))
+    copy('providers', 'certificates', 'provider_certificates', named)
+    copy('providers', 'portfolio_images', 'provider_portfolio_images',
+         lambda i, raw: [{'provider_id': i, 'path': str(p), 'position': n}
+                         for n, p in enumerate(p for p in json_list(raw) if p)])
+    copy('providers', 'business_hours', 'provider_business_hours', hours)
+    copy('finders', 'favorite_providers', 'finder_favorites', favorites)
+
+
+def _search_tables(conn, metadata):
+    import search
+    search.install(conn)
+
+
+def _image_variants(conn, metadata):
+    metadata.tables['image_variants'].create(conn, checkfirst=True)
+
+
+def _stored_blobs(conn, metadata):
+    # existing upload paths become blobs (without a hash) with their current reference counts
+    table = metadata.tables['stored_blobs']
+    table.create(conn, checkfirst=True)
+    counts = {}
+    for query in ('SELECT profile_image FROM users', 'SELECT cover_image FROM users',
+                  'SELECT path FROM provider_portfolio_images'):
+        for (path,) in conn.execute(text(query)):
+            if path:
+                counts[path] = counts.get(path, 0) + 1
+    known = {k for (k,) in conn.execute(select(table.c.key))}
+    rows = [{'key': k, 'refcount': n, 'created_at': datetime.utcnow()} for k, n in counts.items() if k not in known]
+    if rows:
+        conn.execute(table.insert(), rows)
+        print(f"✓ Counted references for {len(rows)} existing uploads")
+
+
+def _updated_at(conn, metadata):
+    for table in ('users', 'providers', 'finders'):
+        add_columns(conn, table, {'updated_at': 'DATETIME'})
+        conn.execute(text(f'UPDATE {table} SET updated_at = coalesce(created_at, :now) WHERE updated_at IS NULL'),
+                     {'now': datetime.utcnow()})
+
+
+def _rank_runs(conn, metadata):
+    metadata.tables['rank_runs'].create(conn, checkfirst=True)
+
+
+MIGRATIONS = [
+    (1, 'columns added by the old start-up ALTER block', _legacy_columns),
+    (2, 'geocoded post coordinates', _post_coordinates),
+    (3, 'indexes on foreign keys and post status', _foreign_key_indexes),
+    (4, 'composite (finder_id, created_at) index for post lists', _post_list_indexes),
+    (5, 'JSON provider/finder attributes moved to child tables', _json_attributes_to_tables),
+    (6, 'FTS5 search tables and sync triggers', _search_tables),
+    (7, 'resized image variants', _image_variants),
+    (8, 'content-addressed upload reference counts', _stored_blobs),
+    (9, 'updated_at on users, providers and finders', _updated_at),
+    (10, 'batch ranking runs', _rank_runs),
+]
+
+# Migrations creating objects the models do not describe (virtual tables,
+# triggers); they also run when a new database is created from the models
+CREATE_ALSO = {6}
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    """Highest applied version, or None if the schema_version table does not exist."""
+    try:
+        return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+    except Exception:
+        return None
+
+
+def _record(conn, version, description):
+    conn.execute(schema_version.insert().values(version=version, description=description,
+                                                applied_at=datetime.utcnow()))
+
+
+def migrate(db):
+    """Bring the database up to the latest version. Returns the versions applied."""
+    engine = db.engine
+    with engine.connect() as conn:
+        version = current_version(conn)
+    if version == LATEST:
+        return []
+
+    with engine.begin() as conn:
+        fresh = version is None and not inspect(conn).has_table('users')
+        version_metadata.create_all(conn)
+        db.metadata.create_all(conn)
+        if fresh:
+            # tables were just created from the models, so most migrations are already in them
+            for number, description, upgrade in MIGRATIONS:
+                if number in CREATE_ALSO:
+                    upgrade(conn, db.metadata)
+                _record(conn, number, description)
+            print(f"✓ Created database at schema version {LATEST}")
+            return []
+
+    applied = []
+    for number, description, upgrade in MIGRATIONS:
+        if number <= (version or 0):
+            continue
+        with engine.begin() as conn:
+            upgrade(conn, db.metadata)
+            _record(conn, number, description)
+        print(f"✓ Applied migration {number}: {description}")
+        applied.append(number)
+    return applied
@@ -0,0 +1,217 @@
+"""Resilient access to the ranking model (Gemini).
+
+ModelClient wraps anything with generate_content(prompt) so a slow or
+failing API cannot tie up the web workers:
+
+* deadline: each call runs on its own thread and the caller waits at most
+  `timeout` seconds (ModelTimeout); retries share that deadline;
+* concurrency: at most `max_in_flight` calls run at once. A slot is held
+  until the call really returns, also after its caller gave up, and a
+  caller that gets no slot within `slot_wait` seconds gets ModelBusy, so
+  excess load is shed at once instead of queueing until the deadline;
+* circuit breaker: after `failure_threshold` failures in a row calls fail
+  at once with CircuitOpen for `reset_timeout` seconds, then a single
+  probe call decides whether to close it again;
+* coalescing: concurrent calls with the same key (the ranking payload
+  hash) share one model call and its answer.
+
+Every error raised here derives from ModelUnavailable; the matching
+functions catch it and fall back to the keyword ranking. HttpModel speaks
+the Gemini REST API with the standard library, so the app can also be
+pointed at fake_model.py's local server.
+"""
+import hashlib
+import json
+import threading
+import time
+import urllib.request
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from types import SimpleNamespace
+
+import telemetry
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class ModelUnavailable(Exception):
+    """The model could not be asked; use the heuristic ranking."""
+
+
+class ModelTimeout(ModelUnavailable):
+    pass
+
+
+class ModelBusy(ModelUnavailable):
+    pass
+
+
+class CircuitOpen(ModelUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpen unless a call may go through now."""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            raise CircuitOpen(f'model circuit {self.state} after {self.failures} failures')
+
+    def cancel_probe(self):
+        """The probe call never reached the model; let the next call probe."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        """Count a failure; True when this one opened the circuit."""
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = self.clock()
+                return True
+            return False
+
+
+class ModelClient:
+    """generate_content with a deadline, retries, an in-flight limit, a circuit breaker and coalescing."""
+
+    def __init__(self, model, timeout=10.0, max_in_flight=4, retries=1, backoff=0.2,
+                 failure_threshold=5, reset_timeout=30.0, call_options=None, slot_wait=0.1):
+        self.model = model
+        self.timeout = timeout
+        self.slot_wait = slot_wait
+        self.retries = retries
+        self.backoff = backoff
+        self.call_options = call_options or {}
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    def generate_content(self, prompt, key=None):
+        """The model's response to `prompt`; concurrent calls with the same `key` share one call."""
+        key = key or hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        with self._lock:
+            shared = self._inflight.get(key)
+            leader = shared is None
+            if leader:
+                shared = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if leader:
+            try:
+                shared.set_result(self._call_with_retries(prompt))
+            except Exception as e:
+                shared.set_exception(e)
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+        try:
+            return shared.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise ModelTimeout(f'no shared answer within {self.timeout}s') from None
+
+    def _call_with_retries(self, prompt):
+        deadline = time.monotonic() + self.timeout
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                response = self._attempt(prompt, deadline)
+            except ModelBusy:
+                self.breaker.cancel_probe()
+                raise  # our own limit, not the model failing
+            except Exception as e:
+                if self.breaker.record_failure():
+                    telemetry.error('model_circuit_open', e, failures=self.breaker.failures)
+                attempt += 1
+                delay = self.backoff * attempt
+                if isinstance(e, ModelTimeout) or attempt > self.retries or time.monotonic() + delay >= deadline:
+                    raise
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return response
+
+    def _attempt(self, prompt, deadline):
+        if not self._slots.acquire(timeout=max(0.0, min(self.slot_wait, deadline - time.monotonic()))):
+            with self._lock:
+                self.rejected += 1
+            raise ModelBusy('too many model calls in flight')
+        future = Future()
+        with self._lock:
+            self.calls += 1
+        try:
+            threading.Thread(target=self._invoke, args=(prompt, future), daemon=True, name='model-call').start()
+        except Exception:
+            self._slots.release()
+            raise
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            with self._lock:
+                self.timeouts += 1
+            raise ModelTimeout(f'no answer within {self.timeout}s') from None
+
+    def _invoke(self, prompt, future):
+        try:
+            future.set_result(self.model.generate_content(prompt, **self.call_options))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {'calls': self.calls, 'coalesced': self.coalesced, 'timeouts': self.timeouts,
+                    'rejected': self.rejected, 'circuit': self.breaker.state, 'failures': self.breaker.failures}
+
+
+class HttpModel:
+    """generate_content over the Gemini REST API (models/<name>:generateContent)."""
+
+    def __init__(self, base_url, model='gemini-pro', api_key='', timeout=10.0):
+        self.url = f"{base_url.rstrip('/')}/v1beta/models/{model}:generateContent"
+        if api_key:
+            self.url += f'?key={api_key}'
+        self.timeout = timeout
+
+    def generate_content(self, prompt):
+        body = json.dumps({'contents': [{'parts': [{'text': prompt}]}]}).encode('utf-8')
+        req = urllib.request.Request(self.url, body, {'Content-Type': 'application/json'})
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            data = json.load(resp)
+        parts = data['candidates'][0]['content']['parts']
+        return SimpleNamespace(text=''.join(p.get('text', '') for p in parts))
@@ -20,6 +20,8 @@ class User(UserMixin, db.Model):
     website = db.Column(db.String(200))  # Personal/Business website
     social_links = db.Column(db.Text)  # JSON string for social media links
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # bumped on every change to the row (profile ETags, see http_cache.py)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     provider = db.relationship('Provider', backref='user', uselist=False)
     finder = db.relationship('Finder', backref='user', uselist=False)
@@ -28,7 +30,7 @@ class User(UserMixin, db.Model):
 class Provider(db.Model):
     __tablename__ = 'providers'
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     title = db.Column(db.String(150))
     description = db.Column(db.Text)
     location = db.Column(db.String(200))
@@ -36,36 +38,101 @@ class Provider(db.Model):
     rating = db.Column(db.Float, default=0.0)
     profile_visible = db.Column(db.Boolean, default=True)
     business_name = db.Column(db.String(200))
-    business_hours = db.Column(db.Text)  # JSON string for business hours
     experience_years = db.Column(db.Integer)
-    certificates = db.Column(db.Text)  # JSON string for certificates/qualifications
-    service_areas = db.Column(db.Text)  # JSON string for service coverage areas
-    languages = db.Column(db.Text)  # JSON string for languages spoken
     hourly_rate = db.Column(db.Float)  # Hourly rate in BDT
-    portfolio_images = db.Column(db.Text)  # JSON string for portfolio image paths
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # also bumped when skills or the list attributes change (see http_cache.py)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     skills = db.relationship('ProviderSkill', backref='provider', lazy=True)
+    # list attributes live in child tables (see provider_attrs.py)
+    service_areas = db.relationship('ProviderServiceArea', backref='provider', lazy=True,
+                                    order_by='ProviderServiceArea.position', cascade='all, delete-orphan')
+    languages = db.relationship('ProviderLanguage', backref='provider', lazy=True,
+                                order_by='ProviderLanguage.position', cascade='all, delete-orphan')
+    certificates = db.relationship('ProviderCertificate', backref='provider', lazy=True,
+                                   order_by='ProviderCertificate.position', cascade='all, delete-orphan')
+    portfolio_images = db.relationship('ProviderPortfolioImage', backref='provider', lazy=True,
+                                       order_by='ProviderPortfolioImage.position', cascade='all, delete-orphan')
+    business_hours = db.relationship('ProviderBusinessHours', backref='provider', lazy=True,
+                                     order_by='ProviderBusinessHours.position', cascade='all, delete-orphan')
+    # geocoded base location and service areas (see geo.py)
+    locations = db.relationship('ProviderLocation', backref='provider', lazy=True,
+                                cascade='all, delete-orphan')
 
 class Finder(db.Model):
     __tablename__ = 'finders'
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     bio = db.Column(db.Text)
     location = db.Column(db.String(200))
     preferences = db.Column(db.Text)  # JSON string for service preferences
-    favorite_providers = db.Column(db.Text)  # JSON string for favorite provider IDs
     company_name = db.Column(db.String(200))  # For business clients
     company_size = db.Column(db.String(50))  # Company size range
     industry = db.Column(db.String(100))  # Industry sector
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    favorites = db.relationship('FinderFavorite', backref='finder', lazy=True, cascade='all, delete-orphan')
 
 class ProviderSkill(db.Model):
     __tablename__ = 'provider_skills'
     id = db.Column(db.Integer, primary_key=True)
-    provider_id = db.Column(db.Integer, db.ForeignKey('providers.id'), nullable=False)
+    provider_id = db.Column(db.Integer, db.ForeignKey('providers.id'), nullable=False, index=True)
     skill = db.Column(db.String(120), nullable=False)
 
+class ProviderServiceArea(db.Model):
+    __tablename__ = 'provider_service_areas'
+    id = db.Column(db.Integer, primary_key=True)
+    provider_id = db.Column(db.Integer, db.ForeignKey('providers.id'), nullable=False, index=True)
+    name = db.Column(db.String(120), nullable=False)
+    key = db.Column(db.String(120), nullable=False)  # lowercased name, for filtering
+    position = db.Column(db.Integer, default=0)
+
+    __table_args__ = (
+        db.Index('ix_provider_service_areas_key', 'key', 'provider_id'),
+    )
+
+class ProviderLanguage(db.Model):
+    __tablename__ = 'provider_languages'
+    id = db.Column(db.Integer, primary_key=True)
+    provider_id = db.Column(db.Integer, db.ForeignKey('providers.id'), nullable=False, index=True)
+    name = db.Column(db.String(60), nullable=False)
+    key = db.Column(db.String(60), nullable=False)  # lowercased name, for filtering
+    position = db.Column(db.Integer, default=0)
+
+    __table_args__ = (
+        db.Index('ix_provider_languages_key', 'key', 'provider_id'),
+    )
+
+class ProviderCertificate(db.Model):
+    __tablename__ = 'provider_certificates'
+    id = db.Column(db.Integer, primary_key=True)
+    provider_id = db.Column(db.Integer, db.ForeignKey('providers.id'), nullable=False, index=True)
+    name = db.Column(db.String(200), nullable=False)
+    position = db.Column(db.Integer, default=0)
+
+class ProviderPortfolioImage(db.Model):
+    __tablename__ = 'provider_portfolio_images'
+    id = db.Column(db.Integer, primary_key=True)
+    provider_id = db.Column(db.Integer, db.ForeignKey('providers.id'), nullable=False, index=True)
+    path = db.Column(db.String(200), nullable=False)  # relative to static/
+    position = db.Column(db.Integer, default=0)
+
+class ProviderBusinessHours(db.Model):
+    __tablename__ = 'provider_business_hours'
+    id = db.Column(db.Integer, primary_key=True)
+    provider_id = db.Column(db.Integer, db.ForeignKey('providers.id'), nullable=False, index=True)
+    day = db.Column(db.String(40), nullable=False)
+    hours = db.Column(db.String(100))
+    position = db.Column(db.Integer, default=0)
+
+class FinderFavorite(db.Model):
+    __tablename__ = 'finder_favorites'
+    finder_id = db.Column(db.Integer, db.ForeignKey('finders.id'), primary_key=True)
+    provider_id = db.Column(db.Integer, db.ForeignKey('providers.id'), primary_key=True, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class ServicePost(db.Model):
     __tablename__ = 'service_posts'
     id = db.Column(db.Integer, primary_key=True)
@@ -75,7 +142,67 @@ class ServicePost(db.Model):
     location = db.Column(db.String(200))
     budget_min = db.Column(db.Integer)
     budget_max = db.Column(db.Integer)
-    status = db.Column(db.String(20), default='open')
+    status = db.Column(db.String(20), default='open', index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    latitude = db.Column(db.Float)  # geocoded from location (see geo.py)
+    longitude = db.Column(db.Float)
+
+    __table_args__ = (
+        # a finder's posts, newest first
+        db.Index('ix_service_posts_finder_created', 'finder_id', 'created_at'),
+    )
+
+    # ranked providers are persisted in post_matches (see match_store.py)
+
+class ProviderLocation(db.Model):
+    __tablename__ = 'provider_locations'
+    id = db.Column(db.Integer, primary_key=True)
+    provider_id = db.Column(db.Integer, db.ForeignKey('providers.id'), nullable=False, index=True)
+    kind = db.Column(db.String(10), nullable=False)  # 'base' or 'area'
+    place = db.Column(db.String(120), nullable=False)  # gazetteer name
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    reach_km = db.Column(db.Float, default=0.0)  # radius a service area covers
+
+class StoredBlob(db.Model):
+    __tablename__ = 'stored_blobs'
+    key = db.Column(db.String(200), primary_key=True)  # storage key, also the path saved on users/portfolios
+    sha256 = db.Column(db.String(64))  # None for uploads saved before content addressing
+    size = db.Column(db.Integer)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    orphaned_at = db.Column(db.DateTime, index=True)  # when refcount last dropped to 0
 
-    # matches relationship will be computed on the fly for MVP
+class ImageVariant(db.Model):
+    __tablename__ = 'image_variants'
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(200), nullable=False, index=True)  # original upload, relative to static/
+    name = db.Column(db.String(20), nullable=False)  # 'thumb', 'card' or 'full'
+    path = db.Column(db.String(200), nullable=False)  # relative to static/
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class PostMatch(db.Model):
+    __tablename__ = 'post_matches'
+    post_id = db.Column(db.Integer, db.ForeignKey('service_posts.id'), primary_key=True)
+    provider_id = db.Column(db.Integer, db.ForeignKey('providers.id'), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+    method = db.Column(db.String(20), nullable=False)  # 'keyword', 'bm25', 'embedding' or 'gemini'
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_post_matches_post_score', 'post_id', 'score', 'provider_id'),
+        db.Index('ix_post_matches_provider_score', 'provider_id', 'score', 'post_id'),
+    )
+
+class RankRun(db.Model):
+    __tablename__ = 'rank_runs'
+    id = db.Column(db.Integer, primary_key=True)
+    method = db.Column(db.String(20), nullable=False)  # local scorer used, as in post_matches.method
+    mode = db.Column(db.String(20), nullable=False)  # 'full' or 'incremental'
+    started_at = db.Column(db.DateTime, nullable=False, index=True)  # later runs re-score what changed since
+    finished_at = db.Column(db.DateTime)
+    providers = db.Column(db.Integer, default=0)  # providers scored against all open posts
+    posts = db.Column(db.Integer, default=0)  # open posts scored against
+    rows = db.Column(db.Integer, default=0)  # post_matches rows written
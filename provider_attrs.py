@@ -0,0 +1,93 @@
+"""Provider list attributes stored as child-table rows.
+
+Service areas, languages, certificates, portfolio images and business
+hours used to be JSON strings on the providers row (favourite providers
+on finders). They are now one row per item, so they are read without
+json.loads and can be filtered in SQL: service areas and languages keep a
+lowercased `key` indexed with provider_id.
+"""
+import json
+
+from sqlalchemy import select
+
+from models import (Provider, ProviderBusinessHours, ProviderCertificate, ProviderLanguage,
+                    ProviderPortfolioImage, ProviderServiceArea)
+
+
+def split_list(text, sep=','):
+    """Distinct, stripped, non-empty items of a separated string, in order."""
+    seen = set()
+    items = []
+    for item in (text or '').split(sep):
+        item = item.strip()
+        if item and item.lower() not in seen:
+            seen.add(item.lower())
+            items.append(item)
+    return items
+
+
+def json_list(raw):
+    """Items of a legacy JSON list column (a bare string or comma-separated text also works)."""
+    if not raw:
+        return []
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        return split_list(raw)
+    if isinstance(value, list):
+        return value
+    if isinstance(value, str):
+        return split_list(value)
+    return []
+
+
+def _key(name):
+    return name.strip().lower()
+
+
+# ---- writes ----
+def set_service_areas(provider, names):
+    provider.service_areas = [ProviderServiceArea(name=n, key=_key(n), position=i)
+                              for i, n in enumerate(names)]
+
+
+def set_languages(provider, names):
+    provider.languages = [ProviderLanguage(name=n, key=_key(n), position=i) for i, n in enumerate(names)]
+
+
+def set_certificates(provider, names):
+    provider.certificates = [ProviderCertificate(name=n, position=i) for i, n in enumerate(names)]
+
+
+def set_portfolio_images(provider, paths):
+    provider.portfolio_images = [ProviderPortfolioImage(path=p, position=i) for i, p in enumerate(paths)]
+
+
+def set_business_hours(provider, hours):
+    """`hours` is a list of (day, hours) pairs."""
+    provider.business_hours = [ProviderBusinessHours(day=d, hours=h, position=i)
+                               for i, (d, h) in enumerate(hours)]
+
+
+# ---- reads ----
+def area_names(provider):
+    return [a.name for a in provider.service_areas]
+
+
+def language_names(provider):
+    return [lang.name for lang in provider.languages]
+
+
+def image_paths(provider):
+    return [img.path for img in provider.portfolio_images] if provider else []
+
+
+# ---- SQL filters ----
+def speaks(language):
+    """Criterion on Provider: has `language` (case-insensitive), via the (key, provider_id) index."""
+    return Provider.id.in_(select(ProviderLanguage.provider_id).where(ProviderLanguage.key == _key(language)))
+
+
+def serves_area(area):
+    """Criterion on Provider: lists `area` among its service areas (case-insensitive)."""
+    return Provider.id.in_(select(ProviderServiceArea.provider_id).where(ProviderServiceArea.key == _key(area)))
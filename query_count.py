@@ -0,0 +1,44 @@
+"""Helpers for counting SQL statements, e.g. to lock in query counts in tests.
+
+    with assert_max_queries(4):
+        client.get(f'/post/{post.id}/matches')
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from models import db
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine=None):
+    """Count statements executed on `engine` (default: db.engine) inside the block."""
+    engine = engine or db.engine
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter._on_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter._on_execute)
+
+
+@contextmanager
+def assert_max_queries(limit, engine=None):
+    """Fail with the executed statements if the block runs more than `limit` queries."""
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        listing = '\n'.join(f'  {i + 1}. {s}' for i, s in enumerate(counter.statements))
+        raise AssertionError(f'Expected at most {limit} queries, got {counter.count}:\n{listing}')
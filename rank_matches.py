@@ -0,0 +1,182 @@
+"""Score every provider against every open post offline and store the top matches.
+
+Providers are split into chunks and scored in a process pool with the
+configured local scorer (MATCH_SCORER). For each provider the best `--top`
+open posts are kept, for each post the best `--top` providers, and the
+union is written to post_matches in bulk, so match pages and the best
+matches dashboard read precomputed rows. Workers are spawned, not forked,
+so they do not inherit the app's thread pools.
+
+Runs are recorded in rank_runs. Unless --full is given, a run only
+re-scores providers updated since the last run against all open posts,
+and the other providers against posts created since then, then trims the
+posts it touched back to what a full run keeps; the first run (or the
+first with another scorer) is a full one. Posts ranked by Gemini keep
+their rows.
+
+    python rank_matches.py [--full] [--workers N] [--chunk-size 200] [--top 10]
+"""
+import argparse
+import heapq
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from app import app, db
+from migrations import migrate
+from models import Provider, RankRun, ServicePost, User
+import match_store
+from match_loader import load_providers_by_ids
+from embeddings import embedding_index
+
+TOP_K = 10
+
+# per-process scoring state, set by _load
+_state = {}
+
+
+def _load(method, k, post_ids):
+    posts = []
+    for start in range(0, len(post_ids), 1000):
+        posts.extend(ServicePost.query.filter(ServicePost.id.in_(post_ids[start:start + 1000])))
+    # keep the loaded posts out of the session so each chunk starts empty
+    db.session.expunge_all()
+    _state.update(method=method, k=k, posts=posts)
+
+
+def _init_worker(method, k, post_ids):
+    app.app_context().push()
+    _load(method, k, post_ids)
+
+
+def score_chunk(provider_ids, post_ids=None):
+    """
+    Score providers against the loaded posts (only `post_ids` when given).
+    Returns ({provider_id: [(score, post_id)]}, {post_id: [(score, -provider_id)]}),
+    both the best k per key, ties going to newer posts and to lower provider ids.
+    """
+    method, k, posts = _state['method'], _state['k'], _state['posts']
+    if post_ids is not None:
+        wanted = set(post_ids)
+        posts = [p for p in posts if p.id in wanted]
+    provider_top = {}
+    post_heaps = {}
+    for provider in load_providers_by_ids(provider_ids):
+        pairs = match_store.pair_scores(provider, posts, method)
+        provider_top[provider.id] = heapq.nlargest(k, pairs)
+        for score, post_id in pairs:
+            heap = post_heaps.setdefault(post_id, [])
+            entry = (score, -provider.id)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+    db.session.rollback()
+    db.session.expunge_all()
+    return provider_top, post_heaps
+
+
+def _score_job(job):
+    return score_chunk(*job)
+
+
+def _chunks(ids, size):
+    return [ids[start:start + size] for start in range(0, len(ids), size)]
+
+
+def run(full=False, workers=None, chunk_size=200, k=TOP_K):
+    """One batch run (in an app context). Returns its RankRun."""
+    method = app.config['MATCH_SCORER']
+    started = datetime.utcnow()
+    last = None
+    if not full:
+        last = (RankRun.query.filter(RankRun.method == method, RankRun.finished_at.isnot(None))
+                .order_by(RankRun.started_at.desc()).first())
+
+    gemini = match_store.gemini_ranked_post_ids()
+    post_ids = [pid for (pid,) in db.session.query(ServicePost.id).filter(ServicePost.status == 'open')
+                .order_by(ServicePost.id) if pid not in gemini]
+    provider_ids = [pid for (pid,) in db.session.query(Provider.id).join(User, Provider.user_id == User.id)
+                    .order_by(Provider.id)]
+
+    if last is None:
+        changed, new_posts = provider_ids, post_ids
+        jobs = [(chunk, None) for chunk in _chunks(provider_ids, chunk_size)]
+    else:
+        since = last.started_at
+        updated = {pid for (pid,) in db.session.query(Provider.id).filter(Provider.updated_at >= since)}
+        changed = [pid for pid in provider_ids if pid in updated]
+        created = {pid for (pid,) in db.session.query(ServicePost.id).filter(ServicePost.created_at >= since)}
+        new_posts = [pid for pid in post_ids if pid in created]
+        jobs = [(chunk, None) for chunk in _chunks(changed, chunk_size)]
+        if new_posts:
+            jobs += [(chunk, new_posts) for chunk in _chunks([pid for pid in provider_ids if pid not in updated],
+                                                            chunk_size)]
+
+    if method == 'embedding':
+        # write the vector files once instead of in every worker
+        embedding_index.ensure_built()
+    workers = os.cpu_count() if workers is None else workers
+    if workers <= 1 or len(jobs) <= 1:
+        _load(method, k, post_ids)
+        results = map(_score_job, jobs)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(min(workers, len(jobs)), mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker, initargs=(method, k, post_ids))
+        results = pool.map(_score_job, jobs)
+
+    scores = {}
+    post_heaps = {}
+    try:
+        for provider_top, chunk_heaps in results:
+            for provider_id, pairs in provider_top.items():
+                for score, post_id in pairs:
+                    scores[(post_id, provider_id)] = score
+            for post_id, pairs in chunk_heaps.items():
+                post_heaps[post_id] = heapq.nlargest(k, post_heaps.get(post_id, []) + pairs)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        _state.clear()
+    for post_id, pairs in post_heaps.items():
+        for score, neg_provider_id in pairs:
+            scores[(post_id, -neg_provider_id)] = score
+
+    if last is None:
+        # every non-Gemini row goes, including those of closed posts
+        match_store.delete_pairs([pid for (pid,) in db.session.query(ServicePost.id) if pid not in gemini])
+    else:
+        match_store.delete_pairs(new_posts)
+        if changed:
+            match_store.delete_pairs(post_ids, changed)
+    rows = match_store.bulk_save_pairs(scores, method)
+    if last is not None:
+        # unchanged providers' rows on the touched posts may now rank below the top k
+        match_store.trim_pairs(sorted({post_id for post_id, _ in scores}), k)
+    record = RankRun(method=method, mode='incremental' if last else 'full', started_at=started,
+                     finished_at=datetime.utcnow(), providers=len(changed) if last else len(provider_ids),
+                     posts=len(post_ids), rows=rows)
+    db.session.add(record)
+    db.session.commit()
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--full', action='store_true', help='re-score everything, not only what changed')
+    parser.add_argument('--workers', type=int, default=None, help='processes (default: CPU count, 1 = in-process)')
+    parser.add_argument('--chunk-size', type=int, default=200, help='providers per task')
+    parser.add_argument('--top', type=int, default=TOP_K, help='matches kept per provider and per post')
+    args = parser.parse_args()
+    with app.app_context():
+        migrate(db)
+        record = run(args.full, args.workers, args.chunk_size, args.top)
+        took = (record.finished_at - record.started_at).total_seconds()
+        print(f"{record.mode.capitalize()} {record.method} run: {record.providers} providers x {record.posts} "
+              f"open posts, {record.rows} matches written in {took:.1f}s.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Background re-ranking of match results.
+
+Routes answer with the keyword ranking straight away and hand the slow
+Gemini re-rank to a small thread pool, so HTTP workers never wait on the
+external model. Jobs are keyed (e.g. by post id) and a key that is already
+queued or running is not queued again. Finished statuses are kept until
+read with forget() or pushed out by newer ones (`max_finished`).
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import telemetry
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class RankWorker:
+    """
+    Thread pool with per-key job status. With `max_workers=0` jobs run inline
+    on submit, which keeps tests deterministic.
+    """
+
+    def __init__(self, max_workers=2, max_finished=1000):
+        self.max_workers = max_workers
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='rank-worker') if max_workers else None
+        self._lock = threading.Lock()
+        self._status = {}
+        self._finished = OrderedDict()
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Queue `fn(*args, **kwargs)` under `key`; returns False if that key is already pending."""
+        with self._lock:
+            if self._status.get(key) == PENDING:
+                return False
+            self._status[key] = PENDING
+            self._finished.pop(key, None)
+        if self._executor is None:
+            self._run(key, fn, args, kwargs)
+        else:
+            self._executor.submit(self._run, key, fn, args, kwargs)
+        return True
+
+    def _run(self, key, fn, args, kwargs):
+        try:
+            fn(*args, **kwargs)
+            status = DONE
+        except Exception as e:
+            telemetry.error('background_rank', e, key=key)
+            status = FAILED
+        with self._lock:
+            self._status[key] = status
+            self._finished[key] = None
+            while len(self._finished) > self.max_finished:
+                self._status.pop(self._finished.popitem(last=False)[0], None)
+
+    def status(self, key):
+        """'pending', 'done', 'failed' or None if this process never saw the key."""
+        with self._lock:
+            return self._status.get(key)
+
+    def forget(self, key):
+        """Drop a finished key's status, e.g. once its result is stored and shown."""
+        with self._lock:
+            if self._status.get(key) != PENDING:
+                self._status.pop(key, None)
+                self._finished.pop(key, None)
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
@@ -0,0 +1,62 @@
+"""Merging model rankings back onto candidate objects.
+
+Gemini answers with a list of IDs. These helpers map them back to the
+candidates with dict/set lookups, drop IDs the model repeats or invents,
+score the candidates it left out with a fallback scorer, and keep only the
+top `k` with a heap instead of sorting everything.
+"""
+import heapq
+
+
+def parse_ranked_ids(text):
+    """Integer IDs from a comma-separated model answer, first occurrence only."""
+    seen = set()
+    ranked = []
+    for part in (text or '').split(','):
+        part = part.strip()
+        if part.isdigit():
+            value = int(part)
+            if value not in seen:
+                seen.add(value)
+                ranked.append(value)
+    return ranked
+
+
+def top_k(scored, k=None, tiebreak=None):
+    """
+    The `k` highest (score, obj) pairs, best first. Ties keep their input
+    order, like a stable sort by score descending, unless `tiebreak(obj)`
+    gives a sort key for them. k=None sorts everything.
+    """
+    keyed = ((-score, tiebreak(obj) if tiebreak else seq, seq, score, obj)
+             for seq, (score, obj) in enumerate(scored))
+    if k is None:
+        ordered = sorted(keyed)
+    else:
+        ordered = heapq.nsmallest(k, keyed)
+    return [(score, obj) for _, _, _, score, obj in ordered]
+
+
+def merge_ranked(ranked_ids, candidates, ai_score, fallback_score, k=None):
+    """
+    Combine a model ranking with local scores.
+
+    `ranked_ids` are the model's IDs best first, `candidates` the objects
+    that were sent (anything with `.id`). Ranked candidates are scored with
+    `ai_score(position, obj)`, the rest with `fallback_score(obj)`. IDs that
+    are repeated or not among the candidates are ignored. Returns the top
+    `k` (score, obj) pairs, ranked ones ahead of unranked ones on ties.
+    """
+    by_id = {obj.id: obj for obj in candidates}
+    ranked = set()
+    scored = []
+    for obj_id in ranked_ids:
+        obj = by_id.get(obj_id)
+        if obj is None or obj_id in ranked:
+            continue
+        ranked.add(obj_id)
+        scored.append((ai_score(len(ranked) - 1, obj), obj))
+    for obj in candidates:
+        if obj.id not in ranked:
+            scored.append((fallback_score(obj), obj))
+    return top_k(scored, k)
@@ -0,0 +1,231 @@
+"""Full-text search over providers and posts.
+
+On SQLite the text lives in two FTS5 tables, provider_fts (title,
+business_name, description, skills) and post_fts (title, description),
+keyed by the provider/post id. Triggers on providers, provider_skills and
+service_posts keep them in step with every write, bulk deletes included.
+Results are ranked with FTS5's bm25() and carry a highlighted snippet.
+
+install() creates the tables and triggers (migration 6). On databases
+without FTS5 the same functions fall back to LIKE filters, unranked.
+"""
+import logging
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import and_, exists, or_, text
+from sqlalchemy.orm import contains_eager
+
+from models import db, Provider, ProviderSkill, ServicePost, User
+from match_loader import load_providers_by_ids
+
+log = logging.getLogger('servease.search')
+
+PER_PAGE = 10
+MAX_PER_PAGE = 50
+MAX_TERMS = 8
+
+# Same word split as the BM25 scorer: whitespace and punctuation only
+TOKEN_RE = re.compile(r"[^\s.,;:!?()\[\]{}\"'/\\|+&*#@<>=~`^-]+")
+
+# Highlight markers FTS5 puts around hits; swapped for <mark> after escaping
+HIT_OPEN, HIT_CLOSE = '\x02', '\x03'
+
+# bm25() weights per column, in table column order
+PROVIDER_WEIGHTS = (5.0, 3.0, 1.0, 4.0)  # title, business_name, description, skills
+POST_WEIGHTS = (3.0, 1.0)                 # title, description
+
+# unicode61 splits words at combining marks; keep Bengali vowel signs, virama etc. inside tokens
+BENGALI_MARKS = ''.join(chr(c) for c in [0x981, 0x982, 0x983, 0x9BC, *range(0x9BE, 0x9CE), 0x9D7])
+TOKENIZE = f"tokenize=\"unicode61 tokenchars '{BENGALI_MARKS}'\""
+
+_SKILLS = "(SELECT group_concat(skill, ' ') FROM provider_skills WHERE provider_id = {id})"
+
+DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS provider_fts USING fts5("
+    f"title, business_name, description, skills, {TOKENIZE})",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5(title, description, {TOKENIZE})",
+
+    f"""CREATE TRIGGER IF NOT EXISTS providers_fts_ai AFTER INSERT ON providers BEGIN
+        INSERT INTO provider_fts(rowid, title, business_name, description, skills)
+        VALUES (new.id, new.title, new.business_name, new.description, {_SKILLS.format(id='new.id')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS providers_fts_au AFTER UPDATE OF title, business_name, description
+        ON providers BEGIN
+        DELETE FROM provider_fts WHERE rowid = old.id;
+        INSERT INTO provider_fts(rowid, title, business_name, description, skills)
+        VALUES (new.id, new.title, new.business_name, new.description, {_SKILLS.format(id='new.id')});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS providers_fts_ad AFTER DELETE ON providers BEGIN
+        DELETE FROM provider_fts WHERE rowid = old.id;
+    END""",
+
+    f"""CREATE TRIGGER IF NOT EXISTS provider_skills_fts_ai AFTER INSERT ON provider_skills BEGIN
+        UPDATE provider_fts SET skills = {_SKILLS.format(id='new.provider_id')} WHERE rowid = new.provider_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS provider_skills_fts_au AFTER UPDATE ON provider_skills BEGIN
+        UPDATE provider_fts SET skills = {_SKILLS.format(id='old.provider_id')} WHERE rowid = old.provider_id;
+        UPDATE provider_fts SET skills = {_SKILLS.format(id='new.provider_id')} WHERE rowid = new.provider_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS provider_skills_fts_ad AFTER DELETE ON provider_skills BEGIN
+        UPDATE provider_fts SET skills = {_SKILLS.format(id='old.provider_id')} WHERE rowid = old.provider_id;
+    END""",
+
+    """CREATE TRIGGER IF NOT EXISTS service_posts_fts_ai AFTER INSERT ON service_posts BEGIN
+        INSERT INTO post_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS service_posts_fts_au AFTER UPDATE OF title, description
+        ON service_posts BEGIN
+        DELETE FROM post_fts WHERE rowid = old.id;
+        INSERT INTO post_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS service_posts_fts_ad AFTER DELETE ON service_posts BEGIN
+        DELETE FROM post_fts WHERE rowid = old.id;
+    END""",
+]
+
+REBUILD = [
+    "DELETE FROM provider_fts",
+    f"""INSERT INTO provider_fts(rowid, title, business_name, description, skills)
+        SELECT id, title, business_name, description, {_SKILLS.format(id='providers.id')} FROM providers""",
+    "DELETE FROM post_fts",
+    "INSERT INTO post_fts(rowid, title, description) SELECT id, title, description FROM service_posts",
+]
+
+_fts_ready = {}
+
+
+def fts_supported(conn):
+    if conn.dialect.name != 'sqlite':
+        return False
+    try:
+        conn.exec_driver_sql("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        conn.exec_driver_sql("DROP TABLE temp.fts5_probe")
+        return True
+    except Exception:
+        return False
+
+
+def install(conn):
+    """Create the FTS tables and triggers and fill them from the current rows."""
+    if not fts_supported(conn):
+        log.warning('SQLite FTS5 is not available; search uses LIKE filters')
+        return
+    for statement in DDL + REBUILD:
+        conn.exec_driver_sql(statement)
+    _fts_ready.clear()
+
+
+def fts_enabled():
+    """True when the FTS tables exist in the app's database (checked once per engine)."""
+    engine = db.engine
+    if engine not in _fts_ready:
+        with engine.connect() as conn:
+            _fts_ready[engine] = conn.dialect.name == 'sqlite' and conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'post_fts'").first() is not None
+    return _fts_ready[engine]
+
+
+def terms(q):
+    return TOKEN_RE.findall((q or '').lower())[:MAX_TERMS]
+
+
+def match_expression(q):
+    """FTS5 MATCH string: every word of `q` as a quoted prefix term, so user input is never query syntax."""
+    return ' '.join(f'"{t}"*' for t in terms(q))
+
+
+def highlight(snippet):
+    """Escape a snippet and turn the hit markers into <mark> tags."""
+    return Markup(str(escape(snippet or '')).replace(HIT_OPEN, '<mark>').replace(HIT_CLOSE, '</mark>'))
+
+
+def _plain_snippet(value, length=160):
+    value = value or ''
+    return Markup(escape(value[:length] + ('…' if len(value) > length else '')))
+
+
+def _page(page, per_page):
+    per_page = min(max(per_page or PER_PAGE, 1), MAX_PER_PAGE)
+    page = max(page or 1, 1)
+    return page, per_page, (page - 1) * per_page
+
+
+# ---- providers ----
+def search_providers(q, page=1, per_page=PER_PAGE):
+    """
+    One page of visible providers matching `q`, best first, as
+    ([(provider, rank, snippet)], has_more).
+    """
+    page, per_page, offset = _page(page, per_page)
+    if not terms(q):
+        return [], False
+    if not fts_enabled():
+        return _like_providers(q, per_page, offset)
+    rows = db.session.execute(text(f"""
+        SELECT provider_fts.rowid, bm25(provider_fts, {', '.join(map(str, PROVIDER_WEIGHTS))}) AS rank,
+               snippet(provider_fts, -1, :open, :close, '…', 12)
+        FROM provider_fts JOIN providers ON providers.id = provider_fts.rowid
+        WHERE provider_fts MATCH :match AND coalesce(providers.profile_visible, 1) != 0
+        ORDER BY rank, provider_fts.rowid
+        LIMIT :limit OFFSET :offset"""),
+        {'match': match_expression(q), 'open': HIT_OPEN, 'close': HIT_CLOSE,
+         'limit': per_page + 1, 'offset': offset}).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    providers = {p.id: p for p in load_providers_by_ids([r[0] for r in rows])}
+    return [(providers[pid], rank, highlight(snip)) for pid, rank, snip in rows if pid in providers], has_more
+
+
+def _like_providers(q, per_page, offset):
+    query = Provider.query.join(User, Provider.user_id == User.id).options(contains_eager(Provider.user))
+    for t in terms(q):
+        pattern = f'%{t}%'
+        query = query.filter(or_(
+            Provider.title.ilike(pattern), Provider.business_name.ilike(pattern), Provider.description.ilike(pattern),
+            exists().where(and_(ProviderSkill.provider_id == Provider.id, ProviderSkill.skill.ilike(pattern)))))
+    rows = (query.filter(Provider.profile_visible.isnot(False))
+            .order_by(Provider.id.desc()).offset(offset).limit(per_page + 1).all())
+    return [(p, 0.0, _plain_snippet(p.description)) for p in rows[:per_page]], len(rows) > per_page
+
+
+# ---- posts ----
+def search_posts(q, page=1, per_page=PER_PAGE):
+    """One page of open posts matching `q`, best first, as ([(post, rank, snippet)], has_more)."""
+    page, per_page, offset = _page(page, per_page)
+    if not terms(q):
+        return [], False
+    if not fts_enabled():
+        return _like_posts(q, per_page, offset)
+    rows = db.session.execute(text(f"""
+        SELECT post_fts.rowid, bm25(post_fts, {', '.join(map(str, POST_WEIGHTS))}) AS rank,
+               snippet(post_fts, -1, :open, :close, '…', 16)
+        FROM post_fts JOIN service_posts ON service_posts.id = post_fts.rowid
+        WHERE post_fts MATCH :match AND service_posts.status = 'open'
+        ORDER BY rank, post_fts.rowid DESC
+        LIMIT :limit OFFSET :offset"""),
+        {'match': match_expression(q), 'open': HIT_OPEN, 'close': HIT_CLOSE,
+         'limit': per_page + 1, 'offset': offset}).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    posts = {p.id: p for p in _posts_by_ids([r[0] for r in rows])}
+    return [(posts[pid], rank, highlight(snip)) for pid, rank, snip in rows if pid in posts], has_more
+
+
+def _post_query():
+    return ServicePost.query.join(User, ServicePost.finder_id == User.id).options(contains_eager(ServicePost.finder))
+
+
+def _posts_by_ids(ids):
+    if not ids:
+        return []
+    return _post_query().filter(ServicePost.id.in_(ids)).all()
+
+
+def _like_posts(q, per_page, offset):
+    query = _post_query().filter(ServicePost.status == 'open')
+    for t in terms(q):
+        pattern = f'%{t}%'
+        query = query.filter(or_(ServicePost.title.ilike(pattern), ServicePost.description.ilike(pattern)))
+    rows = query.order_by(ServicePost.id.desc()).offset(offset).limit(per_page + 1).all()
+    return [(p, 0.0, _plain_snippet(p.description)) for p in rows[:per_page]], len(rows) > per_page
@@ -0,0 +1,221 @@
+"""In-memory inverted index over provider skills.
+
+Maps skill tokens and full skill phrases to the providers that list them so
+matching only has to score providers that share vocabulary with a post,
+instead of walking every provider's skills on every request.
+
+The index lives in each process. Commits update it through session events
+in the committing process; other workers rebuild when they notice the
+change (see match_loader.ProviderVersion and INDEX_CHECK_SECONDS).
+"""
+import threading
+
+from sqlalchemy import event, func, cast, Integer, case
+from sqlalchemy.orm import Session
+
+from models import db, Provider, ProviderSkill
+from match_loader import provider_query, ProviderVersion
+
+
+def post_text(post):
+    """Lowercased text of a post as used by the keyword matcher."""
+    return ((post.title or '') + ' ' + (post.description or '')).lower()
+
+
+def score_skills(skills, text):
+    """
+    Keyword score of skill phrases against lowercased post text.
+    A full phrase hit is worth 2, otherwise each token hit is worth 1.
+    """
+    score = 0
+    for skill in skills:
+        phrase = skill.lower()
+        if phrase in text:
+            score += 2
+        else:
+            for token in phrase.split():
+                if token in text:
+                    score += 1
+    return score
+
+
+def boost_score(provider):
+    """Small boost by rating and verification, shared by all matchers."""
+    score = int(provider.rating or 0)
+    if provider.verified:
+        score += 2
+    return score
+
+
+class SkillIndex:
+    """
+    token -> provider ids and phrase -> provider ids postings, plus the
+    skills of each provider so candidates can be scored without loading
+    their skills from the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._tokens = {}
+        self._phrases = {}
+        self._skills = {}  # provider_id -> {skill_id: phrase}
+        self._version = ProviderVersion()
+
+    def configure(self, check_seconds=0):
+        """Look for changes committed by other processes at most every `check_seconds` (0: never)."""
+        self._version = ProviderVersion(check_seconds)
+
+    # ---- maintenance ----
+    def build(self):
+        """(Re)build the index from the provider_skills table."""
+        self._version.mark()
+        rows = db.session.query(ProviderSkill.id, ProviderSkill.provider_id, ProviderSkill.skill).all()
+        with self._lock:
+            self._tokens = {}
+            self._phrases = {}
+            self._skills = {}
+            for skill_id, provider_id, skill in rows:
+                self._add(provider_id, skill_id, skill)
+            self._built = True
+
+    def ensure_built(self):
+        if not self._built or self._version.changed():
+            self.build()
+
+    def reset(self):
+        with self._lock:
+            self._built = False
+            self._tokens = {}
+            self._phrases = {}
+            self._skills = {}
+
+    def add(self, provider_id, skill_id, skill):
+        with self._lock:
+            if self._built:
+                self._add(provider_id, skill_id, skill)
+
+    def remove(self, provider_id, skill_id):
+        with self._lock:
+            if self._built:
+                self._remove(provider_id, skill_id)
+
+    def remove_provider(self, provider_id):
+        with self._lock:
+            if self._built:
+                for skill_id in list(self._skills.get(provider_id, {})):
+                    self._remove(provider_id, skill_id)
+
+    def _add(self, provider_id, skill_id, skill):
+        phrase = skill.lower()
+        self._skills.setdefault(provider_id, {})[skill_id] = phrase
+        self._phrases.setdefault(phrase, set()).add(provider_id)
+        for token in phrase.split():
+            self._tokens.setdefault(token, set()).add(provider_id)
+
+    def _remove(self, provider_id, skill_id):
+        skills = self._skills.get(provider_id)
+        if not skills or skill_id not in skills:
+            return
+        phrase = skills.pop(skill_id)
+        remaining = set(skills.values())
+        if phrase not in remaining:
+            self._discard(self._phrases, phrase, provider_id)
+        remaining_tokens = {t for p in remaining for t in p.split()}
+        for token in phrase.split():
+            if token not in remaining_tokens:
+                self._discard(self._tokens, token, provider_id)
+        if not skills:
+            del self._skills[provider_id]
+
+    @staticmethod
+    def _discard(postings, key, provider_id):
+        ids = postings.get(key)
+        if ids is not None:
+            ids.discard(provider_id)
+            if not ids:
+                del postings[key]
+
+    # ---- lookup ----
+    def skills_for(self, provider_id):
+        with self._lock:
+            return list(self._skills.get(provider_id, {}).values())
+
+    def candidates(self, text):
+        """
+        Provider ids with at least one skill token occurring in `text`.
+        Uses the same substring test as the keyword matcher, but over the
+        distinct vocabulary instead of every provider's skills.
+        """
+        self.ensure_built()
+        with self._lock:
+            ids = set()
+            for token, postings in self._tokens.items():
+                if token in text:
+                    ids |= postings
+            return ids
+
+    def providers_with_skill(self, skill):
+        """Provider ids listing exactly this skill phrase."""
+        self.ensure_built()
+        with self._lock:
+            return set(self._phrases.get(skill.lower(), ()))
+
+    def skill_scores(self, text):
+        """{provider_id: keyword score} for every candidate of `text`."""
+        ids = self.candidates(text)
+        with self._lock:
+            return {pid: score_skills(self._skills.get(pid, {}).values(), text) for pid in ids}
+
+    def top_boost_only(self, k, exclude=(), only=None):
+        """
+        Best `k` (boost, provider) pairs among providers not in `exclude`,
+        i.e. those whose score is only their rating/verification boost.
+        `only` restricts the search to a set of provider ids.
+        """
+        boost = (cast(func.coalesce(Provider.rating, 0), Integer)
+                 + case((Provider.verified == True, 2), else_=0))  # noqa: E712
+        rest = provider_query()
+        if only is not None:
+            rest = rest.filter(Provider.id.in_(only))
+        rest = (rest
+                .order_by(boost.desc(), Provider.id)
+                .yield_per(max(k * 2, 50)))
+        scored = []
+        for p in rest:
+            if len(scored) >= k:
+                break
+            if p.id in exclude:
+                continue
+            scored.append((boost_score(p), p))
+        return scored
+
+
+skill_index = SkillIndex()
+
+
+# Keep the index in step with committed ProviderSkill changes. Operations are
+# collected per flush and applied only once the transaction commits.
+@event.listens_for(Session, 'after_flush')
+def _collect_skill_changes(session, flush_context):
+    ops = session.info.setdefault('skill_index_ops', [])
+    for obj in session.new:
+        if isinstance(obj, ProviderSkill):
+            ops.append(('add', obj.provider_id, obj.id, obj.skill))
+    for obj in session.deleted:
+        if isinstance(obj, ProviderSkill):
+            ops.append(('remove', obj.provider_id, obj.id, None))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_skill_changes(session):
+    for op, provider_id, skill_id, skill in session.info.pop('skill_index_ops', []):
+        if op == 'add':
+            skill_index.add(provider_id, skill_id, skill)
+        else:
+            skill_index.remove(provider_id, skill_id)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_skill_changes(session, previous_transaction):
+    session.info.pop('skill_index_ops', None)
@@ -0,0 +1,362 @@
+"""Content-addressed storage for uploads.
+
+An upload is streamed in chunks through sha256 into a staging file and
+stored as uploads/blobs/<2 hex>/<sha256>.<ext>, so identical images are
+kept once however often they are uploaded. The key doubles as the path
+saved in users.profile_image/cover_image and provider_portfolio_images.
+
+stored_blobs counts the references to each key. Mapper events adjust the
+count in the same transaction that sets, replaces or deletes a
+reference, so views only assign paths. A key whose count drops to zero is
+stamped orphaned_at; collect_garbage() deletes it and its image variants
+once it has stayed unreferenced for the grace period, and also sweeps
+blob files no row knows about (uploads whose request rolled back).
+
+Backends: LocalBackend writes under the static folder; S3Backend uses
+boto3 and works with any S3-compatible endpoint (MinIO, or a fake client
+passed as `client`). boto3 is optional.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from flask import url_for
+from sqlalchemy import case, event, false, inspect, select, text, update
+
+from models import db, ProviderPortfolioImage, StoredBlob, User
+
+try:
+    import boto3
+except ImportError:  # optional: only needed for STORAGE_BACKEND=s3
+    boto3 = None
+
+BLOB_PREFIX = 'uploads/blobs'
+# keys are content hashes, so an object never changes under its URL
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+CHUNK_SIZE = 64 * 1024
+GC_GRACE_SECONDS = 3600
+
+blobs = StoredBlob.__table__
+
+
+def available():
+    """True when the S3 backend can be used."""
+    return boto3 is not None
+
+
+def blob_key(digest, filename):
+    ext = os.path.splitext(filename or '')[1].lower()
+    return f'{BLOB_PREFIX}/{digest[:2]}/{digest}{ext}'
+
+
+def _stem(key):
+    # variants sit next to their blob as <sha256>.<variant>.<ext>
+    directory, name = key.rsplit('/', 1)
+    return f"{directory}/{name.split('.', 1)[0]}"
+
+
+# ---- backends ----
+class LocalBackend:
+    """Files under `root` (the static folder), served by Flask's static route."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def staging_dir(self):
+        # same filesystem as the blobs, so put_file is a rename
+        path = os.path.join(self.root, BLOB_PREFIX, 'tmp')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def put_file(self, key, path, content_type=None):
+        target = self._path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+
+    def put(self, key, fileobj, content_type=None):
+        target = self._path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target + '.part', 'wb') as out:
+            shutil.copyfileobj(fileobj, out, CHUNK_SIZE)
+        os.replace(target + '.part', target)
+
+    def open(self, key):
+        return open(self._path(key), 'rb')
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix):
+        """(key, modified timestamp) of every object under `prefix`."""
+        base = self._path(prefix)
+        for directory, _, names in os.walk(base):
+            if os.path.basename(directory) == 'tmp':
+                continue
+            for name in names:
+                path = os.path.join(directory, name)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                yield key, os.path.getmtime(path)
+
+    def url(self, key):
+        return url_for('static', filename=key)
+
+
+class S3Backend:
+    """Objects in an S3-compatible bucket, served from `public_url`."""
+
+    def __init__(self, bucket, client=None, endpoint_url=None, public_url=None):
+        if client is None:
+            if boto3 is None:
+                raise RuntimeError('boto3 is not installed')
+            client = boto3.client('s3', endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.public_url = (public_url or f'{endpoint_url or "https://s3.amazonaws.com"}/{bucket}').rstrip('/')
+
+    def staging_dir(self):
+        return None  # system temp dir
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _extra_args(content_type):
+        extra = {'CacheControl': IMMUTABLE_CACHE_CONTROL}
+        if content_type:
+            extra['ContentType'] = content_type
+        return extra
+
+    def put_file(self, key, path, content_type=None):
+        # upload_file streams large files as a multipart upload
+        self.client.upload_file(path, self.bucket, key, ExtraArgs=self._extra_args(content_type))
+
+    def put(self, key, fileobj, content_type=None):
+        self.client.upload_fileobj(fileobj, self.bucket, key, ExtraArgs=self._extra_args(content_type))
+
+    def open(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=key)['Body']
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def list(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix + '/'):
+            for obj in page.get('Contents', []):
+                yield obj['Key'], obj['LastModified'].timestamp()
+
+    def url(self, key):
+        return f'{self.public_url}/{key}'
+
+
+# ---- uploads ----
+def _file_digest(path):
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest, size
+
+
+class UploadStore:
+    """Saves uploads by content hash on the configured backend."""
+
+    def __init__(self, backend=None):
+        self.backend = backend
+
+    def configure(self, backend):
+        self.backend = backend
+
+    def save(self, file, session=None, clean=None):
+        """
+        Store a werkzeug FileStorage and return its key. The upload is read
+        CHUNK_SIZE bytes at a time; a blob already stored is not written again.
+        `clean(path)` may rewrite the staged file (e.g. strip EXIF) and returns
+        True if it did; the key is the hash of what is finally stored, since
+        a key's bytes must never change afterwards.
+        """
+        session = session or db.session
+        digest = hashlib.sha256()
+        size = 0
+        staging = tempfile.NamedTemporaryFile(dir=self.backend.staging_dir(), suffix='.upload', delete=False)
+        try:
+            with staging:
+                for chunk in iter(lambda: file.stream.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    staging.write(chunk)
+                    size += len(chunk)
+            if clean is not None and clean(staging.name):
+                digest, size = _file_digest(staging.name)
+            key = blob_key(digest.hexdigest(), file.filename)
+            row = session.execute(select(blobs.c.refcount).where(blobs.c.key == key)).first()
+            now = datetime.utcnow()
+            # the row is written before the file is checked: collect_garbage only deletes a
+            # file-only orphan while holding the lock this write takes (see _lock_blobs)
+            if row is None:
+                # unreferenced until a user/portfolio row points at it (see the mapper events below)
+                session.execute(blobs.insert().values(key=key, sha256=digest.hexdigest(), size=size, refcount=0,
+                                                      created_at=now, orphaned_at=now))
+            else:
+                # an orphan uploaded again gets a fresh grace period, so collect_garbage cannot
+                # delete it before the row that will reference it is committed
+                session.execute(update(blobs).where(blobs.c.key == key, blobs.c.refcount <= 0)
+                                .values(orphaned_at=now))
+            if row is None or not self.backend.exists(key):
+                self.backend.put_file(key, staging.name, file.mimetype)
+            return key
+        finally:
+            if os.path.exists(staging.name):
+                os.remove(staging.name)
+
+    def open(self, key):
+        return self.backend.open(key)
+
+    def put(self, key, fileobj, content_type=None):
+        self.backend.put(key, fileobj, content_type)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def url(self, key):
+        return self.backend.url(key)
+
+
+upload_store = UploadStore()
+
+
+def create_backend(name, static_root, bucket=None, endpoint_url=None, public_url=None):
+    """Backend for a STORAGE_BACKEND value: 'local' (default) or 's3'."""
+    if name == 's3':
+        return S3Backend(bucket, endpoint_url=endpoint_url, public_url=public_url)
+    return LocalBackend(static_root)
+
+
+# ---- reference counting ----
+def change_refcount(conn, key, delta):
+    """Add `delta` references to `key` on `conn`; keys saved before this table existed get a row."""
+    if not key:
+        return
+    now = datetime.utcnow()
+    count = blobs.c.refcount + delta
+    result = conn.execute(update(blobs).where(blobs.c.key == key).values(
+        refcount=count, orphaned_at=case((count <= 0, now), else_=None)))
+    if result.rowcount == 0 and delta > 0:
+        conn.execute(blobs.insert().values(key=key, refcount=delta, created_at=now))
+
+
+def release(key, session=None):
+    """Drop one reference by hand, for deletes that bypass the ORM (bulk query deletes)."""
+    change_refcount((session or db.session).connection(), key, -1)
+
+
+def _changed_refs(target, columns, connection):
+    state = inspect(target)
+    for column in columns:
+        history = state.attrs[column].history
+        for key in history.added:
+            change_refcount(connection, key, 1)
+        for key in history.deleted:
+            change_refcount(connection, key, -1)
+
+
+# active history: replacing an unloaded path still reports the old value to after_update
+for _attr in (User.profile_image, User.cover_image, ProviderPortfolioImage.path):
+    event.listen(_attr, 'set', lambda target, value, old, initiator: None, active_history=True)
+
+_USER_REFS = ('profile_image', 'cover_image')
+
+
+@event.listens_for(User, 'after_insert')
+def _user_inserted(mapper, connection, target):
+    for column in _USER_REFS:
+        change_refcount(connection, getattr(target, column), 1)
+
+
+@event.listens_for(User, 'after_update')
+def _user_updated(mapper, connection, target):
+    _changed_refs(target, _USER_REFS, connection)
+
+
+@event.listens_for(User, 'after_delete')
+def _user_deleted(mapper, connection, target):
+    for column in _USER_REFS:
+        change_refcount(connection, getattr(target, column), -1)
+
+
+@event.listens_for(ProviderPortfolioImage, 'after_insert')
+def _image_inserted(mapper, connection, target):
+    change_refcount(connection, target.path, 1)
+
+
+@event.listens_for(ProviderPortfolioImage, 'after_update')
+def _image_updated(mapper, connection, target):
+    _changed_refs(target, ('path',), connection)
+
+
+@event.listens_for(ProviderPortfolioImage, 'after_delete')
+def _image_deleted(mapper, connection, target):
+    change_refcount(connection, target.path, -1)
+
+
+# ---- garbage collection ----
+def collect_garbage(grace_seconds=GC_GRACE_SECONDS, now=None):
+    """
+    Delete blobs unreferenced for `grace_seconds`, with their variants, and
+    blob files without a row. Returns the number of keys deleted.
+    """
+    import images
+
+    now = now or time.time()
+    cutoff = datetime.utcfromtimestamp(now) - timedelta(seconds=grace_seconds)
+    victims = db.session.execute(select(blobs.c.key).where(
+        blobs.c.refcount <= 0, blobs.c.orphaned_at < cutoff)).scalars().all()
+    deleted = 0
+    for key in victims:
+        # re-check in the delete: a request may have referenced it since the select
+        if db.session.execute(blobs.delete().where(blobs.c.key == key, blobs.c.refcount <= 0)).rowcount:
+            images.delete_image(key)
+            deleted += 1
+    db.session.commit()
+
+    known = {_stem(key) for key in db.session.execute(select(blobs.c.key)).scalars()}
+    db.session.commit()
+    for key, modified in list(upload_store.backend.list(BLOB_PREFIX)):
+        if _stem(key) in known or modified >= now - grace_seconds:
+            continue
+        # an upload may have inserted its row since the listing: re-check while holding the
+        # lock its insert needs, and keep the lock until the file is gone
+        _lock_blobs(db.session)
+        stem = _stem(key)
+        if db.session.execute(select(blobs.c.key).where(
+                (blobs.c.key == stem) | blobs.c.key.startswith(f'{stem}.', autoescape=True)).limit(1)).first() is None:
+            upload_store.delete(key)
+            deleted += 1
+        db.session.commit()
+    return deleted
+
+
+def _lock_blobs(session):
+    """Block inserts into stored_blobs until the current transaction ends."""
+    if session.get_bind().dialect.name == 'postgresql':
+        session.execute(text('LOCK TABLE stored_blobs IN SHARE ROW EXCLUSIVE MODE'))
+    else:
+        # a write takes SQLite's database lock even when it matches no row
+        session.execute(update(blobs).where(false()).values(refcount=blobs.c.refcount))
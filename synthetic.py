@@ -0,0 +1,192 @@
+"""Deterministic synthetic marketplace for benchmarks and load tests.
+
+generate() builds rows for N providers and M posts from one seed, so two
+runs with the same arguments produce the same data:
+
+* skills follow a Zipf-like distribution (plumbing and electrical work are
+  common, photography and tailoring rare); each provider has a main skill
+  and up to three more;
+* places come from the bundled gazetteer (data/bd_gazetteer.csv), weighted
+  towards Dhaka and the other large districts; posts and providers name a
+  thana or district, providers also list nearby service areas;
+* about a third of the posts are written in Bangla, the rest in English.
+
+populate() inserts the rows into an empty database in chunks with Core
+inserts (the FTS triggers still fire; run geo.backfill() for coordinates).
+"""
+import csv
+import random
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+import geo
+from models import db
+
+# skill, Bangla name, English job phrases, Bangla job phrases (most common first)
+SKILLS = [
+    ('plumbing', 'প্লাম্বিং', ['fix a leaking kitchen pipe', 'replace the bathroom fittings', 'unblock the sink drain'],
+     ['রান্নাঘরের পাইপ লিক ঠিক করতে হবে', 'বাথরুমের ফিটিংস বদলাতে হবে']),
+    ('electrical wiring', 'ইলেকট্রিক ওয়্যারিং', ['rewire two rooms', 'install ceiling fans and lights', 'fix a short circuit'],
+     ['দুই রুমের ওয়্যারিং করতে হবে', 'সিলিং ফ্যান লাগাতে হবে']),
+    ('ac repair', 'এসি মেরামত', ['AC is not cooling', 'service two split AC units', 'gas refill for the AC'],
+     ['এসি ঠান্ডা হচ্ছে না', 'এসি সার্ভিসিং করাতে চাই']),
+    ('house cleaning', 'বাসা পরিষ্কার', ['deep cleaning of a three bedroom flat', 'kitchen and bathroom cleaning'],
+     ['তিন রুমের ফ্ল্যাট পরিষ্কার করতে হবে', 'রান্নাঘর ও বাথরুম পরিষ্কার']),
+    ('house painting', 'রং করা', ['paint two rooms', 'exterior wall painting', 'repaint the living room'],
+     ['দুই রুম রং করাতে চাই', 'বাসার দেয়াল রং করতে হবে']),
+    ('math tutoring', 'গণিত টিউশন', ['math tutor for class eight', 'SSC math preparation', 'HSC higher math'],
+     ['ক্লাস এইটের জন্য গণিত শিক্ষক', 'এসএসসি গণিত প্রস্তুতি']),
+    ('carpentry', 'কাঠমিস্ত্রি', ['repair a wooden wardrobe', 'build kitchen cabinets', 'fix the door hinges'],
+     ['কাঠের আলমারি মেরামত', 'রান্নাঘরের কেবিনেট বানাতে হবে']),
+    ('house shifting', 'বাসা বদল', ['move a two bedroom flat', 'packing and shifting service'],
+     ['বাসা বদলের জন্য লোক দরকার', 'মালামাল প্যাকিং ও শিফটিং']),
+    ('english tutoring', 'ইংরেজি টিউশন', ['spoken english for adults', 'IELTS preparation', 'english tutor for class five'],
+     ['ইংরেজি শিক্ষক প্রয়োজন', 'আইইএলটিএস প্রস্তুতি']),
+    ('web design', 'ওয়েব ডিজাইন', ['website for a small shop', 'redesign our company website'],
+     ['দোকানের জন্য ওয়েবসাইট', 'কোম্পানির ওয়েবসাইট বানাতে চাই']),
+    ('cooking', 'রান্না', ['cook for a family of four', 'catering for a small event'],
+     ['চার জনের পরিবারের জন্য বাবুর্চি', 'ছোট অনুষ্ঠানের রান্না']),
+    ('car wash', 'গাড়ি ধোয়া', ['weekly car wash at home', 'interior car cleaning'],
+     ['বাসায় গাড়ি ধোয়ানো', 'গাড়ির ভেতর পরিষ্কার']),
+    ('graphic design', 'গ্রাফিক ডিজাইন', ['logo design for a startup', 'facebook page banner'],
+     ['নতুন ব্যবসার লোগো ডিজাইন', 'ফেসবুক পেজের ব্যানার']),
+    ('gardening', 'বাগান পরিচর্যা', ['rooftop garden care', 'plant and maintain a lawn'],
+     ['ছাদবাগান পরিচর্যা', 'বাগানের গাছ লাগাতে হবে']),
+    ('photography', 'ফটোগ্রাফি', ['wedding photography', 'product photos for an online shop'],
+     ['বিয়ের ছবি তোলা', 'অনলাইন শপের পণ্যের ছবি']),
+    ('tailoring', 'দর্জি', ['stitch three salwar kameez', 'alter a suit'],
+     ['তিনটি সালোয়ার কামিজ সেলাই', 'স্যুট অল্টার করাতে হবে']),
+]
+SKILL_WEIGHTS = [1 / (rank + 1) ** 1.07 for rank in range(len(SKILLS))]
+
+# relative share of listings per district; the rest get 1
+DISTRICT_WEIGHTS = {'Dhaka': 40, 'Chattogram': 12, 'Gazipur': 6, 'Narayanganj': 5, 'Sylhet': 4, 'Khulna': 3,
+                    'Rajshahi': 3, 'Cumilla': 2}
+LANGUAGES = ['Bangla', 'English', 'Hindi', 'Urdu']
+TITLES = ['{} Specialist', 'Professional {}', '{} Expert', 'Experienced {} Service']
+FIRST_NAMES = ['Rahim', 'Karim', 'Fatema', 'Ayesha', 'Sumon', 'Nasrin', 'Tanvir', 'Sadia', 'Rafiq', 'Mitu',
+               'Hasan', 'Jannat', 'Imran', 'Shirin', 'Arif', 'Nusrat']
+LAST_NAMES = ['Ahmed', 'Hossain', 'Rahman', 'Islam', 'Khan', 'Chowdhury', 'Akter', 'Uddin', 'Sarkar', 'Das']
+BASE_TIME = datetime(2025, 1, 1)
+BENGALI = re.compile('[ঀ-৿]')
+
+# insert order (parents first)
+TABLES = ('users', 'finders', 'providers', 'provider_skills', 'provider_languages', 'provider_service_areas',
+          'service_posts')
+
+
+def load_places(path=geo.GAZETTEER_PATH):
+    """{district: [(English name, Bangla name, location text)]} from the gazetteer."""
+    places = {}
+    with open(path, encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            bangla = next((a for a in row['aliases'].split('|') if BENGALI.search(a)), row['name'])
+            text = row['name'] if row['kind'] == 'district' else f"{row['name']}, {row['district']}"
+            places.setdefault(row['district'], []).append((row['name'], bangla, text))
+    return places
+
+
+class _Picker:
+    def __init__(self, rnd, places):
+        self.rnd = rnd
+        self.places = places
+        self.districts = sorted(places)
+        self.weights = [DISTRICT_WEIGHTS.get(d, 1) for d in self.districts]
+
+    def skill(self):
+        return self.rnd.choices(SKILLS, SKILL_WEIGHTS)[0]
+
+    def district(self):
+        return self.rnd.choices(self.districts, self.weights)[0]
+
+    def place(self, district=None):
+        return self.rnd.choice(self.places[district or self.district()])
+
+    def name(self):
+        return f'{self.rnd.choice(FIRST_NAMES)} {self.rnd.choice(LAST_NAMES)}'
+
+
+def generate(providers=1000, posts=2000, finders=None, seed=42, bangla_share=0.35, password='x'):
+    """
+    Rows for a marketplace of `providers` providers and `posts` posts by
+    `finders` finders (default: one per five posts), as {table: [dict]} with
+    explicit ids starting at 1. `password` is stored as-is for every user.
+    """
+    rnd = random.Random(seed)
+    pick = _Picker(rnd, load_places())
+    finders = finders or max(1, posts // 5)
+    data = {table: [] for table in TABLES}
+    user_id = 0
+
+    def add_user(role, location, days_ago):
+        nonlocal user_id
+        user_id += 1
+        created = BASE_TIME - timedelta(days=days_ago)
+        data['users'].append({'id': user_id, 'name': pick.name(), 'email': f'{role}{user_id}@example.com',
+                              'password': password, 'role': role, 'location': location,
+                              'created_at': created, 'updated_at': created})
+        return user_id, created
+
+    for i in range(1, providers + 1):
+        district = pick.district()
+        _, _, location = pick.place(district)
+        uid, created = add_user('provider', location, rnd.randint(30, 720))
+        main = pick.skill()
+        skills = [main[0]]
+        for _ in range(rnd.randint(0, 3)):
+            extra = pick.skill()[0]
+            if extra not in skills:
+                skills.append(extra)
+        data['providers'].append({
+            'id': i, 'user_id': uid, 'title': rnd.choice(TITLES).format(main[0].title()),
+            'description': f"{rnd.randint(1, 15)} years of {main[0]} work. Also: {', '.join(skills[1:]) or 'none'}. "
+                           f"{rnd.choice(main[2]).capitalize()} and more.",
+            'location': location, 'verified': rnd.random() < 0.3,
+            'rating': None if rnd.random() < 0.2 else round(min(5.0, rnd.triangular(2.5, 5.0, 4.4)), 1),
+            'experience_years': rnd.randint(0, 20), 'hourly_rate': rnd.choice([None, 300, 500, 800, 1200, 2000]),
+            'profile_visible': True, 'created_at': created, 'updated_at': created,
+        })
+        data['provider_skills'].extend({'provider_id': i, 'skill': s} for s in skills)
+        languages = ['Bangla'] + [lang for lang in LANGUAGES[1:] if rnd.random() < (0.5 if lang == 'English' else 0.1)]
+        data['provider_languages'].extend({'provider_id': i, 'name': lang, 'key': lang.lower(), 'position': n}
+                                          for n, lang in enumerate(languages))
+        areas = {pick.place(district)[0] for _ in range(rnd.randint(0, 3))}
+        data['provider_service_areas'].extend({'provider_id': i, 'name': a, 'key': a.lower(), 'position': n}
+                                              for n, a in enumerate(sorted(areas)))
+
+    finder_users = []
+    for i in range(1, finders + 1):
+        _, _, location = pick.place()
+        uid, created = add_user('finder', location, rnd.randint(0, 365))
+        finder_users.append(uid)
+        data['finders'].append({'id': i, 'user_id': uid, 'location': location, 'created_at': created,
+                                'updated_at': created})
+
+    for i in range(1, posts + 1):
+        skill, skill_bn, phrases, phrases_bn = pick.skill()
+        name, name_bn, location = pick.place()
+        if rnd.random() < bangla_share:
+            title = f'{name_bn}-এ {skill_bn} দরকার'
+            description = f'{rnd.choice(phrases_bn)}। {name_bn} এলাকায়, যত তাড়াতাড়ি সম্ভব।'
+        else:
+            title = rnd.choice([f'Need {skill} in {name}', f'Looking for {skill} help', f'{skill.title()} needed'])
+            description = f'{rnd.choice(phrases).capitalize()}. Location: {name}. Please share your rate.'
+        budget_min = rnd.choice([0, 300, 500, 1000, 2000])
+        data['service_posts'].append({
+            'id': i, 'finder_id': rnd.choice(finder_users), 'title': title, 'description': description,
+            'location': location, 'budget_min': budget_min, 'budget_max': budget_min + rnd.choice([0, 500, 1500, 5000]),
+            'status': 'open' if rnd.random() < 0.9 else 'closed',
+            'created_at': BASE_TIME - timedelta(minutes=rnd.randint(0, 60 * 24 * 90)),
+        })
+    return data
+
+
+def populate(conn, data, chunk_size=1000):
+    """Insert generate()'s rows on `conn` (an empty schema), `chunk_size` rows per statement batch."""
+    for table in TABLES:
+        rows = data[table]
+        for start in range(0, len(rows), chunk_size):
+            conn.execute(insert(db.metadata.tables[table]), rows[start:start + chunk_size])
+    return {table: len(data[table]) for table in TABLES}
@@ -0,0 +1,341 @@
+"""Per-request timing, structured logs and Prometheus metrics.
+
+Each request gets a RequestTimer in flask.g. Spans split its time into
+exclusive parts: while a span is open the enclosing one is paused, so a
+query run during scoring counts as `db`, not `scoring`, and the parts add
+up to the request time (the rest is reported as `app`). Spans:
+
+* db       every SQL statement (engine events, see instrument_engine)
+* model    Gemini generate_content calls (external_call)
+* scoring  local scorers and rank merging (span('scoring'))
+* render   render_template (Flask's template signals)
+
+finish_request() turns them into a Server-Timing header, one JSON log line
+on the 'servease.telemetry' logger and observations in the metrics below,
+exposed in Prometheus text format by /metrics, along with the counters of
+components registered with register_stats() (e.g. the ranking cache).
+Metrics are kept per process; with several workers each one reports its own.
+"""
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from flask import before_render_template, g, has_app_context, has_request_context, request, template_rendered
+from sqlalchemy import event
+
+log = logging.getLogger('servease.telemetry')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+# ---- metrics ----
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    pairs = ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return '{' + pairs + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[tuple(labels)] += amount
+
+    def value(self, labels=()):
+        with self._lock:
+            return self._values.get(tuple(labels), 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.labelnames, labels)} {value:g}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.setdefault(tuple(labels), [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, labels=()):
+        with self._lock:
+            series = self._series.get(tuple(labels))
+            return series[-1] if series else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        names = self.labelnames + ('le',)
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                for bound, n in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{_labels(names, labels + (f"{bound:g}",))} {n}')
+                lines.append(f'{self.name}_bucket{_labels(names, labels + ("+Inf",))} {series[-1]}')
+                lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {series[-2]:g}')
+                lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}')
+        return lines
+
+
+REQUESTS = Counter('servease_requests_total', 'Requests by route, method and status.', ('route', 'method', 'status'))
+REQUEST_SECONDS = Histogram('servease_request_duration_seconds', 'Request duration by route.', ('route', 'method'))
+SPAN_SECONDS = Histogram('servease_request_span_seconds', 'Exclusive time per span (db, model, scoring, render, app).',
+                         ('route', 'span'))
+REQUEST_QUERIES = Histogram('servease_request_queries', 'SQL statements per request.', ('route',), QUERY_BUCKETS)
+EXTERNAL_SECONDS = Histogram('servease_external_call_duration_seconds', 'External calls (e.g. Gemini) by outcome.',
+                             ('call', 'outcome'))
+ERRORS = Counter('servease_errors_total', 'Handled errors by kind.', ('kind',))
+METRICS = [REQUESTS, REQUEST_SECONDS, SPAN_SECONDS, REQUEST_QUERIES, EXTERNAL_SECONDS, ERRORS]
+
+# stats() keys that only grow; the others (entries, hit_rate, ...) are gauges
+STATS_COUNTERS = {'hits', 'shared_hits', 'misses', 'evictions', 'invalidations',
+                  'calls', 'coalesced', 'timeouts', 'rejected'}
+
+
+class Stats:
+    """The numbers of a component's stats() dict, read when scraped, as servease_<prefix>_<key>."""
+
+    def __init__(self, prefix, documentation, stats):
+        self.prefix = prefix
+        self.documentation = documentation
+        self.stats = stats
+
+    def render(self):
+        lines = []
+        for key, value in self.stats().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            kind = 'counter' if key in STATS_COUNTERS else 'gauge'
+            name = f"servease_{self.prefix}_{key}{'_total' if kind == 'counter' else ''}"
+            lines += [f'# HELP {name} {self.documentation}: {key}.', f'# TYPE {name} {kind}', f'{name} {value:g}']
+        return lines
+
+
+def register_stats(prefix, documentation, stats):
+    """Publish `stats()` (a dict like RankingCache.stats returns) in /metrics under servease_<prefix>_."""
+    METRICS[:] = [m for m in METRICS if getattr(m, 'prefix', None) != prefix]
+    METRICS.append(Stats(prefix, documentation, stats))
+
+
+def metrics_text():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# ---- spans ----
+class RequestTimer:
+    """Exclusive time per span name for one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self._stack = []  # [name, resumed_at]
+
+    def push(self, name):
+        """Open a span; returns it, for pop(expected=...)."""
+        now = time.perf_counter()
+        if self._stack:
+            top = self._stack[-1]
+            self.totals[top[0]] += now - top[1]
+        entry = [name, now]
+        self._stack.append(entry)
+        self.counts[name] += 1
+        return entry
+
+    def pop(self, expected=None):
+        """Close the innermost span (only if it is `expected`, when given)."""
+        if not self._stack or (expected is not None and self._stack[-1] is not expected):
+            return
+        now = time.perf_counter()
+        name, resumed_at = self._stack.pop()
+        self.totals[name] += now - resumed_at
+        if self._stack:
+            self._stack[-1][1] = now
+
+    def close(self):
+        # spans left open by an exception
+        while self._stack:
+            self.pop()
+        return time.perf_counter() - self.started
+
+
+def current_timer():
+    if has_app_context():
+        return g.get('_request_timer')
+    return None
+
+
+@contextmanager
+def span(name):
+    """Count the enclosed time as `name` in the current request (no-op outside requests)."""
+    timer = current_timer()
+    if timer is None:
+        yield
+        return
+    timer.push(name)
+    try:
+        yield
+    finally:
+        timer.pop()
+
+
+@contextmanager
+def external_call(name, span_name='model'):
+    """A call to an outside service: a span, plus a duration/outcome observation even outside requests."""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        with span(span_name):
+            yield
+        outcome = 'ok'
+    finally:
+        EXTERNAL_SECONDS.observe((name, outcome), time.perf_counter() - started)
+
+
+def error(kind, exc, **fields):
+    """Count and log a handled error (with the request path when there is one)."""
+    ERRORS.inc((kind,))
+    if has_request_context():
+        fields.setdefault('path', request.path)
+    log.error('error', extra={'fields': {'kind': kind, 'error': str(exc), 'type': type(exc).__name__, **fields}})
+
+
+# ---- hooks ----
+def instrument_engine(engine):
+    """Time every statement on `engine` as a `db` span."""
+    event.listen(engine, 'before_cursor_execute', _before_execute)
+    event.listen(engine, 'after_cursor_execute', _after_execute)
+    event.listen(engine, 'handle_error', _execute_failed)
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    timer = current_timer()
+    if timer is not None and context is not None:
+        context._telemetry_span = timer.push('db')
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    _end_db_span(context)
+
+
+def _execute_failed(exception_context):
+    # errors raised before the cursor ran (e.g. while connecting) have no span to close
+    _end_db_span(exception_context.execution_context)
+
+
+def _end_db_span(context):
+    entry = getattr(context, '_telemetry_span', None)
+    timer = current_timer()
+    if entry is not None and timer is not None:
+        context._telemetry_span = None
+        timer.pop(expected=entry)
+
+
+def _render_started(sender, template, context, **extra):
+    timer = current_timer()
+    if timer is not None:
+        timer.push('render')
+
+
+def _render_finished(sender, template, context, **extra):
+    timer = current_timer()
+    if timer is not None:
+        timer.pop()
+
+
+before_render_template.connect(_render_started)
+template_rendered.connect(_render_finished)
+
+
+# ---- requests ----
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, event and the record's `fields`."""
+
+    def format(self, record):
+        data = {'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+                'level': record.levelname.lower(), 'logger': record.name, 'event': record.getMessage()}
+        data.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+_settings = {'log_requests': True, 'server_timing': True}
+
+
+def configure(log_requests=True, server_timing=True, stream=None):
+    """Request logging and the Server-Timing header; JSON lines go to `stream` (default stderr)."""
+    _settings.update(log_requests=log_requests, server_timing=server_timing)
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter())
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+
+
+def start_request():
+    g._request_timer = RequestTimer()
+
+
+def finish_request(response):
+    """Record the request's spans: metrics, the JSON log line and Server-Timing."""
+    timer = g.pop('_request_timer', None)
+    if timer is None:
+        return response
+    total = timer.close()
+    spans = dict(timer.totals)
+    spans['app'] = max(0.0, total - sum(spans.values()))
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    queries = timer.counts.get('db', 0)
+
+    REQUESTS.inc((route, request.method, response.status_code))
+    REQUEST_SECONDS.observe((route, request.method), total)
+    REQUEST_QUERIES.observe((route,), queries)
+    for name, seconds in spans.items():
+        SPAN_SECONDS.observe((route, name), seconds)
+
+    if _settings['log_requests'] and request.endpoint != 'static':
+        log.info('request', extra={'fields': {
+            'method': request.method, 'path': request.path, 'route': route, 'status': response.status_code,
+            'duration_ms': round(total * 1000, 2), 'queries': queries,
+            'spans_ms': {name: round(seconds * 1000, 2) for name, seconds in spans.items()},
+            'model_calls': timer.counts.get('model', 0),
+        }})
+    if _settings['server_timing']:
+        entries = [f'{name};dur={seconds * 1000:.1f}' + (f';desc="{queries} queries"' if name == 'db' else '')
+                   for name, seconds in spans.items()]
+        entries.append(f'total;dur={total * 1000:.1f}')
+        response.headers.add('Server-Timing', ', '.join(entries))
+    return response
@@ -0,0 +1,92 @@
+"""Fragment caching and start-up warmup for Jinja templates.
+
+    {% cache 'post-card', post, post.status, ttl=60 %} ... {% endcache %}
+
+renders the block once and keeps the HTML in fragment_cache. Every
+argument is part of the key; a model instance stands for its table, id
+and updated_at (created_at for rows without one), so editing the row
+renders the block again instead of serving stale HTML. Provider.updated_at
+also moves when its skills or list attributes change (see http_cache.py).
+`ttl` defaults to the cache's; blocks showing relative times (|timeago)
+should pass a short one. Fragments must not contain per-request data such
+as CSRF tokens.
+
+warm_templates() compiles every template at start-up, optionally through
+a bytecode cache on disk that later processes load instead of compiling.
+"""
+import hashlib
+import os
+import time
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from sqlalchemy import inspect
+
+from fragment_cache import fragment_cache
+
+
+def key_part(value):
+    """Stable text for one key argument; model rows carry their timestamp."""
+    state = inspect(value, raiseerr=False)
+    if state is not None and getattr(state, 'mapper', None) is not None:
+        stamp = getattr(value, 'updated_at', None) or getattr(value, 'created_at', None)
+        return f"{state.mapper.persist_selectable.name}:{state.identity}:{stamp.isoformat() if stamp else ''}"
+    if isinstance(value, (list, tuple)):
+        return '[' + ','.join(key_part(v) for v in value) + ']'
+    return repr(value)
+
+
+def fragment_key(location, parts):
+    data = '|'.join(key_part(p) for p in parts)
+    return f"tpl:{location}:{hashlib.sha1(data.encode('utf-8')).hexdigest()}"
+
+
+class CacheExtension(Extension):
+    """The {% cache %} tag."""
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = []
+        ttl = nodes.Const(None)
+        while parser.stream.current.type != 'block_end':
+            if parts:
+                parser.stream.expect('comma')
+            if parser.stream.current.test('name:ttl') and parser.stream.look().test('assign'):
+                parser.stream.skip(2)
+                ttl = parser.parse_expression()
+            else:
+                parts.append(parser.parse_expression())
+        if not parts:
+            parser.fail('cache needs at least one key argument', lineno)
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        # the template and line keep equal keys in different blocks apart
+        location = nodes.Const(f'{parser.name}:{lineno}')
+        call = self.call_method('_render', [location, nodes.List(parts), ttl])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, location, parts, ttl, caller):
+        html = fragment_cache.get_or_render(fragment_key(location, parts), caller, ttl=ttl)
+        return Markup(html)
+
+
+def bytecode_cache(directory):
+    """A Jinja bytecode cache in `directory` (created if needed), or None without one."""
+    if not directory:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    return FileSystemBytecodeCache(directory)
+
+
+def warm_templates(env):
+    """Load and compile every template into `env`'s cache; returns (count, seconds)."""
+    start = time.perf_counter()
+    names = env.list_templates(filter_func=lambda name: name.endswith('.html'))
+    for name in names:
+        try:
+            env.get_template(name)
+        except Exception as e:
+            print(f"Template warmup error ({name}): {e}")
+    return len(names), time.perf_counter() - start
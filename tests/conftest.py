@@ -0,0 +1,106 @@
+"""The app on a throwaway SQLite database for tests.
+
+The app reads its configuration from the environment at import time, so
+it is set here first. Caches that would hide queries (users, fragments)
+are off and Gemini is not configured.
+"""
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_tmp = tempfile.mkdtemp(prefix='servease-test-')
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(_tmp, 'test.db')}",
+    'GEMINI_API_KEY': '', 'GEMINI_BASE_URL': '', 'MATCHING_ASYNC': '0',
+    'LLM_CACHE_BACKEND': 'memory', 'USER_CACHE_TTL': '0', 'FRAGMENT_CACHE_TTL': '0',
+    'TEMPLATE_BYTECODE_DIR': '', 'TEMPLATE_WARMUP': '0', 'REQUEST_LOG': '0',
+})
+
+import app as servease  # noqa: E402
+from migrations import migrate  # noqa: E402
+from models import db, Finder, Provider, ProviderSkill, ServicePost, User  # noqa: E402
+
+_ids = itertools.count(1)
+
+
+@pytest.fixture(scope='session')
+def app():
+    servease.app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with servease.app.app_context():
+        migrate(db)
+    return servease.app
+
+
+@pytest.fixture
+def make(app):
+    """Factories for users with their provider/finder rows; each returns the user id."""
+
+    class Make:
+        @staticmethod
+        def provider(*skills, location='Dhaka'):
+            n = next(_ids)
+            with app.app_context():
+                user = User(name=f'Provider {n}', email=f'provider{n}@example.com', password='x', role='provider')
+                db.session.add(user)
+                db.session.flush()
+                provider = Provider(user_id=user.id, title='Handyman', description='Repairs at home',
+                                    location=location)
+                db.session.add(provider)
+                db.session.flush()
+                db.session.add_all(ProviderSkill(provider_id=provider.id, skill=s) for s in skills)
+                db.session.commit()
+                return user.id
+
+        @staticmethod
+        def finder():
+            n = next(_ids)
+            with app.app_context():
+                user = User(name=f'Finder {n}', email=f'finder{n}@example.com', password='x', role='finder')
+                db.session.add(user)
+                db.session.flush()
+                db.session.add(Finder(user_id=user.id, location='Dhaka'))
+                db.session.commit()
+                return user.id
+
+        @staticmethod
+        def post(finder_id, title, description='', location='Dhaka'):
+            """An open post saved directly (not ranked); returns its id."""
+            with app.app_context():
+                post = ServicePost(finder_id=finder_id, title=title, description=description, location=location)
+                db.session.add(post)
+                db.session.commit()
+                return post.id
+
+    return Make()
+
+
+@pytest.fixture
+def client_for(app):
+    """A test client logged in as the given user id."""
+
+    def client_for(user_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        return client
+
+    return client_for
+
+
+@pytest.fixture
+def create_post(app):
+    """Create a post through the route (which ranks it); returns its id."""
+
+    def create_post(client, title, description=''):
+        response = client.post('/post/create', data={'title': title, 'description': description,
+                                                     'location': 'Dhaka', 'budget_min': 500, 'budget_max': 1000})
+        assert response.status_code == 302
+        with app.app_context():
+            return db.session.query(db.func.max(ServicePost.id)).scalar()
+
+    return create_post
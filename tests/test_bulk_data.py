@@ -0,0 +1,61 @@
+"""Bulk import reports refused batches without their values and carries provider attributes."""
+import pytest
+
+import bulk_data
+import embeddings
+from models import db, ProviderLocation, ServicePost, User
+
+
+def test_duplicate_rows_are_reported_without_values(app):
+    rows = [{'id': 9001 + i, 'name': f'Bulk {i}', 'email': f'bulk{i}@example.com', 'password': 'secret',
+             'role': 'provider'} for i in range(3)]
+    with app.app_context():
+        assert bulk_data.import_rows('users', rows, batch_size=2, commit_every=1, hash_workers=1) == 3
+        again = [{**row, 'id': row['id'] + 100} for row in rows]
+        with pytest.raises(ValueError) as error:
+            bulk_data.import_rows('users', again, batch_size=2, commit_every=1, hash_workers=1)
+    message = str(error.value)
+    assert message.startswith('users batch 1 (rows 1-2, ids 9101-9102) was not imported:')
+    with app.app_context():
+        stored = [u.password for u in User.query.filter(User.id.between(9001, 9003))]
+    assert stored and not any(h in message for h in stored)
+    assert 'secret' not in message
+
+
+def test_languages_and_service_areas_round_trip(app, make):
+    user_id = make.provider('tiling')
+    with app.app_context():
+        provider_id = db.session.get(User, user_id).provider.id
+        bulk_data.import_rows('languages', [{'provider_id': provider_id, 'name': 'Bangla', 'position': 0},
+                                            {'provider_id': provider_id, 'name': 'English', 'position': 1}])
+        bulk_data.import_rows('service_areas', [{'provider_id': provider_id, 'name': 'Dhaka'}])
+        languages = [r for r in bulk_data.export_rows('languages') if r['provider_id'] == provider_id]
+        areas = [r for r in bulk_data.export_rows('service_areas') if r['provider_id'] == provider_id]
+        provider = db.session.get(User, user_id).provider
+        assert [lang.key for lang in provider.languages] == ['bangla', 'english']
+        kinds = {loc.kind for loc in ProviderLocation.query.filter_by(provider_id=provider_id)}
+    assert [r['name'] for r in languages] == ['Bangla', 'English']
+    assert areas == [{'provider_id': provider_id, 'name': 'Dhaka', 'position': 0}]
+    assert 'area' in kinds
+
+
+@pytest.mark.skipif(not embeddings.available(), reason='needs numpy')
+def test_imported_providers_and_posts_get_vectors(app, make, tmp_path):
+    finder_id = make.finder()
+    index = embeddings.embedding_index
+    with app.app_context():
+        index.configure(str(tmp_path), 32, enabled=True)
+        try:
+            index.ensure_built()  # the vector files of a running site
+            bulk_data.import_rows('users', [{'id': 9501, 'name': 'Imported', 'email': 'imported@example.com',
+                                             'password_hash': 'x', 'role': 'provider'}], hash_workers=1)
+            bulk_data.import_rows('providers', [{'user_id': 9501, 'title': 'Welder', 'location': 'Dhaka'}])
+            bulk_data.import_rows('posts', [{'finder_id': finder_id, 'title': 'Gate welding', 'status': 'open'}])
+            provider_id = db.session.get(User, 9501).provider.id
+            post_id = db.session.query(db.func.max(ServicePost.id)).scalar()
+            assert index.providers.get(provider_id) is not None
+            assert index.posts.get(post_id) is not None
+            assert index.top_provider_ids('welding a gate', 1)[0][1] == provider_id
+        finally:
+            index.configure(app.config['EMBEDDING_DIR'], app.config['EMBEDDING_DIM'],
+                            enabled=app.config['MATCH_SCORER'] == 'embedding')
@@ -0,0 +1,31 @@
+"""The geo filter never drops providers it has not loaded yet."""
+import time
+from types import SimpleNamespace
+
+from sqlalchemy import insert
+
+import geo
+from models import db, Provider, User
+
+
+def test_provider_added_elsewhere_still_matches(app, make):
+    make.provider('plumbing')
+    dhaka = geo.geocode('Dhaka')
+    post = SimpleNamespace(latitude=dhaka.latitude, longitude=dhaka.longitude)
+    with app.app_context():
+        geo.geo_index.configure(30, check_seconds=0.05)
+        try:
+            before = geo.geo_index.providers_for_post(post)
+            # core inserts fire no ORM events, like a commit made by another worker or bulk_data.py
+            user_id = db.session.execute(insert(User.__table__).values(
+                name='Elsewhere', email='elsewhere@example.com', password='x', role='provider')).inserted_primary_key[0]
+            provider_id = db.session.execute(insert(Provider.__table__).values(
+                user_id=user_id, title='Plumber', location='Mars')).inserted_primary_key[0]
+            db.session.commit()
+            assert provider_id not in before
+            time.sleep(0.06)
+            assert provider_id in geo.geo_index.providers_for_post(post)
+            assert geo.geo_index.allows(provider_id, post)
+        finally:
+            geo.geo_index.configure(app.config['GEO_RADIUS_KM'], app.config['GEO_CELL_DEG'],
+                                    app.config['INDEX_CHECK_SECONDS'])
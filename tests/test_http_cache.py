@@ -0,0 +1,57 @@
+"""Profile page validators: conditional GETs, child-row changes and viewers."""
+import provider_attrs
+from models import db, Provider, ProviderSkill
+
+
+def provider_of(user_id):
+    return db.session.query(Provider).filter_by(user_id=user_id).one()
+
+
+def etag_of(client, user_id):
+    response = client.get(f'/user/{user_id}')
+    assert response.status_code == 200
+    assert response.headers['ETag'].startswith('W/')
+    return response.headers['ETag']
+
+
+def test_matching_etag_is_not_modified(app, make):
+    user_id = make.provider('Tiler')
+    client = app.test_client()
+    etag = etag_of(client, user_id)
+    response = client.get(f'/user/{user_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert response.data == b''
+    assert client.get(f'/user/{user_id}', headers={'If-None-Match': 'W/"stale"'}).status_code == 200
+
+
+def test_child_rows_change_the_etag(app, make):
+    user_id = make.provider('Glazier')
+    client = app.test_client()
+    first = etag_of(client, user_id)
+
+    with app.app_context():
+        db.session.add(ProviderSkill(provider_id=provider_of(user_id).id, skill='Framer'))
+        db.session.commit()
+    second = etag_of(client, user_id)
+    assert second != first
+    assert client.get(f'/user/{user_id}', headers={'If-None-Match': first}).status_code == 200
+
+    with app.app_context():
+        # a collection change only, no UPDATE of the providers row itself
+        provider_attrs.set_languages(provider_of(user_id), ['Bangla'])
+        db.session.commit()
+    assert etag_of(client, user_id) != second
+
+
+def test_each_viewer_has_its_own_etag(app, make, client_for):
+    user_id = make.provider('Roofer')
+    anonymous = etag_of(app.test_client(), user_id)
+    one, other = make.finder(), make.finder()
+    as_one = etag_of(client_for(one), user_id)
+    as_other = etag_of(client_for(other), user_id)
+    assert len({anonymous, as_one, as_other}) == 3
+    assert client_for(other).get(f'/user/{user_id}', headers={'If-None-Match': as_one}).status_code == 200
+    response = client_for(one).get(f'/user/{user_id}', headers={'If-None-Match': as_one})
+    assert response.status_code == 304
+    assert 'private' in response.headers['Cache-Control']
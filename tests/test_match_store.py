@@ -0,0 +1,84 @@
+"""Stored matches: capped writes and per-provider incremental recompute."""
+import pytest
+
+import match_store
+from models import db, PostMatch, ProviderSkill, ServicePost, User
+
+
+@pytest.fixture
+def ctx(app):
+    with app.app_context():
+        yield
+
+
+def provider_of(user_id):
+    return db.session.get(User, user_id).provider
+
+
+def stored(post_id):
+    return {m.provider_id: (m.score, m.method) for m in PostMatch.query.filter_by(post_id=post_id)}
+
+
+def test_keyword_matches_keeps_the_best_k(app, make, ctx):
+    providers = [provider_of(make.provider('zither repair')) for _ in range(8)]
+    for rating, provider in enumerate(providers):
+        provider.rating = rating % 4
+    db.session.commit()
+    post = db.session.get(ServicePost, make.post(make.finder(), 'Zither repair', 'my zither'))
+    hits = [(score, p) for score, p in match_store.keyword_matches(post, k=3) if p in providers]
+    assert [p.rating for _, p in hits] == [3, 3, 2]
+    assert [p.id for _, p in hits][:2] == sorted(p.id for p in providers if p.rating == 3)
+
+
+def test_update_provider_skill_adds_and_rescores_rows(app, make, ctx):
+    provider = provider_of(make.provider('painting'))
+    post_id = make.post(make.finder(), 'Ukulele lessons', 'beginner ukulele lessons')
+    post = db.session.get(ServicePost, post_id)
+    match_store.save_post_matches(post_id, match_store.local_matches(post), 'keyword')
+    db.session.commit()
+    # no skill hit: absent, or listed on its boost alone
+    assert stored(post_id).get(provider.id, (0, 'keyword')) == (0, 'keyword')
+
+    skill = ProviderSkill(provider_id=provider.id, skill='ukulele lessons')
+    db.session.add(skill)
+    db.session.commit()
+    match_store.update_provider_skill(provider, skill.skill)
+    db.session.commit()
+    assert stored(post_id)[provider.id] == (2, 'keyword')
+
+    db.session.delete(skill)
+    db.session.commit()
+    db.session.refresh(provider)
+    match_store.update_provider_skill(provider, 'ukulele lessons')
+    db.session.commit()
+    assert stored(post_id)[provider.id] == (0, 'keyword')
+
+
+def test_refresh_provider_rescores_existing_rows(app, make, ctx):
+    provider = provider_of(make.provider('banjo repair'))
+    post_id = make.post(make.finder(), 'Banjo repair', 'broken banjo string')
+    post = db.session.get(ServicePost, post_id)
+    match_store.save_post_matches(post_id, match_store.local_matches(post), 'keyword')
+    db.session.commit()
+    before = stored(post_id)[provider.id][0]
+    provider.verified = True
+    db.session.commit()
+    match_store.refresh_provider(provider)
+    db.session.commit()
+    assert stored(post_id)[provider.id][0] == before + 2
+
+
+def test_rescore_leaves_gemini_posts_alone(app, make, ctx):
+    ranked = provider_of(make.provider('harp tuning'))
+    newcomer = provider_of(make.provider('painting'))
+    post_id = make.post(make.finder(), 'Harp tuning', 'concert harp tuning')
+    match_store.save_post_matches(post_id, [(99, ranked)], 'gemini')
+    db.session.commit()
+
+    ranked.verified = True
+    db.session.add(ProviderSkill(provider_id=newcomer.id, skill='harp tuning'))
+    db.session.commit()
+    match_store.refresh_provider(ranked)
+    match_store.update_provider_skill(newcomer, 'harp tuning')
+    db.session.commit()
+    assert stored(post_id) == {ranked.id: (99, 'gemini')}
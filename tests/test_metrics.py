@@ -0,0 +1,29 @@
+"""/metrics publishes request metrics and the registered caches' counters."""
+import app as servease
+
+
+def test_ranking_cache_counters(app):
+    servease.ranking_cache.get('missing-key')
+    text = app.test_client().get('/metrics').get_data(as_text=True)
+    assert '# TYPE servease_ranking_cache_misses_total counter' in text
+    misses = next(line for line in text.splitlines() if line.startswith('servease_ranking_cache_misses_total '))
+    assert float(misses.split()[1]) >= 1
+    assert 'servease_ranking_cache_entries ' in text
+
+
+def test_user_and_fragment_cache_counters(app):
+    text = app.test_client().get('/metrics').get_data(as_text=True)
+    for name in ('servease_user_cache_hits_total', 'servease_user_cache_shared_hits_total',
+                 'servease_fragment_cache_misses_total', 'servease_fragment_cache_entries'):
+        assert f'\n{name} ' in text
+
+
+def test_metrics_access(app, monkeypatch):
+    client = app.test_client()
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '10.1.2.3'}).status_code == 403
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 's3cret')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer s3cret'},
+                          environ_base={'REMOTE_ADDR': '10.1.2.3'})
+    assert response.status_code == 200
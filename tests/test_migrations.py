@@ -0,0 +1,102 @@
+"""migrate() upgrades a baseline database step by step and stamps a new one."""
+import json
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+import migrations
+from models import db
+
+# the schema before versioned migrations existed (the original models.py)
+BASELINE = [
+    '''CREATE TABLE users (id INTEGER PRIMARY KEY, name VARCHAR(120), email VARCHAR(150) NOT NULL UNIQUE,
+       password VARCHAR(200) NOT NULL, role VARCHAR(20) NOT NULL, profile_image VARCHAR(200),
+       cover_image VARCHAR(200), tagline VARCHAR(200), location VARCHAR(200), email_notifications BOOLEAN,
+       phone VARCHAR(20), website VARCHAR(200), social_links TEXT, created_at DATETIME)''',
+    '''CREATE TABLE providers (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES users(id),
+       title VARCHAR(150), description TEXT, location VARCHAR(200), verified BOOLEAN, rating FLOAT,
+       profile_visible BOOLEAN, business_name VARCHAR(200), business_hours TEXT, experience_years INTEGER,
+       certificates TEXT, service_areas TEXT, languages TEXT, hourly_rate FLOAT, portfolio_images TEXT,
+       created_at DATETIME)''',
+    '''CREATE TABLE finders (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES users(id), bio TEXT,
+       location VARCHAR(200), preferences TEXT, favorite_providers TEXT, company_name VARCHAR(200),
+       company_size VARCHAR(50), industry VARCHAR(100), created_at DATETIME)''',
+    '''CREATE TABLE provider_skills (id INTEGER PRIMARY KEY, provider_id INTEGER NOT NULL REFERENCES providers(id),
+       skill VARCHAR(120) NOT NULL)''',
+    '''CREATE TABLE service_posts (id INTEGER PRIMARY KEY, finder_id INTEGER NOT NULL REFERENCES users(id),
+       title VARCHAR(200), description TEXT, location VARCHAR(200), budget_min INTEGER, budget_max INTEGER,
+       status VARCHAR(20), created_at DATETIME)''',
+]
+
+
+def database(tmp_path):
+    return SimpleNamespace(engine=create_engine(f"sqlite:///{tmp_path / 'db.sqlite'}"), metadata=db.metadata)
+
+
+def versions(conn):
+    return [v for (v,) in conn.execute(text('SELECT version FROM schema_version ORDER BY version'))]
+
+
+def test_baseline_database_is_migrated(tmp_path):
+    target = database(tmp_path)
+    with target.engine.begin() as conn:
+        for ddl in BASELINE:
+            conn.execute(text(ddl))
+        conn.execute(text("INSERT INTO users (id, name, email, password, role, profile_image, created_at) VALUES "
+                          "(1, 'P', 'p@example.com', 'x', 'provider', 'uploads/a.jpg', '2024-01-01 00:00:00'),"
+                          "(2, 'F', 'f@example.com', 'x', 'finder', NULL, '2024-01-01 00:00:00')"))
+        conn.execute(text('INSERT INTO providers (id, user_id, title, languages, service_areas, created_at) '
+                          'VALUES (1, 1, :title, :languages, :areas, :created)'),
+                     {'title': 'Plumber', 'languages': json.dumps(['Bangla', 'English', 'bangla']),
+                      'areas': 'Dhaka, Mirpur', 'created': '2024-01-01 00:00:00'})
+        conn.execute(text("INSERT INTO finders (id, user_id, favorite_providers) VALUES (1, 2, '[1, 99]')"))
+        conn.execute(text("INSERT INTO service_posts (finder_id, title, status) VALUES (2, 'Leak', 'open')"))
+
+    assert migrations.migrate(target) == list(range(1, migrations.LATEST + 1))
+
+    with target.engine.connect() as conn:
+        assert versions(conn) == list(range(1, migrations.LATEST + 1))
+        schema = inspect(conn)
+        assert {'latitude', 'longitude'} <= {c['name'] for c in schema.get_columns('service_posts')}
+        assert 'updated_at' in {c['name'] for c in schema.get_columns('providers')}
+        assert 'ix_service_posts_finder_created' in {i['name'] for i in schema.get_indexes('service_posts')}
+        assert schema.has_table('rank_runs') and schema.has_table('image_variants')
+        assert conn.execute(text('SELECT name, key FROM provider_languages ORDER BY position')).all() == [
+            ('Bangla', 'bangla'), ('English', 'english')]
+        assert [n for (n,) in conn.execute(text('SELECT name FROM provider_service_areas ORDER BY position'))] == [
+            'Dhaka', 'Mirpur']
+        assert conn.execute(text('SELECT finder_id, provider_id FROM finder_favorites')).all() == [(1, 1)]
+        assert conn.execute(text("SELECT refcount FROM stored_blobs WHERE key = 'uploads/a.jpg'")).scalar() == 1
+        assert conn.execute(text('SELECT updated_at FROM providers')).scalar() is not None
+    assert migrations.migrate(target) == []
+
+
+@pytest.mark.parametrize('partial', [3, 9])
+def test_partially_migrated_database_resumes(tmp_path, partial):
+    target = database(tmp_path)
+    with target.engine.begin() as conn:
+        for ddl in BASELINE:
+            conn.execute(text(ddl))
+    done = migrations.MIGRATIONS
+    migrations.MIGRATIONS = done[:partial]
+    try:
+        assert migrations.migrate(target) == list(range(1, partial + 1))
+    finally:
+        migrations.MIGRATIONS = done
+    assert migrations.migrate(target) == list(range(partial + 1, migrations.LATEST + 1))
+
+
+def test_new_database_is_stamped_not_migrated(tmp_path, monkeypatch):
+    target = database(tmp_path)
+    ran = []
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [
+        (number, description, lambda conn, metadata, number=number, upgrade=upgrade: (ran.append(number),
+                                                                                     upgrade(conn, metadata)))
+        for number, description, upgrade in migrations.MIGRATIONS])
+    assert migrations.migrate(target) == []
+    assert ran == sorted(migrations.CREATE_ALSO)
+    with target.engine.connect() as conn:
+        assert versions(conn) == list(range(1, migrations.LATEST + 1))
+        assert inspect(conn).has_table('post_matches')
+    assert migrations.migrate(target) == []
@@ -0,0 +1,102 @@
+"""ModelClient against the fake model: breaker, deadlines, load shedding, coalescing, HTTP."""
+import threading
+import time
+import urllib.error
+
+import pytest
+
+from fake_model import FakeModel, FakeModelServer
+from model_client import (CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen, HttpModel, ModelBusy,
+                          ModelClient, ModelTimeout)
+
+PROMPT = 'Fix a leaking pipe\nID 1: painter\nID 2: pipe fitter\n'
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_probes_and_closes():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+    breaker.before_call()
+    assert not breaker.record_failure()
+    assert breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+    clock.now = 30
+    breaker.before_call()  # the single probe
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    assert breaker.record_failure()  # a failed probe opens it again
+    assert breaker.state == OPEN
+
+    clock.now = 60
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_client_fails_fast_while_open():
+    model = FakeModel(fail_rate=1.0)
+    client = ModelClient(model, timeout=1, retries=0, failure_threshold=2, reset_timeout=60)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            client.generate_content(PROMPT)
+    with pytest.raises(CircuitOpen):
+        client.generate_content(PROMPT)
+    assert model.calls == 2
+
+
+def test_deadline():
+    client = ModelClient(FakeModel(latency_ms=500), timeout=0.05, retries=0)
+    started = time.monotonic()
+    with pytest.raises(ModelTimeout):
+        client.generate_content(PROMPT)
+    assert time.monotonic() - started < 0.3
+    assert client.stats()['timeouts'] == 1
+
+
+def test_busy_is_shed_without_waiting_for_the_deadline():
+    client = ModelClient(FakeModel(latency_ms=500), timeout=5, max_in_flight=1, slot_wait=0.02)
+    slow = threading.Thread(target=client.generate_content, args=(PROMPT,))
+    slow.start()
+    time.sleep(0.05)
+    started = time.monotonic()
+    with pytest.raises(ModelBusy):
+        client.generate_content(PROMPT + 'another post')
+    assert time.monotonic() - started < 0.3
+    assert client.breaker.state == CLOSED  # our own limit is not a model failure
+    slow.join()
+
+
+def test_identical_calls_share_one_model_call():
+    model = FakeModel(latency_ms=100)
+    client = ModelClient(model, timeout=2)
+    answers = []
+    threads = [threading.Thread(target=lambda: answers.append(client.generate_content(PROMPT, key='k').text))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert answers == ['2,1'] * 5
+    assert model.calls == 1 and client.coalesced == 4
+
+
+def test_http_model_against_the_fake_server():
+    with FakeModelServer() as server:
+        assert HttpModel(server.base_url, timeout=2).generate_content(PROMPT).text == '2,1'
+    with FakeModelServer(FakeModel(fail_rate=1.0)) as server:
+        client = ModelClient(HttpModel(server.base_url, timeout=2), timeout=2, retries=0, failure_threshold=1)
+        with pytest.raises(urllib.error.HTTPError):
+            client.generate_content(PROMPT)
+        assert client.breaker.state == OPEN
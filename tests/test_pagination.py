@@ -0,0 +1,55 @@
+"""Keyset pages of a provider's best matches: ties, bad cursors, no duplicates or gaps."""
+import pytest
+
+import match_store
+from models import db, PostMatch, User
+
+
+@pytest.fixture
+def paged(app, make, client_for):
+    """A provider with 7 stored matches, in three score groups; returns (client, ids best first)."""
+    user_id = make.provider('lute repair')
+    finder_id = make.finder()
+    scores = {make.post(finder_id, 'Lute job'): score for score in (5, 5, 5, 3, 3, 3, 1)}
+    with app.app_context():
+        provider_id = db.session.get(User, user_id).provider.id
+        PostMatch.query.filter_by(provider_id=provider_id).delete()
+        db.session.add_all(PostMatch(post_id=post_id, provider_id=provider_id, score=score, method='keyword')
+                           for post_id, score in scores.items())
+        db.session.commit()
+    expected = sorted(scores, key=lambda pid: (-scores[pid], -pid))
+    return client_for(user_id), expected
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 7, 50])
+def test_pages_cover_everything_once(paged, limit):
+    client, expected = paged
+    seen, cursor = [], None
+    while True:
+        url = f'/provider/best-matches.json?limit={limit}' + (f'&after={cursor}' if cursor else '')
+        data = client.get(url).get_json()
+        assert len(data['matches']) <= limit
+        seen += [m['post_id'] for m in data['matches']]
+        cursor = data['next']
+        if cursor is None:
+            break
+    assert seen == expected
+
+
+def test_cursor_round_trip():
+    assert match_store.parse_cursor(match_store.page_cursor(2.5, 17)) == (2.5, 17)
+    assert match_store.parse_cursor(match_store.page_cursor(0.1 + 0.2, 3)) == (0.1 + 0.2, 3)
+
+
+@pytest.mark.parametrize('cursor', ['garbage', '5.0', '5.0:', ':3', '5.0:abc', 'nan:3', 'inf:3', '1:2:x'])
+def test_bad_cursor_is_rejected(paged, cursor):
+    client, _ = paged
+    response = client.get(f'/provider/best-matches.json?after={cursor}')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid cursor.'}
+
+
+def test_cursor_past_the_end(paged):
+    client, _ = paged
+    data = client.get('/provider/best-matches.json?after=0.5:1').get_json()
+    assert data == {'matches': [], 'next': None}
@@ -0,0 +1,113 @@
+"""In-memory provider indexes pick up changes committed by other processes."""
+import time
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import insert
+
+import bm25_index
+import embeddings
+from models import db, ProviderSkill, ServicePost, User
+from skill_index import skill_index
+
+
+def _added_elsewhere(provider_id, skill):
+    # a core insert fires no ORM events, like a commit made by another worker
+    db.session.execute(insert(ProviderSkill.__table__).values(provider_id=provider_id, skill=skill))
+    db.session.commit()
+
+
+def test_skill_index_notices_other_workers(app, make):
+    user_id = make.provider('gardening')
+    with app.app_context():
+        provider_id = db.session.get(User, user_id).provider.id
+        skill_index.configure(0.05)
+        try:
+            skill_index.build()
+            assert provider_id not in skill_index.candidates('need a beekeeping expert')
+            _added_elsewhere(provider_id, 'beekeeping')
+            assert provider_id not in skill_index.candidates('need a beekeeping expert')
+            time.sleep(0.06)
+            assert provider_id in skill_index.candidates('need a beekeeping expert')
+        finally:
+            skill_index.configure(app.config['INDEX_CHECK_SECONDS'])
+
+
+@pytest.mark.skipif(not bm25_index.available(), reason='needs numpy and scipy')
+def test_bm25_index_notices_other_workers(app, make):
+    user_id = make.provider('gardening')
+    post = SimpleNamespace(title='Apiary', description='hives need apiary care')
+    index = bm25_index.Bm25Index()
+    with app.app_context():
+        provider_id = db.session.get(User, user_id).provider.id
+        index.configure(0.05)
+        index.build()
+
+        def score():
+            return {pid: s for s, pid in index.top_provider_ids(post, 100)}.get(provider_id)
+
+        assert score() == 0
+        _added_elsewhere(provider_id, 'apiary care')
+        time.sleep(0.06)
+        assert score() > 0
+
+
+@pytest.mark.skipif(not embeddings.available(), reason='needs numpy')
+def test_vector_files_are_shared_between_workers(tmp_path):
+    # two stores on the same files stand in for two worker processes
+    mine, theirs = (embeddings.VectorStore(str(tmp_path), 'providers', 8) for _ in range(2))
+    mine.reset([])
+    theirs.get(1)
+    mine.put(1, embeddings.embed('roof repair', 8))
+    assert theirs.search(embeddings.embed('roof repair', 8), 1)[0][1] == 1
+    mine.delete(1)
+    assert theirs.get(1) is None
+    assert theirs.similarities(embeddings.embed('roof repair', 8), [1]) == [0.0]
+
+
+@pytest.mark.skipif(not embeddings.available(), reason='needs numpy')
+def test_vector_append_rechecks_under_the_file_lock(tmp_path, monkeypatch):
+    mine, theirs = (embeddings.VectorStore(str(tmp_path), 'providers', 8) for _ in range(2))
+    mine.reset([])
+    mine.get(1)
+    theirs.put(1, embeddings.embed('roof repair', 8))
+    # `mine` misses the id on its first look, as if the other append landed just after it
+    remap = mine._map
+    calls = []
+    monkeypatch.setattr(mine, '_map', lambda: calls.append(1) if len(calls) == 0 else remap())
+    mine.put(1, embeddings.embed('gutter cleaning', 8))
+    assert [pid for _, pid in theirs.search(embeddings.embed('gutter cleaning', 8), 5)] == [1]
+
+
+@pytest.mark.skipif(not embeddings.available(), reason='needs numpy')
+def test_closed_and_deleted_posts_leave_the_vector_store(app, make, client_for, tmp_path):
+    index = embeddings.embedding_index
+    finder_id = make.finder()
+    post_id = make.post(finder_id, 'Fix my fence', 'wooden fence repair')
+    other_id = make.post(finder_id, 'Paint my fence', 'fence painting')
+    with app.app_context():
+        index.configure(str(tmp_path), 32, enabled=True)
+        try:
+            index.ensure_built()
+            assert index.posts.get(post_id) is not None
+            db.session.get(ServicePost, post_id).status = 'closed'
+            db.session.commit()
+            assert index.posts.get(post_id) is None
+            assert index.posts.get(other_id) is not None
+            client_for(finder_id).post('/delete-account')
+            assert index.posts.get(other_id) is None
+        finally:
+            index.configure(app.config['EMBEDDING_DIR'], app.config['EMBEDDING_DIM'],
+                            enabled=app.config['MATCH_SCORER'] == 'embedding')
+
+
+@pytest.mark.skipif(not bm25_index.available(), reason='needs numpy and scipy')
+def test_bm25_query_matrix_matches_dense_vectors():
+    index = bm25_index.Bm25Index()
+    index.build_from_rows([{'id': 1, 'title': 'Plumber', 'description': 'pipes and taps', 'skills': ['plumbing'],
+                            'rating': 0, 'verified': False}])
+    texts = ['leaking pipes', 'plumbing for taps taps', 'nothing known', '']
+    matrix = index.query_matrix(texts)
+    assert matrix.shape == (4, len(index.vocab))
+    for i, text in enumerate(texts):
+        assert (matrix.getrow(i).toarray().ravel() == index.query_vector(text)).all()
@@ -0,0 +1,41 @@
+"""The match pages cost a fixed number of queries, however many rows they show."""
+from query_count import assert_max_queries
+
+# current user, post, stored matches (providers with their users), skills, languages
+VIEW_MATCHES_QUERIES = 5
+# current user, provider row, stored-matches check, one page of matches with their finders
+BEST_MATCHES_QUERIES = 4
+
+
+def test_view_matches_query_count(app, make, client_for, create_post):
+    for _ in range(2):
+        make.provider('plumbing')
+    finder = client_for(make.finder())
+    few = create_post(finder, 'Need plumbing', 'kitchen pipe leak')
+    for _ in range(15):
+        make.provider('plumbing', 'pipe repair')
+    many = create_post(finder, 'Need plumbing again', 'bathroom pipe leak')
+
+    counts = []
+    for post_id in (few, many):
+        with app.app_context(), assert_max_queries(VIEW_MATCHES_QUERIES) as counter:
+            assert finder.get(f'/post/{post_id}/matches').status_code == 200
+        counts.append(counter.count)
+    assert counts[0] == counts[1]
+
+
+def test_provider_best_matches_query_count(app, make, client_for, create_post):
+    provider = client_for(make.provider('house painting'))
+    finder = client_for(make.finder())
+    create_post(finder, 'Paint two rooms', 'house painting needed')
+    # the first visit scores recent posts for a provider without stored matches
+    assert provider.get('/provider/best-matches').status_code == 200
+
+    counts = []
+    for extra in (0, 15):
+        for i in range(extra):
+            create_post(finder, f'House painting job {i}', 'house painting')
+        with app.app_context(), assert_max_queries(BEST_MATCHES_QUERIES) as counter:
+            assert provider.get('/provider/best-matches').status_code == 200
+        counts.append(counter.count)
+    assert counts[0] == counts[1]
@@ -0,0 +1,30 @@
+"""Incremental batch runs store what a full run would."""
+import rank_matches
+from models import db, PostMatch, User
+
+
+def stored(post_id):
+    return {(m.provider_id, m.score) for m in PostMatch.query.filter_by(post_id=post_id)}
+
+
+def test_incremental_run_trims_touched_posts(app, make):
+    finder_id = make.finder()
+    for _ in range(3):
+        make.provider('kiln repair')
+    post_id = make.post(finder_id, 'Kiln repair', 'pottery kiln repair')
+    # newer posts fill every provider's own top 2, so the first post keeps rows only as its own top 2
+    for _ in range(2):
+        make.post(finder_id, 'Kiln repair again', 'kiln repair')
+    with app.app_context():
+        rank_matches.run(full=True, workers=1, k=2)
+        assert len(stored(post_id)) == 2
+        for _ in range(2):
+            provider = db.session.get(User, make.provider('kiln repair')).provider
+            provider.rating = 5
+        db.session.commit()
+
+        rank_matches.run(workers=1, k=2)
+        incremental = stored(post_id)
+        rank_matches.run(full=True, workers=1, k=2)
+        assert incremental == stored(post_id)
+        assert len(incremental) == 2 and {score for _, score in incremental} == {7.0}
@@ -0,0 +1,51 @@
+"""Gemini re-ranks run in the background and the worker forgets finished jobs."""
+import threading
+
+import app as servease
+from fake_model import FakeModel
+from model_client import ModelClient
+from rank_worker import RankWorker, PENDING, DONE, FAILED
+import match_store
+
+
+def test_status_and_dedup():
+    worker = RankWorker(1)
+    release = threading.Event()
+    assert worker.submit('a', release.wait)
+    assert not worker.submit('a', release.wait)
+    assert worker.status('a') == PENDING
+    worker.submit('b', lambda: 1 / 0)
+    release.set()
+    worker.shutdown()
+    assert worker.status('a') == DONE
+    assert worker.status('b') == FAILED
+    worker.forget('a')
+    assert worker.status('a') is None
+
+
+def test_finished_statuses_are_bounded():
+    worker = RankWorker(0, max_finished=3)
+    for key in range(10):
+        worker.submit(key, lambda: None)
+    assert [worker.status(key) for key in range(10)] == [None] * 7 + [DONE] * 3
+
+
+def test_background_rerank(app, make, client_for, create_post, monkeypatch):
+    worker = RankWorker(1)
+    model = FakeModel()
+    monkeypatch.setattr(servease, 'rank_worker', worker)
+    monkeypatch.setattr(servease, 'gemini_model', ModelClient(model))
+    monkeypatch.setitem(app.config, 'MATCHING_ASYNC', True)
+    for _ in range(3):
+        make.provider('roof repair')
+    finder = client_for(make.finder())
+    post_id = create_post(finder, 'Roof repair', 'leaking roof repair')
+    worker.shutdown()
+
+    assert model.calls == 1
+    assert worker.status(post_id) == DONE
+    with app.app_context():
+        assert match_store.post_match_method(post_id) == 'gemini'
+    data = finder.get(f'/post/{post_id}/matches.json').get_json()
+    assert data['status'] == 'ready' and data['matches']
+    assert worker.status(post_id) is None
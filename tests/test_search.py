@@ -0,0 +1,84 @@
+"""Full-text search: ranking, query quoting and the LIKE fallback."""
+import logging
+
+import pytest
+
+import search
+from models import db, Provider, ServicePost
+
+
+def provider_with(make, app, skill, description=None, visible=True):
+    user_id = make.provider(skill)
+    with app.app_context():
+        provider = db.session.query(Provider).filter_by(user_id=user_id).one()
+        if description is not None:
+            provider.description = description
+        provider.profile_visible = visible
+        db.session.commit()
+        return provider.id
+
+
+def ids(results):
+    return [obj.id for obj, _, _ in results]
+
+
+def test_match_expression_quotes_user_input():
+    assert search.match_expression('say "hi" OR *fix* NEAR(a b)') == '"say"* "hi"* "or"* "fix"* "near"* "a"* "b"*'
+    assert search.match_expression('"') == ''
+    assert len(search.terms(' '.join(f'w{i}' for i in range(20)))) == search.MAX_TERMS
+
+
+@pytest.mark.parametrize('q', ['"quillsmith', 'quillsmith OR', '*', 'quillsmith AND NOT', 'col:quillsmith'])
+def test_query_syntax_is_not_interpreted(app, q):
+    with app.test_request_context('/'):
+        search.search_providers(q)
+        search.search_posts(q)
+
+
+def test_providers_ranked_by_field(app, make):
+    in_description = provider_with(make, app, 'Carpenter', description='Also does quillsmith work')
+    in_skills = provider_with(make, app, 'Quillsmith')
+    hidden = provider_with(make, app, 'Quillsmith', visible=False)
+    with app.test_request_context('/'):
+        assert search.fts_enabled()
+        results, has_more = search.search_providers('quillsmi')
+        assert ids(results) == [in_skills, in_description]
+        assert hidden not in ids(results) and not has_more
+        assert '<mark>' in str(results[0][2])
+        page, has_more = search.search_providers('quillsmith', per_page=1)
+        assert ids(page) == [in_skills] and has_more
+
+
+def test_posts_ranked_by_field(app, make):
+    finder = make.finder()
+    in_description = make.post(finder, 'Garden help', 'Needs a quokkapaint touch-up')
+    in_title = make.post(finder, 'Quokkapaint the fence', 'Two coats')
+    closed = make.post(finder, 'Quokkapaint the shed')
+    with app.app_context():
+        db.session.get(ServicePost, closed).status = 'closed'
+        db.session.commit()
+    with app.test_request_context('/'):
+        results, _ = search.search_posts('QUOKKAPAINT')
+        assert ids(results) == [in_title, in_description]
+
+
+def test_like_fallback(app, make, monkeypatch):
+    older = provider_with(make, app, 'Tinsmithery')
+    newer = provider_with(make, app, 'Plumber', description='tinsmithery on request')
+    finder = make.finder()
+    post = make.post(finder, 'Tinsmithery repair')
+    monkeypatch.setattr(search, 'fts_enabled', lambda: False)
+    with app.test_request_context('/'):
+        results, _ = search.search_providers('tinsmith')
+        assert ids(results) == [newer, older]
+        assert {rank for _, rank, _ in results} == {0.0}
+        assert ids(search.search_posts('TINSMITHERY')[0]) == [post]
+        assert search.search_posts('tinsmithery nomatchword')[0] == []
+
+
+def test_install_without_fts5_logs(app, monkeypatch, caplog):
+    monkeypatch.setattr(search, 'fts_supported', lambda conn: False)
+    with app.app_context(), db.engine.connect() as conn, caplog.at_level(logging.WARNING, 'servease.search'):
+        search.install(conn)
+    assert [r.name for r in caplog.records] == ['servease.search']
+    assert 'LIKE' in caplog.records[0].getMessage()
@@ -0,0 +1,74 @@
+"""collect_garbage never deletes a blob file whose row appears while it runs."""
+import os
+import time
+
+import pytest
+from sqlalchemy import create_engine, insert
+from sqlalchemy.exc import OperationalError
+
+import storage
+from models import db
+
+GRACE = 60
+
+
+@pytest.fixture
+def backend(app, tmp_path, monkeypatch):
+    backend = storage.LocalBackend(str(tmp_path))
+    monkeypatch.setattr(storage.upload_store, 'backend', backend)
+    return backend
+
+
+def stale_file(backend, digest):
+    key = storage.blob_key(digest, 'photo.jpg')
+    path = backend._path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as out:
+        out.write(b'jpeg')
+    old = time.time() - 2 * GRACE
+    os.utime(path, (old, old))
+    return key
+
+
+def add_row(app, key):
+    engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
+    with engine.begin() as conn:
+        conn.execute(insert(storage.blobs).values(key=key, refcount=1))
+    engine.dispose()
+
+
+def test_file_only_orphans_are_deleted(app, backend):
+    orphan, kept = stale_file(backend, 'a1' * 32), stale_file(backend, 'a2' * 32)
+    add_row(app, kept)
+    with app.app_context():
+        storage.collect_garbage(GRACE)
+    assert not backend.exists(orphan)
+    assert backend.exists(kept)
+
+
+def test_row_inserted_after_listing_keeps_the_file(app, backend, monkeypatch):
+    key = stale_file(backend, 'b1' * 32)
+    listing = backend.list
+
+    def list_then_upload(prefix):
+        found = list(listing(prefix))
+        add_row(app, key)  # an upload of the same bytes commits its row
+        return found
+
+    monkeypatch.setattr(backend, 'list', list_then_upload)
+    with app.app_context():
+        storage.collect_garbage(GRACE)
+    assert backend.exists(key)
+
+
+def test_lock_blocks_blob_inserts(app):
+    other = create_engine(app.config['SQLALCHEMY_DATABASE_URI'], connect_args={'timeout': 0.1})
+    try:
+        with app.app_context():
+            storage._lock_blobs(db.session)
+            with pytest.raises(OperationalError, match='locked'):
+                with other.begin() as conn:
+                    conn.execute(insert(storage.blobs).values(key='uploads/blobs/c1/c1', refcount=0))
+            db.session.rollback()
+    finally:
+        other.dispose()
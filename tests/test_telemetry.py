@@ -0,0 +1,34 @@
+"""db spans are closed exactly once, and only by the statement that opened them."""
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import telemetry
+from models import db
+
+
+def test_failed_statement_closes_its_db_span(app):
+    with app.test_request_context('/'):
+        telemetry.start_request()
+        timer = telemetry.current_timer()
+        with telemetry.span('scoring'):
+            with pytest.raises(OperationalError):
+                db.session.execute(text('SELECT * FROM no_such_table'))
+            assert [name for name, _ in timer._stack] == ['scoring']
+            db.session.execute(text('SELECT 1'))
+            assert [name for name, _ in timer._stack] == ['scoring']
+        db.session.rollback()
+        assert timer._stack == []
+        assert timer.counts['db'] == 2
+
+
+def test_error_without_execution_leaves_spans_open(app):
+    with app.test_request_context('/'):
+        telemetry.start_request()
+        timer = telemetry.current_timer()
+        with telemetry.span('render'):
+            telemetry._execute_failed(SimpleNamespace(execution_context=None))
+            assert [name for name, _ in timer._stack] == ['render']
+        assert timer._stack == []
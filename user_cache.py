@@ -0,0 +1,292 @@
+"""Read-through cache for the logged-in user.
+
+Flask-Login calls load_user on every authenticated request, and most pages
+then touch current_user.provider (and its skills) or current_user.finder.
+UserCache keeps a snapshot of those rows (column values only, JSON-safe)
+and rebuilds them into the request's session without a query:
+
+* the session is request-scoped, so its identity map is checked first and
+  repeated lookups within a request reuse the same objects;
+* otherwise the snapshot comes from the in-process TTL + LRU tier, then
+  from the optional shared tier ('sqlite' file or 'redis'), and only then
+  from the database (two queries);
+* rebuilt objects are ordinary persistent instances, so views can edit and
+  commit them as before.
+
+Commits that touch a user, their provider/finder row or the provider's
+skills drop the user's snapshot from this worker and the shared tier.
+Other workers' in-process copies live at most `local_ttl` seconds
+(LOCAL_TTL by default), with or without a shared tier. Password hashes
+are never cached; they load from the database when a view reads them.
+"""
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import DateTime, event, inspect, select
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+
+from llm_cache import MemoryBackend, SQLiteBackend
+from models import Finder, Provider, ProviderSkill, User
+
+try:
+    import redis
+except ImportError:  # optional: only needed for USER_CACHE_BACKEND=redis
+    redis = None
+
+LOCAL_TTL = 5
+# columns left out of snapshots; they load on first access
+UNCACHED = {'users': {'password'}}
+
+log = logging.getLogger('servease.user_cache')
+
+
+def available():
+    return redis is not None
+
+
+class RedisBackend:
+    """llm_cache backend interface on Redis, shared by every worker and host."""
+
+    def __init__(self, url, prefix='servease:user:'):
+        if redis is None:
+            raise RuntimeError('redis is not installed')
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key, now):
+        raw = self._client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, expires_at, tags):
+        self._client.set(self.prefix + key, json.dumps(value), ex=max(1, int(expires_at - time.time())))
+        return 0
+
+    def delete(self, key):
+        self._client.delete(self.prefix + key)
+
+    def invalidate(self, tag):
+        return 0
+
+    def clear(self):
+        keys = list(self._client.scan_iter(self.prefix + '*'))
+        if keys:
+            self._client.delete(*keys)
+
+    def __len__(self):
+        return sum(1 for _ in self._client.scan_iter(self.prefix + '*'))
+
+
+# ---- snapshots ----
+def _dump(obj):
+    values = {}
+    skip = UNCACHED.get(obj.__tablename__, ())
+    for attr in inspect(type(obj)).column_attrs:
+        if attr.key in skip:
+            continue
+        value = getattr(obj, attr.key)
+        values[attr.key] = value.isoformat() if isinstance(value, datetime) else value
+    return values
+
+
+def _build(session, cls, values):
+    """Persistent `cls` instance for `values`, reusing the one already in the session."""
+    existing = session.identity_map.get(identity_key(cls, values['id']))
+    if existing is not None:
+        return existing, False
+    mapper = inspect(cls)
+    kwargs = {}
+    for attr in mapper.column_attrs:
+        if attr.key not in values:
+            continue  # uncached: left unloaded, so it loads on access
+        value = values[attr.key]
+        if value is not None and isinstance(attr.columns[0].type, DateTime):
+            value = datetime.fromisoformat(value)
+        kwargs[attr.key] = value
+    obj = cls(**kwargs)
+    make_transient_to_detached(obj)
+    session.add(obj)
+    return obj, True
+
+
+def snapshot(user):
+    """JSON-safe copy of `user` with its provider (and skills) or finder."""
+    provider, finder = user.provider, user.finder
+    return {
+        'user': _dump(user),
+        'provider': _dump(provider) if provider is not None else None,
+        'skills': [_dump(s) for s in provider.skills] if provider is not None else [],
+        'finder': _dump(finder) if finder is not None else None,
+    }
+
+
+def restore(session, data):
+    """Rebuild a snapshot into `session`; relationships are set so they do not lazy-load."""
+    user, fresh = _build(session, User, data['user'])
+    if not fresh:
+        return user
+    provider = finder = None
+    if data['provider'] is not None:
+        provider, provider_fresh = _build(session, Provider, data['provider'])
+        if provider_fresh:
+            skills = [_build(session, ProviderSkill, s)[0] for s in data['skills']]
+            set_committed_value(provider, 'skills', skills)
+    if data['finder'] is not None:
+        finder, _ = _build(session, Finder, data['finder'])
+    set_committed_value(user, 'provider', provider)
+    set_committed_value(user, 'finder', finder)
+    return user
+
+
+class UserCache:
+    """TTL + LRU cache of user snapshots with an optional shared tier."""
+
+    def __init__(self, ttl=300, max_entries=1000, shared=None, local_ttl=LOCAL_TTL):
+        self._lock = threading.Lock()
+        self.configure(ttl, max_entries, shared, local_ttl)
+
+    def configure(self, ttl=300, max_entries=1000, shared=None, local_ttl=LOCAL_TTL):
+        """
+        Set the TTLs, local size and shared tier; drops what is cached. A TTL
+        of 0 turns caching off. `local_ttl` caps the in-process tier, which
+        other workers' commits cannot invalidate.
+        """
+        with self._lock:
+            self.ttl = ttl
+            self.local_ttl = min(ttl, local_ttl)
+            self.local = MemoryBackend(max_entries)
+            self.shared = shared
+            self.hits = 0
+            self.shared_hits = 0
+            self.misses = 0
+            self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def _get(self, key):
+        now = time.time()
+        with self._lock:
+            data = self.local.get(key, now)
+            if data is not None:
+                self.hits += 1
+                return data
+        if self.shared is not None:
+            try:
+                data = self.shared.get(key, now)
+            except Exception as e:
+                log.warning('User cache backend error: %s', e)
+                data = None
+            if data is not None:
+                with self._lock:
+                    self.shared_hits += 1
+                    self.local.set(key, data, now + self.local_ttl, ())
+                return data
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _set(self, key, data):
+        now = time.time()
+        with self._lock:
+            self.local.set(key, data, now + self.local_ttl, ())
+        if self.shared is not None:
+            try:
+                self.shared.set(key, data, now + self.ttl, ())
+            except Exception as e:
+                log.warning('User cache backend error: %s', e)
+
+    def load(self, session, user_id):
+        """The user with `user_id` in `session` (None if there is no such user)."""
+        if not self.enabled:
+            return session.get(User, user_id)
+        user = session.identity_map.get(identity_key(User, user_id))
+        if user is not None:
+            return user
+        key = str(user_id)
+        data = self._get(key)
+        if data is not None:
+            return restore(session, data)
+        user = session.execute(
+            select(User).where(User.id == user_id)
+            .options(joinedload(User.provider).selectinload(Provider.skills), joinedload(User.finder))
+        ).unique().scalar_one_or_none()
+        if user is not None:
+            self._set(key, snapshot(user))
+        return user
+
+    def invalidate(self, user_id):
+        key = str(user_id)
+        with self._lock:
+            self.local.delete(key)
+            self.invalidations += 1
+        if self.shared is not None:
+            try:
+                self.shared.delete(key)
+            except Exception as e:
+                log.warning('User cache backend error: %s', e)
+
+    def clear(self):
+        with self._lock:
+            self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.shared_hits + self.misses
+            return {
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': ((self.hits + self.shared_hits) / total) if total else 0.0,
+                'invalidations': self.invalidations,
+                'entries': len(self.local),
+            }
+
+
+def shared_backend(backend, url=None, max_entries=10000):
+    """The shared tier for a USER_CACHE_BACKEND value: None for 'memory', else a 'sqlite' file or 'redis'."""
+    if backend == 'sqlite':
+        return SQLiteBackend(url or 'instance/user_cache.db', max_entries)
+    if backend == 'redis':
+        return RedisBackend(url or 'redis://localhost:6379/0')
+    return None
+
+
+user_cache = UserCache()
+
+
+# ---- invalidation on commit ----
+@event.listens_for(Session, 'after_flush')
+def _collect_user_changes(session, flush_context):
+    changed = session.info.setdefault('user_cache_users', set())
+    provider_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            changed.add(obj.id)
+        elif isinstance(obj, (Provider, Finder)):
+            changed.add(obj.user_id)
+        elif isinstance(obj, ProviderSkill):
+            provider_ids.add(obj.provider_id)
+    if provider_ids:
+        # plain connection query: no autoflush while the flush is finishing
+        changed.update(session.connection().execute(
+            select(Provider.user_id).where(Provider.id.in_(provider_ids))).scalars())
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_user_changes(session):
+    for user_id in session.info.pop('user_cache_users', ()):
+        if user_id is not None:
+            user_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_user_changes(session, previous_transaction):
+    session.info.pop('user_cache_users', None)